@@ -10,6 +10,7 @@ performed using lxml.
 """
 
 import os
+import time
 
 from logging import getLogger
 
@@ -50,4 +51,54 @@ JPTS22_PATH = get_data_path('dtds/jpts22/journalpublishing.dtd')
 JPTS23_PATH = get_data_path('dtds/jpts23/journalpublishing.dtd')
 JPTS30_PATH = get_data_path('dtds/jpts30/journalpublishing3.dtd')
 
+
+def preload(dtds=True, publishers=True):
+    """
+    Loads ahead of time what the conversion of the first article would load:
+    the modules of the conversion, the parsed DTDs, and the publisher modules.
+
+    A command which converts articles in worker processes calls this before
+    starting them, so that workers forked from it inherit everything ready for
+    use (copy-on-write) instead of each loading it for its first article.
+    Anything already loaded is not loaded again, so calling this again costs
+    next to nothing.
+
+    Parameters
+    ----------
+    dtds : bool or iterable of str, optional
+        True for every supported DTD, or the Doctype PUBLIC of each DTD to
+        parse
+    publishers : bool or iterable of str, optional
+        True for every mapped publisher, or the DOI prefix of each publisher to
+        load
+
+    Returns
+    -------
+    float
+        The number of seconds taken
+    """
+    start = time.perf_counter()
+    #Imported here, as these modules import this package
+    import openaccess_epub.article as article
+    import openaccess_epub.navigation
+    import openaccess_epub.package
+    import openaccess_epub.publisher as publisher
+    import openaccess_epub.utils.epub
+    import openaccess_epub.utils.images
+
+    if dtds:
+        for public_id in (article.dtds if dtds is True else dtds):
+            article.load_dtd(public_id)
+    if publishers:
+        registry = publisher.publishers
+        for prefix in (registry.index() if publishers is True else publishers):
+            try:
+                registry.module(prefix)
+            except ImportError as err:
+                log.warning('Unable to preload the publisher for {0}: \
+{1}'.format(prefix, err))
+    duration = time.perf_counter() - start
+    log.debug('Preloaded in {0:.3f} seconds'.format(duration))
+    return duration
+
 from ._version import __version__
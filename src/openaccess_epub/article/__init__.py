@@ -8,6 +8,10 @@ instantiated per article XML file. Basic article structural elements are
 collected and metadata is parsed according to DTD rules into a python data
 structure. The Article class forms a basic unit in the procedure of analyzing
 articles and in the conversion to EPUB.
+
+For very large XML files, the :class:`ArticleStream` class reads only the
+front matter of an article, so that its metadata is available without reading
+the body.
 """
 
 #Standard Library modules
@@ -16,7 +20,7 @@ from keyword import iskeyword
 import logging
 import os
 import shutil
-import sys
+import threading
 
 #Non-Standard Library modules
 from lxml import etree
@@ -24,6 +28,8 @@ from lxml import etree
 #OpenAccess_EPUB modules
 from openaccess_epub import JPTS10_PATH, JPTS11_PATH, JPTS20_PATH,\
     JPTS21_PATH, JPTS22_PATH, JPTS23_PATH, JPTS30_PATH
+from openaccess_epub.exceptions import ArticleParseError,\
+    ArticleValidationError, UnknownDTDError
 from openaccess_epub.utils import element_methods, publisher_plugin_location
 import openaccess_epub.publisher
 
@@ -46,6 +52,25 @@ dtds = {'-//NLM//DTD Journal Archiving and Interchange DTD v1.0 20021201//EN':
         '-//NLM//DTD Journal Publishing DTD v3.0 20080202//EN':
         dtd_tuple(JPTS30_PATH, 'JPTS', 3.0)}
 
+#The parsed DTDs of each thread, by Doctype PUBLIC. An lxml DTD holds the error
+#log of its last validation, so one is not shared between threads
+_parsed_dtds = threading.local()
+
+
+def load_dtd(public_id):
+    """
+    Returns the lxml.etree.DTD for a Doctype PUBLIC in `dtds`, which is only
+    parsed the first time it is used in this thread. Raises KeyError for an
+    unknown Doctype PUBLIC.
+    """
+    cache = getattr(_parsed_dtds, 'cache', None)
+    if cache is None:
+        cache = _parsed_dtds.cache = {}
+    dtd = cache.get(public_id)
+    if dtd is None:
+        dtd = cache[public_id] = etree.DTD(dtds[public_id].path)
+    return dtd
+
 
 class Article(object):
     """
@@ -98,21 +123,25 @@ class Article(object):
 
         #Parse the document
         parser = etree.XMLParser(remove_blank_text=True)
-        self.document = etree.parse(xml_file, parser)
+        try:
+            self.document = etree.parse(xml_file, parser)
+        except (OSError, etree.XMLSyntaxError) as err:
+            log.error('Unable to parse {0}: {1}'.format(xml_file, err))
+            raise ArticleParseError('Unable to parse {0}: {1}'.format(xml_file, err)) from err
 
         #Find its public id so we can identify the appropriate DTD
         public_id = self.document.docinfo.public_id
-        log.debug('Doctype PUBLIC: ' + public_id)
+        log.debug('Doctype PUBLIC: {0}'.format(public_id))
 
         #Instantiate an lxml.etree.DTD class from the dtd files in our data
         try:
             dtd = dtds[public_id]
-        except KeyError as err:
-            log.exception()
-            log.error('Unkown DTD for value in Doctype PUBLIC: ' + public_id)
-            raise err  # We can proceed no further without the DTD
+        except KeyError:
+            log.error('Unkown DTD for value in Doctype PUBLIC: {0}'.format(public_id))
+            #We can proceed no further without the DTD
+            raise UnknownDTDError('Unknown DTD for Doctype PUBLIC: {0}'.format(public_id))
         else:
-            self.dtd = etree.DTD(dtd.path)
+            self.dtd = load_dtd(public_id)
             self.dtd_name, self.dtd_version = dtd.name, dtd.version
             log.debug('DTD: {0} {1}'.format(self.dtd_name, self.dtd_version))
 
@@ -120,9 +149,10 @@ class Article(object):
         if validation:
             log.debug('DTD validation is in use')
             if not self.dtd.validate(self.document):
-                log.critical('The document did not pass validation:\n' +
-                             self.dtd.error_log.filter_from_errors())
-                sys.exit(1)
+                error_log = self.dtd.error_log.filter_from_errors()
+                log.critical('The document did not pass validation:\n{0}'.format(error_log))
+                raise ArticleValidationError('{0} did not pass DTD validation'.format(xml_file),
+                                             error_log)
 
         self.root = self.document.getroot()
         self.body = self.root.find('body')
@@ -193,3 +223,152 @@ class Article(object):
         else:
             log.warning('Unable to locate DOI string for this article')
             return None
+
+
+class ArticleStream(Article):
+    """
+    Front-matter counterpart to :class:`Article` for very large XML files.
+
+    Rather than building the whole document tree, ArticleStream reads the
+    article XML with lxml.etree.iterparse, and only as far as the end of the
+    <front> element. This is enough to identify the DTD, the DOI and the
+    publisher, and to serve the publisher's front-matter metadata methods
+    (title, contributors, dates, rights...), so that memory use does not grow
+    with the size of the body. The DTD itself is never parsed and no
+    validation is performed, use `oaepub validate` beforehand if that is
+    required.
+
+    Conversion needs the whole document (for the navigation, the cross
+    references, and the splitting of the main document), so it uses
+    :class:`Article`.
+
+    Parameters
+    ----------
+    xml_file : str
+        Path to the xml file for parsing `xml_file`.
+
+    Attributes
+    ----------
+    root : lxml.etree.Element
+        The root element of the article, holding only the <front> element.
+    front : lxml.etree.Element or None
+        The <front> element of the article.
+    body : None
+        Always None, as the body is not read.
+    """
+    def __init__(self, xml_file):
+        """
+        The initialization of the ArticleStream class.
+        """
+        log.info('Streaming file: {0}'.format(xml_file))
+        self.xml_file = xml_file
+
+        self.root = None
+        self.front = None
+        self.body = None
+
+        #Read no further than the end of <front>
+        try:
+            with open(xml_file, 'rb') as source:
+                for event, element in etree.iterparse(source,
+                                                      events=('start', 'end'),
+                                                      remove_blank_text=True):
+                    parent = element.getparent()
+                    if parent is None:
+                        if event == 'start':
+                            self.root = element
+                    elif parent is not self.root:
+                        continue
+                    elif event == 'end' and element.tag == 'front':
+                        self.front = element
+                        break
+                    elif event == 'start' and element.tag == 'body':
+                        break
+        except (OSError, etree.XMLSyntaxError) as err:
+            log.error('Unable to parse {0}: {1}'.format(xml_file, err))
+            raise ArticleParseError('Unable to parse {0}: {1}'.format(xml_file, err)) from err
+        #The parser reads ahead, so the start of the body may be in the tree
+        for element in list(self.root):
+            if element is not self.front:
+                self.root.remove(element)
+
+        #Find its public id so we can identify the appropriate DTD
+        public_id = self.root.getroottree().docinfo.public_id
+        log.debug('Doctype PUBLIC: {0}'.format(public_id))
+        try:
+            dtd = dtds[public_id]
+        except KeyError:
+            log.error('Unkown DTD for value in Doctype PUBLIC: {0}'.format(public_id))
+            #We can proceed no further without the DTD
+            raise UnknownDTDError('Unknown DTD for Doctype PUBLIC: {0}'.format(public_id))
+        else:
+            self.dtd = None  # The DTD is not parsed for streaming
+            self.dtd_name, self.dtd_version = dtd.name, dtd.version
+            log.debug('DTD: {0} {1}'.format(self.dtd_name, self.dtd_version))
+
+        self.doi = self.get_DOI()
+        self.publisher = self.get_publisher() if self.doi is not None else None
+
+
+class ArticleMetadata(object):
+    """
+    Lightweight record of an article's front-matter metadata.
+
+    ArticleMetadata is intended for indexing, catalog feeds and collection
+    planning over large numbers of articles, where building a full
+    :class:`Article` (complete parse, DTD loading and validation) would be
+    wasted effort. It uses an :class:`ArticleStream` to read only as far as the
+    end of <front>, then asks the article's publisher for the same metadata
+    that would be placed in the Package Document.
+
+    Parameters
+    ----------
+    xml_file : str
+        Path to the xml file for parsing `xml_file`.
+
+    Attributes
+    ----------
+    doi : str or None
+        The full DOI string for the article `doi`.
+    title : str or None
+        The title of the article `title`.
+    contributors : list of Contributor namedtuples
+        The contributors to the article, as from `package_contributors`
+        `contributors`.
+    dates : list of Date namedtuples
+        Important dates for the article, as from `package_date` `dates`.
+    rights : str or None
+        The copyright statement for the article `rights`.
+    """
+    def __init__(self, xml_file):
+        """
+        The initialization of the ArticleMetadata class.
+        """
+        self.xml_file = xml_file
+        self.doi = None
+        self.title = None
+        self.contributors = []
+        self.dates = []
+        self.rights = None
+
+        stream = ArticleStream(xml_file)
+        self.doi = stream.doi
+        if stream.publisher is None:
+            log.warning('No publisher support for {0}, only the DOI is available'.format(xml_file))
+            return
+        publisher = stream.publisher
+        self.title = publisher.package_title()
+        self.contributors = publisher.package_contributors()
+        self.dates = publisher.package_date()
+        self.rights = publisher.package_rights()
+
+    def as_dict(self):
+        """
+        Returns the metadata as a dictionary of plain (JSON serializable) data.
+        """
+        return {'input': self.xml_file,
+                'doi': self.doi,
+                'title': self.title,
+                'contributors': [dict(c._asdict()) for c in self.contributors],
+                'dates': [dict(d._asdict()) for d in self.dates],
+                'rights': self.rights}
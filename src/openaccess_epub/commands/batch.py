@@ -24,6 +24,15 @@ Batch Specific Options:
                         This is only advised if you have pre-validated the files
                         (see 'oaepub validate -h')
   -r --recursive        Recursively traverse subdirectories for conversion
+  -j --jobs=N           The number of files to convert at once, each in a
+                        worker process of its own [default: 1]
+  --journal=FILE        Record the progress of the batch in FILE, so that it
+                        may be resumed if interrupted. Without --resume, any
+                        previous journal in FILE is replaced
+  --resume              Resume the batch recorded in the journal: completed
+                        files are skipped, failed or interrupted ones are
+                        retried. Without --journal, the journal is
+                        oaepub_batch.journal in the current directory
   -o --output=DIR       Directory in which to put the output. Default is set in
                         config file (see 'oaepub configure where')
   -i --images=DIR       Directory in which to find the images for the article
@@ -38,34 +47,70 @@ Logging Options:
   -l --log-to=FILE      Specify a single filepath to contain all log data
   --log-level=LEVEL     Set the level for the logging (one of: "CRITICAL",
                         "ERROR", "WARNING", "INFO", "DEBUG") [default: DEBUG]
+  --run-log=FILE        Append a JSON lines record of the stages, timing, and
+                        outcome of each article to FILE, and a summary of the
+                        run, with the metadata cache counts, at the end
 
 In contrast to the 'convert' command, the 'batch' command is intended for larger
 scale conversions of article XML to EPUB and is somewhat more specialized and
 less flexible. Local XML files are the only allowed input, all directory
 conflicts will result in the article being skipped (preventing overwrites), and
 the command will attempt to convert all XML files in the specified directories.
+A file which fails validation or cannot be converted is logged and the batch
+moves on to the next. When a journal is kept, this applies to unexpected errors
+as well, and the file is recorded as failed. The exit status is 1 if any file
+failed.
+
+With --jobs greater than 1, the modules, DTDs, publishers, and configuration
+used in conversion are loaded once, before the worker processes are started,
+so that (where processes are started by forking) every worker has them ready
+for its first file. The cost of each file is estimated from its size and its
+numbers of figures, tables, and references, while the first files are already
+being converted: the largest files found are converted first, and the smallest
+are handed to the workers several at a time, so that the workers finish at
+about the same time.
 
 If using the --images option, the argument should employ the "*" expansion. As
 a precaution against wasting time, this command will quit if the "*" is missing.
 """
 
 #Standard Library modules
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import logging
+import multiprocessing
 import os
 import shutil
 import sys
+import time
 
 #Non-Standard Library modules
 from docopt import docopt
 
 #OpenAccess_EPUB modules
+import openaccess_epub
 from openaccess_epub._version import __version__
+from openaccess_epub.exceptions import OpenAccessEPUBError
+import openaccess_epub.publisher
 from openaccess_epub.utils import files_with_ext
 from openaccess_epub.utils.epub import make_EPUB
 import openaccess_epub.utils.images
+from openaccess_epub.utils.journal import BatchJournal
 import openaccess_epub.utils.logs as oae_logging
+import openaccess_epub.utils.runlog as runlog
+from openaccess_epub.utils.scheduling import WorkQueue, estimate_cost
 from openaccess_epub.article import Article
 
+#Used by --resume when no --journal is given
+DEFAULT_JOURNAL = 'oaepub_batch.journal'
+
+#The number of files whose cost is estimated between dispatches in a parallel
+#batch
+ESTIMATE_STEP = 32
+
+#The state of a worker process of a parallel batch, set up by init_worker()
+_worker = {}
+
 
 def main(argv=None):
     args = docopt(__doc__,
@@ -75,6 +120,12 @@ def main(argv=None):
 
     if args['--images'] is not None and '*' not in args['--images']:
         sys.exit('Argument for --images option must contain "*"')
+    try:
+        jobs = int(args['--jobs'])
+    except ValueError:
+        sys.exit('Argument for --jobs must be a whole number')
+    if jobs < 1:
+        sys.exit('Argument for --jobs must be at least 1')
 
     #Basic logging configuration
     oae_logging.config_logging(args['--no-log-file'],
@@ -83,72 +134,354 @@ def main(argv=None):
                                args['--silent'],
                                args['--verbosity'])
 
-    #Get a logger, the 'openaccess_epub' logger was set up above
-    command_log = logging.getLogger('openaccess_epub.commands.batch')
-
     #Load the config module, we do this after logging configuration
     config = openaccess_epub.utils.load_config_module()
 
-    for directory in args['DIR']:
-        for xml_file in files_with_ext('.xml', directory,
-                                       recursive=args['--recursive']):
-
-            #We have to temporarily re-base our log while utils work
-            if not args['--no-log-file']:
-                oae_logging.replace_filehandler(logname='openaccess_epub',
-                                                new_file='temp.log',
-                                                level=args['--log-level'],
-                                                frmt=oae_logging.STANDARD_FORMAT)
-
-            command_log.info('Processing input: {0}'.format(xml_file))
-
-            root_name = openaccess_epub.utils.file_root_name(xml_file)
-            abs_input_path = openaccess_epub.utils.get_absolute_path(xml_file)
-
-            if not args['--no-log-file']:
-                log_name = root_name + '.log'
-                log_path = os.path.join(os.path.dirname(abs_input_path),
-                                        log_name)
-
-                #Re-base the log file to the new file location
-                oae_logging.replace_filehandler(logname='openaccess_epub',
-                                                new_file=log_path,
-                                                level=args['--log-level'],
-                                                frmt=oae_logging.STANDARD_FORMAT)
-                #Now we move over to the new log file
-                shutil.move('temp.log', log_path)
-
-            #Parse the article now that logging is ready
-            parsed_article = Article(abs_input_path,
-                                     validation=not args['--no-validate'])
-            #Get the output directory
-            if args['--output'] is not None:
-                output_directory = openaccess_epub.utils.get_absolute_path(args['--output'])
-            else:
-                if os.path.isabs(config.default_output):  # Absolute remains so
-                    output_directory = config.default_output
-                else:  # Else rendered relative to input
-                    abs_dirname = os.path.dirname(abs_input_path)
-                    output_directory = os.path.normpath(os.path.join(abs_dirname, config.default_output))
-
-            #The root name must be added on for output
-            output_directory = os.path.join(output_directory, root_name)
-
-            #Make the call to make_EPUB
-            success = make_EPUB(parsed_article,
-                                output_directory,
-                                abs_input_path,
-                                args['--images'],
-                                config_module=config,
-                                batch=True)
-
-            #Cleanup is mandatory
+    #Log files are written per article, from a background listener thread.
+    #Worker processes always log through it
+    log_file = not args['--no-log-file']
+    queued_logging = None
+    if log_file or jobs > 1:
+        queued_logging = oae_logging.QueuedLogging(args['--log-level'],
+                                                   multiprocess=jobs > 1)
+        queued_logging.start()
+
+    command_log = logging.getLogger('openaccess_epub.commands.batch')
+
+    run_log = None
+    if args['--run-log']:
+        run_log = runlog.RunLog(args['--run-log'], 'batch')
+
+    journal = None
+    if args['--journal'] or args['--resume']:
+        journal_path = args['--journal'] or DEFAULT_JOURNAL
+        journal = BatchJournal(journal_path, resume=args['--resume'])
+
+    def xml_files():
+        for directory in args['DIR']:
+            for xml_file in files_with_ext('.xml', directory,
+                                           recursive=args['--recursive']):
+                abs_input_path = openaccess_epub.utils.get_absolute_path(xml_file)
+                if journal is not None and journal.is_done(abs_input_path):
+                    command_log.info('Skipping completed file: {0}'.format(xml_file))
+                    continue
+                yield xml_file
+
+    #The counts of metadata extracted for this run only
+    start = time.perf_counter()
+    metadata_before = Counter(openaccess_epub.publisher.metadata_stats)
+    failures = 0
+    try:
+        if jobs == 1:
+            for xml_file in xml_files():
+                if not process_file(xml_file, args, config, journal, run_log,
+                                    log_file=log_file,
+                                    keep_going=journal is not None):
+                    failures += 1
+        else:
+            failures = process_in_workers(xml_files(), jobs, args, config,
+                                          journal, run_log,
+                                          queued_logging.queue, log_file,
+                                          keep_going=journal is not None)
+        stats = openaccess_epub.publisher.metadata_stats - metadata_before
+        command_log.info('Metadata: {0} extractions, {1} repeated calls \
+served from the cache'.format(stats['extractions'], stats['hits']))
+        if run_log is not None:
+            run_log.summary(time.perf_counter() - start, failures, stats)
+    finally:
+        if journal is not None:
+            journal.close()
+        if run_log is not None:
+            run_log.close()
+        if queued_logging is not None:
+            queued_logging.stop()
+
+    if failures:
+        sys.exit(1)
+
+
+def process_file(xml_file, args, config, journal=None, run_log=None,
+                 log_file=True, keep_going=False):
+    """
+    Converts an XML file within its logging and run log contexts, recording the
+    outcome in the journal if one is kept. Returns True if an EPUB was made.
+
+    Errors raised by OpenAccess_EPUB for the file are logged, and the file is
+    recorded as failed. Any other error is handled in the same way if
+    `keep_going` is True, otherwise it is raised.
+    """
+    abs_input_path = openaccess_epub.utils.get_absolute_path(xml_file)
+    output_directory = start_file(xml_file, abs_input_path, args, config,
+                                  journal)
+    error = convert_in_context(xml_file, abs_input_path, output_directory,
+                               args, config, run_log, log_file, keep_going)
+    finish_file(abs_input_path, error, journal)
+    return error is None
+
+
+def start_file(xml_file, abs_input_path, args, config, journal=None):
+    """
+    Returns the output directory for an XML file of the batch, recording in the
+    journal, if one is kept, that work on the file has started.
+    """
+    command_log = logging.getLogger('openaccess_epub.commands.batch')
+
+    root_name = openaccess_epub.utils.file_root_name(xml_file)
+    output_directory = get_output_directory(abs_input_path, root_name, args,
+                                            config)
+    if journal is not None:
+        #An interrupted attempt may have left its output behind, which would
+        #otherwise be skipped as a directory conflict
+        stale = journal.previous_output(abs_input_path)
+        if stale is not None and os.path.isdir(stale):
+            command_log.info('Removing stale output {0}'.format(stale))
+            shutil.rmtree(stale)
+        journal.started(abs_input_path, output_directory)
+    return output_directory
+
+
+def finish_file(abs_input_path, error, journal=None):
+    """
+    Records the outcome of an XML file in the journal, if one is kept.
+    """
+    if journal is not None:
+        if error is None:
+            journal.done(abs_input_path)
+        else:
+            journal.failed(abs_input_path, error)
+
+
+def convert_in_context(xml_file, abs_input_path, output_directory, args,
+                       config, run_log=None, log_file=True, keep_going=False):
+    """
+    Converts an XML file within its logging and run log contexts, as described
+    for process_file(). Returns a description of the error, or None if an EPUB
+    was made.
+    """
+    command_log = logging.getLogger('openaccess_epub.commands.batch')
+
+    with oae_logging.article_context(abs_input_path), \
+            runlog.article(run_log, abs_input_path) as run:
+        try:
+            success = convert_file(xml_file, abs_input_path, output_directory,
+                                   args, config, log_file)
+        except OpenAccessEPUBError as err:
+            command_log.critical('Unable to convert {0}: {1}'.format(xml_file, err))
+            error = runlog.describe_error(err)
+        except (Exception, SystemExit) as err:
+            if not keep_going:
+                raise
+            command_log.exception('Conversion failed: {0}'.format(xml_file))
+            error = runlog.describe_error(err)
+        else:
+            error = None if success else 'EPUB creation failed'
+        finally:
+            oae_logging.close_article_log(abs_input_path)
+        if error is not None and run is not None:
+            run.fail(error)
+    return error
+
+
+def process_in_workers(xml_files, jobs, args, config, journal, run_log,
+                       log_queue, log_file=True, keep_going=False):
+    """
+    Converts the XML files in a pool of `jobs` worker processes, which log
+    through `log_queue` (see QueuedLogging) and append to the run log file.
+
+    Everything conversion needs is preloaded first, so that workers forked
+    from this process inherit it; the journal is kept by this process. The
+    files are dispatched in chunks, largest first (see utils.scheduling);
+    their costs are estimated a few at a time between dispatches, so that the
+    workers start before the whole batch has been estimated. Returns the
+    number of files for which no EPUB was made.
+    """
+    command_log = logging.getLogger('openaccess_epub.commands.batch')
+
+    openaccess_epub.preload()
+    _worker['config'] = config
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:  # The workers load everything for themselves
+        context = multiprocessing.get_context()
+    run_log_path = None
+    if run_log is not None:
+        run_log.flush()
+        run_log_path = run_log.path
+    command_log.info('Converting in {0} worker processes'.format(jobs))
+
+    with ProcessPoolExecutor(jobs, mp_context=context,
+                             initializer=init_worker,
+                             initargs=(log_queue, run_log_path)) as pool:
+        failures = 0
+        queue = WorkQueue(jobs)
+        xml_files = iter(xml_files)
+        estimating = True
+        running = {}
+        while True:
+            for _step in range(ESTIMATE_STEP if estimating else 0):
+                xml_file = next(xml_files, None)
+                if xml_file is None:
+                    estimating = False
+                    break
+                abs_input_path = openaccess_epub.utils.get_absolute_path(xml_file)
+                queue.add((xml_file, abs_input_path),
+                          estimate_cost(abs_input_path))
+            #Only a few chunks more than there are workers are submitted at
+            #once, so that the journal records as started only what is about
+            #to be converted
+            while len(running) < 2 * jobs:
+                chunk = queue.take()
+                if not chunk:
+                    break
+                work = []
+                for xml_file, abs_input_path in chunk:
+                    output_directory = start_file(xml_file, abs_input_path,
+                                                  args, config, journal)
+                    work.append((xml_file, abs_input_path, output_directory))
+                future = pool.submit(convert_in_worker, work, args, log_file,
+                                     keep_going)
+                running[future] = [abs_input_path for _xml_file, abs_input_path
+                                   in chunk]
+            if not running and not estimating:
+                break
+            #While there are files left to estimate, this only collects what
+            #has finished
+            done, _pending = wait(running, timeout=0 if estimating else None,
+                                  return_when=FIRST_COMPLETED)
+            for future in done:
+                abs_input_paths = running.pop(future)
+                errors, stats, fatal = future.result()
+                openaccess_epub.publisher.metadata_stats.update(stats)
+                for abs_input_path, error in zip(abs_input_paths, errors):
+                    finish_file(abs_input_path, error, journal)
+                    if error is not None:
+                        failures += 1
+                if fatal is not None:
+                    raise RuntimeError('Unable to convert {0}: {1}'.format(
+                        abs_input_paths[len(errors) - 1], fatal))
+    return failures
+
+
+def init_worker(log_queue, run_log_path=None):
+    """
+    Sets up a worker process of a parallel batch. A forked worker has inherited
+    the preloaded state and the configuration, which are otherwise loaded here.
+    """
+    oae_logging.init_worker_logging(log_queue)
+    openaccess_epub.preload()
+    if 'config' not in _worker:
+        _worker['config'] = openaccess_epub.utils.load_config_module()
+    #Opened once logging is set up, so that warnings are counted
+    _worker['run_log'] = None
+    if run_log_path is not None:
+        _worker['run_log'] = runlog.RunLog(run_log_path, 'batch')
+
+
+def convert_in_worker(work, args, log_file=True, keep_going=False):
+    """
+    Converts a chunk of XML files, given as (xml_file, abs_input_path,
+    output_directory) tuples, in a worker process. Returns the descriptions of
+    the errors (or None) for each file, the metadata statistics for the chunk,
+    and the description of the error which stopped the chunk, if one was
+    raised (see convert_in_context()); the files after it are not converted.
+    """
+    command_log = logging.getLogger('openaccess_epub.commands.batch')
+
+    before = Counter(openaccess_epub.publisher.metadata_stats)
+    errors = []
+    fatal = None
+    for xml_file, abs_input_path, output_directory in work:
+        #An error raised here is described rather than returned to the batch,
+        #as it may not be picklable (those of lxml hold their error log)
+        try:
+            error = convert_in_context(xml_file, abs_input_path,
+                                       output_directory, args,
+                                       _worker['config'], _worker['run_log'],
+                                       log_file, keep_going)
+        except (Exception, SystemExit) as err:
+            command_log.exception('Conversion failed: {0}'.format(xml_file))
+            error = fatal = runlog.describe_error(err)
+        errors.append(error)
+        if fatal is not None:
+            break
+    return errors, openaccess_epub.publisher.metadata_stats - before, fatal
+
+
+def get_output_directory(abs_input_path, root_name, args, config):
+    """
+    Returns the directory in which the EPUB for an input file is built; the
+    EPUB itself is placed alongside it.
+    """
+    if args['--output'] is not None:
+        output_directory = openaccess_epub.utils.get_absolute_path(args['--output'])
+    else:
+        if os.path.isabs(config.default_output):  # Absolute remains so
+            output_directory = config.default_output
+        else:  # Else rendered relative to input
+            abs_dirname = os.path.dirname(abs_input_path)
+            output_directory = os.path.normpath(os.path.join(abs_dirname, config.default_output))
+
+    #The root name must be added on for output
+    return os.path.join(output_directory, root_name)
+
+
+def convert_file(xml_file, abs_input_path, output_directory, args, config,
+                 log_file=True):
+    """
+    Converts a single XML file of the batch to EPUB, returning True on success.
+
+    This is called within an article_context for the file, so that its logging
+    may be routed to its own log file.
+    """
+    command_log = logging.getLogger('openaccess_epub.commands.batch')
+
+    root_name = openaccess_epub.utils.file_root_name(xml_file)
+
+    if log_file:
+        log_name = root_name + '.log'
+        log_path = os.path.join(os.path.dirname(abs_input_path), log_name)
+        oae_logging.open_article_log(abs_input_path, log_path)
+
+    command_log.info('Processing input: {0}'.format(xml_file))
+
+    #Parse the article now that logging is ready
+    with runlog.stage('parse'):
+        parsed_article = Article(abs_input_path,
+                                 validation=not args['--no-validate'])
+    run = runlog.current()
+    if run is not None:
+        run.doi = parsed_article.doi
+
+    #Make the call to make_EPUB. Cleanup is mandatory, even if it fails part
+    #way, as what is left would conflict with the next conversion of the
+    #file; an existing directory is never used, so it is left alone
+    existed = os.path.isdir(output_directory)
+    try:
+        success = make_EPUB(parsed_article,
+                            output_directory,
+                            abs_input_path,
+                            args['--images'],
+                            config_module=config,
+                            batch=True)
+    except BaseException:
+        if not existed and os.path.isdir(output_directory):
             command_log.info('Removing {0}'.format(output_directory))
             shutil.rmtree(output_directory)
+        raise
+    if run is not None:
+        if not success:
+            run.fail('EPUB creation failed')
+        run.output = '{0}.epub'.format(output_directory)
+
+    if not existed:
+        command_log.info('Removing {0}'.format(output_directory))
+        shutil.rmtree(output_directory)
 
-            if not args['--no-epubcheck'] and success:
-                epub_name = '{0}.epub'.format(output_directory)
-                openaccess_epub.utils.epubcheck(epub_name, config)
+    if not args['--no-epubcheck'] and success:
+        epub_name = '{0}.epub'.format(output_directory)
+        with runlog.stage('epubcheck'):
+            openaccess_epub.utils.epubcheck(epub_name, config)
+    return success
 
 
 if __name__ == '__main__':
@@ -18,10 +18,11 @@ Clearcache Specific Options:
                    trust the command (because you are cautious and wise)
 
 Recognized commands for oaepub clearcache are:
-  all     Delete all cached data: images, logs
-  images  Delete only the cached image files
-  logs    Delete only the cached log files
-  manual  Print out the cache location then exit
+  all        Delete all cached data: images, logs, downloads
+  images     Delete only the cached image files
+  logs       Delete only the cached log files
+  downloads  Delete only the cached DOI resolutions and downloaded XML files
+  manual     Print out the cache location then exit
 
 Remember that you can disable any or all caching. Caching is very helpful for
 development, but may not be necessary for all users. If you want to manually
@@ -42,6 +43,7 @@ from docopt import docopt
 #OpenAccess_EPUB modules
 from openaccess_epub._version import __version__
 import openaccess_epub.utils
+from openaccess_epub.utils.download_cache import download_cache
 
 
 def empty_it(path, dry_run):
@@ -85,9 +87,17 @@ def main(argv=None):
     elif args['COMMAND'] == 'images':
         empty_it(config.image_cache, dry_run=args['--dry-run'])
         sys.exit()
+    elif args['COMMAND'] == 'downloads':
+        downloads = download_cache(config)
+        if downloads is not None:
+            empty_it(downloads.directory, dry_run=args['--dry-run'])
+        sys.exit()
     elif args['COMMAND'] == 'all':
         empty_it(os.path.join(cache_loc, 'logs'), dry_run=args['--dry-run'])
         empty_it(config.image_cache, dry_run=args['--dry-run'])
+        downloads = download_cache(config)
+        if downloads is not None:
+            empty_it(downloads.directory, dry_run=args['--dry-run'])
         sys.exit()
 
 
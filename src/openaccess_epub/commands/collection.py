@@ -21,7 +21,9 @@ Collection Specific Options:
   -2 --epub2            Convert to EPUB2
   -3 --epub3            Convert to EPUB3
   --no-cleanup          The EPUB contents prior to .epub-packaging will not be
-                        removed
+                        removed. Images are only copied into them with this
+                        option; otherwise they are read into the EPUB from
+                        where they are found
   --no-epubcheck        Disable the use of epubcheck to validate EPUBs
   --no-validate         Disable DTD validation of XML files during conversion.
                         This is only advised if you have pre-validated the files
@@ -40,12 +42,16 @@ Logging Options:
   -l --log-to=FILE      Specify a single filepath to contain all log data
   --log-level=LEVEL     Set the level for the logging (one of: "CRITICAL",
                         "ERROR", "WARNING", "INFO", "DEBUG") [default: DEBUG]
+  --run-log=FILE        Append a JSON lines record of the stages, timing, and
+                        outcome of each article, and of the collection, to FILE
 
 To prepare a collection, begin by ensuring that all required XMl files are
 stored locally. Create a text file which contains a path to an XML file on
 each line, in the order in which they should appear in the EPUB. The root name
 of this text file will also serve as the name of the EPUB and the log (unless
-the --log-to option is used).
+the --log-to option is used). An article which is missing, fails validation,
+is from an unsupported publisher, or has content which cannot be converted is
+left out of the collection, and the reason is logged.
 
 If using the --images option, the argument should employ the "*" expansion. As
 a precaution against wasting time, this command will quit if the "*" is missing.
@@ -64,12 +70,16 @@ from docopt import docopt
 
 #OpenAccess_EPUB modules
 from openaccess_epub._version import __version__
+from openaccess_epub.exceptions import (InputError, OpenAccessEPUBError,
+                                        UnsupportedPublisherError)
 from openaccess_epub.navigation import Navigation
 from openaccess_epub.package import Package
 import openaccess_epub.utils as utils
-from openaccess_epub.utils.epub import epub_zip, make_epub_base
+from openaccess_epub.utils.epub import epub_zip, make_epub_base, zip_options
+from openaccess_epub.utils.registry import BuildRegistry
 import openaccess_epub.utils.images
 import openaccess_epub.utils.logs as oae_logging
+import openaccess_epub.utils.runlog as runlog
 from openaccess_epub.article import Article
 
 
@@ -131,62 +141,130 @@ def main(argv=None):
         if err.errno != 17:
             command_log.exception('Unable to recursively create output directories')
 
+    #Every file placed in the EPUB is registered here for the manifest
+    registry = BuildRegistry()
+
     #Instantiate collection NCX and OPF
     navigation = Navigation(collection=True)
-    package = Package(collection=True, title=c_file_root)
+    package = Package(collection=True, title=c_file_root, registry=registry)
 
     #Copy over the basic epub directory
-    make_epub_base(output_directory)
+    make_epub_base(output_directory, registry)
 
     epub_version = None
 
-    #Iterate over the inputs
-    for xml_file in inputs:
-        xml_path = utils.evaluate_relative_path(os.path.dirname(abs_input_path),
-                                                xml_file)
+    run_log = None
+    if args['--run-log']:
+        run_log = runlog.RunLog(args['--run-log'], 'collection')
+    try:
+        #Iterate over the inputs
+        for xml_file in inputs:
+            xml_path = utils.evaluate_relative_path(os.path.dirname(abs_input_path),
+                                                    xml_file)
+            with runlog.article(run_log, xml_path) as run:
+                try:
+                    epub_version = add_article(xml_path, args, config,
+                                               output_directory, navigation,
+                                               package, registry,
+                                               epub_version, run)
+                except OpenAccessEPUBError as err:
+                    #Raised before the article is added, so it may be left out
+                    command_log.critical('Leaving {0} out of the collection: \
+{1}'.format(xml_path, err))
+                    if run is not None:
+                        run.fail(runlog.describe_error(err))
+
+        if epub_version is None:
+            command_log.critical('No articles could be added to the collection')
+            sys.exit('Unable to continue')
+
+        #The collection as a whole gets a record of its own
+        pretty_print = getattr(config, 'pretty_print_xml', False)
+        with runlog.article(run_log, abs_input_path) as run:
+            with runlog.stage('package'):
+                if epub_version == 2:
+                    navigation.render_EPUB2(output_directory, registry)
+                    package.render_EPUB2(output_directory, pretty_print)
+                elif epub_version == 3:
+                    navigation.render_EPUB3(output_directory, registry)
+                    package.render_EPUB3(output_directory, pretty_print)
+            with runlog.stage('zip'):
+                epub_zip(output_directory, sources=registry.external_files(),
+                         **zip_options(config))
+            if run is not None:
+                run.output = '{0}.epub'.format(output_directory)
+
+            #Cleanup removes the produced output directory, keeps the EPUB
+            if not args['--no-cleanup']:
+                command_log.info('Removing {0}'.format(output_directory))
+                shutil.rmtree(output_directory)
+
+            #Running epubcheck on the output verifies the validity of the ePub,
+            #requires a local installation of java and epubcheck.
+            if not args['--no-epubcheck']:
+                epub_name = '{0}.epub'.format(output_directory)
+                with runlog.stage('epubcheck'):
+                    openaccess_epub.utils.epubcheck(epub_name, config)
+    finally:
+        if run_log is not None:
+            run_log.close()
+
+
+def add_article(xml_path, args, config, output_directory, navigation, package,
+                registry, epub_version, run=None):
+    """
+    Parses an article of the collection, renders its content and images into
+    the output directory, and adds it to the navigation and package.
+
+    Returns the EPUB version for the collection, which is decided by the first
+    article unless set by --epub2 or --epub3. Raises an OpenAccessEPUBError
+    (such as ArticleValidationError, InputError, or ContentError) if the article
+    cannot be used; this happens before the article is added to the navigation
+    and package, and before its content is written or registered.
+    """
+    if not os.path.isfile(xml_path):
+        raise InputError('File does not exist {0}'.format(xml_path))
+    with runlog.stage('parse'):
         parsed_article = Article(xml_path, validation=not args['--no-validate'])
-        if epub_version is None:  # Only set this once, no mixing!
-            if args['--epub2']:
-                epub_version = 2
-            elif args['--epub3']:
-                epub_version = 3
-            else:
-                epub_version = parsed_article.publisher.epub_default
-
-        navigation.process(parsed_article)
-        package.process(parsed_article)
-
-        #Get the Digital Object Identifier
-        doi = parsed_article.get_DOI()
-        journal_doi, article_doi = doi.split('/')
-
-        #Get the images
+    if run is not None:
+        run.doi = parsed_article.doi
+    if parsed_article.publisher is None:
+        raise UnsupportedPublisherError('Publisher support was not established')
+    if epub_version is None:  # Only set this once, no mixing!
+        if args['--epub2']:
+            epub_version = 2
+        elif args['--epub3']:
+            epub_version = 3
+        else:
+            epub_version = parsed_article.publisher.epub_default
+
+    #The ids the navigation will use are given before the content is rendered
+    navigation.assign_ids(parsed_article)
+    with runlog.stage('render'):
+        parsed_article.publisher.render_content(
+            output_directory, epub_version, registry,
+            getattr(config, 'content_split_bytes', None),
+            getattr(config, 'pretty_print_xml', False))
+
+    #Get the images referenced by the rendered content. Unless the output
+    #directory is to be kept, images on disk are read straight into the EPUB
+    #rather than copied into it
+    referenced = parsed_article.publisher.referenced_images
+    with runlog.stage('images'):
         openaccess_epub.utils.images.get_images(output_directory,
                                                 args['--images'],
                                                 xml_path,
                                                 config,
-                                                parsed_article)
-
-        parsed_article.publisher.render_content(output_directory, epub_version)
-
-    if epub_version == 2:
-        navigation.render_EPUB2(output_directory)
-        package.render_EPUB2(output_directory)
-    elif epub_version == 3:
-        navigation.render_EPUB3(output_directory)
-        package.render_EPUB3(output_directory)
-    epub_zip(output_directory)
-
-    #Cleanup removes the produced output directory, keeps the EPUB
-    if not args['--no-cleanup']:
-        command_log.info('Removing {0}'.format(output_directory))
-        shutil.rmtree(output_directory)
-
-    #Running epubcheck on the output verifies the validity of the ePub,
-    #requires a local installation of java and epubcheck.
-    if not args['--no-epubcheck']:
-        epub_name = '{0}.epub'.format(output_directory)
-        openaccess_epub.utils.epubcheck(epub_name, config)
+                                                parsed_article,
+                                                registry,
+                                                referenced,
+                                                stage=args['--no-cleanup'])
+
+    #Only an article whose content is in place is added
+    navigation.process(parsed_article)
+    package.process(parsed_article)
+    return epub_version
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
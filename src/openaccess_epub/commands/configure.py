@@ -93,6 +93,28 @@ use_image_cache = {use-image-cache}
 # A Boolean toggle for whether or not to use Image Fetching
 use_image_fetching = {use-image-fetching}
 
+# -- Image Optimization Options --
+# A Boolean toggle for whether or not to optimize the images placed in each
+# EPUB: images larger than the maximum dimension (in pixels) are downscaled,
+# PNG and JPEG images are recompressed, and TIFF images are converted to PNG.
+# Requires the Pillow library. Processed images are cached, by default in a
+# "processed" directory in the image cache.
+optimize_images = False
+image_max_dimension = 1600
+image_jpeg_quality = 85
+processed_image_cache = None
+
+# -- Download Cache Configuration ---------------------------------------------
+# The XML files downloaded for DOI and URL inputs, and the URLs which DOIs
+# resolve to, are kept in the download cache. A cached download is used for up
+# to download_cache_ttl seconds, after which the server is asked whether it has
+# changed (by its ETag or Last-Modified date) and it is only downloaded again if
+# it has. 'oaepub convert --offline' uses the cache without the network.
+# None for download_cache uses a "downloads" directory in the cache location.
+use_download_cache = True
+download_cache = None
+download_cache_ttl = 86400
+
 # -- Output Configuration -----------------------------------------------------
 # OpenAccess_EPUB can place the output in the desired location. A relative path
 # will be interpreted as relative to the input, and an absolute path will serve
@@ -105,6 +127,36 @@ default_output = '{default-output}'
 # where OpenAccess_EPUB will look relative to the input.
 input_relative_css = '{input-relative-css}'
 
+# -- Content Configuration ----------------------------------------------------
+# Long articles make long XHTML documents, which e-readers are slow to open.
+# If set to a number of bytes, the main document of each article is split into
+# several documents of about that size, at the boundaries of its top-level
+# sections; 1 gives every top-level section a document of its own. Links and
+# navigation are pointed at whichever document holds their target. None keeps
+# the whole article in one main document.
+content_split_bytes = None
+
+# A Boolean toggle for whether or not to indent the XHTML content documents and
+# the package document. Indentation makes them easier to read while debugging,
+# but larger and slower to write.
+pretty_print_xml = False
+
+# -- EPUB Packaging Configuration ---------------------------------------------
+# The text files of an EPUB (XHTML, NCX, OPF, CSS) are deflated when the EPUB
+# is zipped, at this compression level: from 1 (fastest) to 9 (smallest), or 0
+# to store everything uncompressed. Images are always stored, as deflating them
+# again saves next to nothing. 'oaepub epubzip --benchmark' compares the levels.
+zip_compression_level = 6
+
+# The number of threads which compress the files of an EPUB at once. None
+# chooses a number from the count of CPUs.
+zip_threads = None
+
+# Zip entries are always written in order of their names. For byte-identical
+# EPUBs from unchanged input, set the SOURCE_DATE_EPOCH environment variable:
+# it is then used in place of the current time for the dates in the EPUB, and
+# in place of file modification times for the zip entries.
+
 # -- EpubCheck Configuration --------------------------------------------------
 # All output SHOULD be passed to EpubCheck, this is especially true for
 # publishers or those wishing to distribute EPUB output. EpubCheck is a separate
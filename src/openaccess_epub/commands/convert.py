@@ -7,6 +7,7 @@ Convert explicitly listed articles to EPUB, takes input of XML file, DOI, or URL
 
 Usage:
   convert [--silent | --verbosity=LEVEL] [--epub2 | --epub3] [options] INPUT ...
+  convert [--silent | --verbosity=LEVEL] [--epub2 | --epub3] [options] --from-file=FILE [INPUT ...]
 
 General Options:
   -h --help             Show this help message and exit
@@ -34,12 +35,22 @@ Convert Specific Options:
                         without extension. For more information and default
                         configuration see the config file
                         ('oaepub configure where')
+  --offline             Do not use the network for DOI and URL inputs; they are
+                        taken from the download cache however old they are
+  -f --from-file=FILE   Also convert the inputs listed in FILE, one per line,
+                        after any given as arguments. Blank lines and lines
+                        starting with "#" are ignored. Use "-" for stdin
+  -p --prefetch=N       Download up to N upcoming DOI and URL inputs (and their
+                        images, where they would be fetched) in the background
+                        while earlier inputs are converted [default: 0]
 
 Logging Options:
   --no-log-file         Disable logging to file
   -l --log-to=FILE      Specify a single filepath to contain all log data
   --log-level=LEVEL     Set the level for the logging (one of: "CRITICAL",
                         "ERROR", "WARNING", "INFO", "DEBUG") [default: DEBUG]
+  --run-log=FILE        Append a JSON lines record of the stages, timing, and
+                        outcome of each article to FILE
 
 Convert supports input of the following types:
   XML - Input points to the location of a local XML file (ends with: '.xml')
@@ -49,7 +60,13 @@ Convert supports input of the following types:
         (starts with 'http:' or 'https:')
 
 Each individual input will receive its own log (replace '.xml' with '.log')
-unless '--log-to' is used to direct all logging information to a specific file
+unless '--log-to' is used to direct all logging information to a specific file.
+If an input cannot be converted, the error is logged and conversion continues
+with the next input; the exit status will then be 1.
+DOI resolutions and downloaded XML files are kept in the download cache, so
+converting the same input again only asks the server whether it has changed.
+Inputs are always converted in the order given; with '--prefetch', downloads for
+the inputs that follow run at the same time as the current conversion.
 Many default actions for your installation of OpenAccess_EPUB are configurable.
 Execute 'oaepub configure' to interactively configure, or modify the config
 file manually in a text editor; executing 'oaepub configure where' will tell you
@@ -57,6 +74,7 @@ where the config file is located.
 """
 
 #Standard Library modules
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
 import shutil
@@ -67,10 +85,15 @@ from docopt import docopt
 
 #OpenAccess_EPUB modules
 from openaccess_epub._version import __version__
+from openaccess_epub.exceptions import (InputError, OpenAccessEPUBError,
+                                        OutputDirectoryError,
+                                        UnsupportedPublisherError)
+from openaccess_epub.utils.download_cache import download_cache
 from openaccess_epub.utils.epub import make_EPUB
 import openaccess_epub.utils.images
 import openaccess_epub.utils.inputs as input_utils
 import openaccess_epub.utils.logs as oae_logging
+import openaccess_epub.utils.runlog as runlog
 from openaccess_epub.article import Article
 
 
@@ -87,6 +110,18 @@ def main(argv=None):
     else:
         epub_version = None
 
+    try:
+        prefetch = int(args['--prefetch'])
+    except ValueError:
+        sys.exit('Argument for --prefetch must be a whole number')
+
+    inputs = list(args['INPUT'])
+    if args['--from-file']:
+        try:
+            inputs.extend(read_input_list(args['--from-file']))
+        except OSError as err:
+            sys.exit('Unable to read {0}: {1}'.format(args['--from-file'], err))
+
     #Basic logging configuration
     oae_logging.config_logging(args['--no-log-file'],
                                args['--log-to'],
@@ -94,89 +129,272 @@ def main(argv=None):
                                args['--silent'],
                                args['--verbosity'])
 
-    #Get a logger, the 'openaccess_epub' logger was set up above
-    command_log = logging.getLogger('openaccess_epub.commands.convert')
-
     #Load the config module, we do this after logging configuration
     config = openaccess_epub.utils.load_config_module()
 
+    #Unless a single log file is specified, each input gets its own log file,
+    #written from a background listener thread
+    queued_logging = None
+    if not args['--no-log-file'] and not args['--log-to']:
+        queued_logging = oae_logging.QueuedLogging(args['--log-level'])
+        queued_logging.start()
+
+    run_log = None
+    if args['--run-log']:
+        run_log = runlog.RunLog(args['--run-log'], 'convert')
+
+    command_log = logging.getLogger('openaccess_epub.commands.convert')
+
+    downloads = download_cache(config, offline=args['--offline'])
+
     current_dir = os.getcwd()
-    #Our basic flow is to iterate over the args['INPUT'] list
-    for inpt in args['INPUT']:
-        #We have to temporarily re-base our log while input utils do some work
-        if not args['--no-log-file'] and not args['--log-to']:
-            oae_logging.replace_filehandler(logname='openaccess_epub',
-                                            new_file='temp.log',
-                                            level=args['--log-level'],
-                                            frmt=oae_logging.STANDARD_FORMAT)
-
-        command_log.info('Processing input: {0}'.format(inpt))
-
-        #First we need to know the name of the file and where it is
-        if inpt.lower().endswith('.xml'):  # This is direct XML file
-            root_name = openaccess_epub.utils.file_root_name(inpt)
-            abs_input_path = openaccess_epub.utils.get_absolute_path(inpt)
-        elif inpt.lower().startswith('doi:'):  # This is a DOI
-            root_name = input_utils.doi_input(inpt)
-            abs_input_path = os.path.join(current_dir, root_name + '.xml')
-        elif any(inpt.lower().startswith(i) for i in ['http:', 'https:']):
-            root_name = input_utils.url_input(inpt)
-            abs_input_path = os.path.join(current_dir, root_name + '.xml')
+    failures = 0
+    prefetcher = None
+    if prefetch > 0:
+        prefetcher = Prefetcher(inputs, prefetch, args, config, current_dir,
+                                downloads)
+    try:
+        #Our basic flow is to iterate over the inputs in order
+        for index, inpt in enumerate(inputs):
+            prefetched = None
+            if prefetcher is not None:
+                prefetched = prefetcher.get(index)
+            #Records are held for the input until its log file is known
+            with oae_logging.article_context(inpt), \
+                    runlog.article(run_log, inpt) as run:
+                try:
+                    success = convert_input(inpt, args, config, epub_version,
+                                            current_dir,
+                                            queued_logging is not None,
+                                            downloads, prefetched)
+                except OpenAccessEPUBError as err:
+                    #A bad input should not prevent the conversion of others
+                    command_log.critical('Unable to convert {0}: {1}'.format(inpt, err))
+                    failures += 1
+                    if run is not None:
+                        run.fail(runlog.describe_error(err))
+                else:
+                    if not success:
+                        failures += 1
+                finally:
+                    oae_logging.close_article_log(inpt)
+    finally:
+        if prefetcher is not None:
+            prefetcher.shutdown()
+        if run_log is not None:
+            run_log.close()
+        if queued_logging is not None:
+            queued_logging.stop()
+
+    if failures:
+        sys.exit(1)
+
+
+def read_input_list(path):
+    """
+    Returns the inputs listed in the file at `path` (or stdin for "-"), one per
+    line, skipping blank lines and "#" comments.
+    """
+    if path == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as input_list:
+            lines = input_list.readlines()
+    inputs = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            inputs.append(line)
+    return inputs
+
+
+def is_remote(inpt):
+    """
+    True for DOI and URL inputs, which must be downloaded.
+    """
+    return inpt.lower().startswith(('doi:', 'http:', 'https:')) and \
+        not inpt.lower().endswith('.xml')
+
+
+def resolve_input(inpt, current_dir, downloads=None):
+    """
+    Returns the root name and absolute path of the XML file for an input,
+    downloading DOI and URL inputs into `current_dir`.
+    """
+    if inpt.lower().endswith('.xml'):  # This is direct XML file
+        root_name = openaccess_epub.utils.file_root_name(inpt)
+        abs_input_path = openaccess_epub.utils.get_absolute_path(inpt)
+    elif inpt.lower().startswith('doi:'):  # This is a DOI
+        root_name = input_utils.doi_input(inpt, cache=downloads)
+        abs_input_path = os.path.join(current_dir, root_name + '.xml')
+    elif any(inpt.lower().startswith(i) for i in ['http:', 'https:']):
+        root_name = input_utils.url_input(inpt, cache=downloads)
+        abs_input_path = os.path.join(current_dir, root_name + '.xml')
+    else:
+        raise InputError('{0} not recognized as XML, DOI, or URL'.format(inpt))
+    return root_name, abs_input_path
+
+
+def prefetch_input(inpt, args, config, current_dir, downloads=None):
+    """
+    Downloads a DOI or URL input, and its images where they would be fetched,
+    ahead of its conversion. Returns the result of resolve_input().
+
+    This runs in a prefetch thread, within an article_context for the input,
+    so that its logging reaches the input's log file.
+    """
+    command_log = logging.getLogger('openaccess_epub.commands.convert')
+
+    with oae_logging.article_context(inpt):
+        root_name, abs_input_path = resolve_input(inpt, current_dir, downloads)
+        #The images are fetched again during conversion if this fails
+        try:
+            openaccess_epub.utils.images.prefetch_images(abs_input_path,
+                                                         args['--images'],
+                                                         config)
+        except Exception as err:
+            command_log.warning('Unable to prefetch images for {0}: {1}'.format(inpt,
+                                                                        err))
+        return root_name, abs_input_path
+
+
+class Prefetcher(object):
+    """
+    Downloads the DOI and URL inputs of a list in a pool of `size` threads,
+    keeping at most `size` inputs ahead of the one being converted.
+
+    Parameters
+    ----------
+    inputs : list of str
+        The inputs, in the order they are converted
+    size : int
+        The number of inputs to download ahead, and of download threads
+    """
+
+    def __init__(self, inputs, size, args, config, current_dir, downloads=None):
+        self.inputs = inputs
+        self.size = size
+        self.args = args
+        self.config = config
+        self.current_dir = current_dir
+        self.downloads = downloads
+        self.futures = {}
+        self._submitted = 0
+        self._executor = ThreadPoolExecutor(max_workers=size)
+
+    def get(self, index):
+        """
+        Returns the Future for the input at `index` if it is being prefetched,
+        otherwise None, and starts prefetching the inputs which follow it.
+        """
+        while self._submitted < len(self.inputs) and \
+                self._submitted <= index + self.size:
+            inpt = self.inputs[self._submitted]
+            if is_remote(inpt):
+                self.futures[self._submitted] = self._executor.submit(
+                    prefetch_input, inpt, self.args, self.config,
+                    self.current_dir, self.downloads)
+            self._submitted += 1
+        return self.futures.pop(index, None)
+
+    def shutdown(self):
+        """
+        Cancels the prefetches which have not started, and waits for the rest.
+        """
+        for future in self.futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+
+def convert_input(inpt, args, config, epub_version, current_dir,
+                  log_file=True, downloads=None, prefetched=None):
+    """
+    Converts a single input (XML file, DOI, or URL) to EPUB, returning True on
+    success.
+
+    This is called within an article_context for the input, so that its logging
+    may be routed to its own log file. DOI and URL inputs are downloaded
+    through the `downloads` DownloadCache, if one is supplied, unless a Future
+    from a Prefetcher is given as `prefetched`.
+    """
+    command_log = logging.getLogger('openaccess_epub.commands.convert')
+
+    command_log.info('Processing input: {0}'.format(inpt))
+
+    #First we need to know the name of the file and where it is
+    with runlog.stage('input'):
+        if prefetched is not None:
+            root_name, abs_input_path = prefetched.result()
         else:
-            sys.exit('{0} not recognized as XML, DOI, or URL'.format(inpt))
-
-        if not args['--no-log-file'] and not args['--log-to']:
-            log_name = root_name + '.log'
-            log_path = os.path.join(os.path.dirname(abs_input_path), log_name)
-
-            #Re-base the log file to the new file location
-            oae_logging.replace_filehandler(logname='openaccess_epub',
-                                            new_file=log_path,
-                                            level=args['--log-level'],
-                                            frmt=oae_logging.STANDARD_FORMAT)
-            #Now we move over to the new log file
-            shutil.copy2('temp.log', log_path)
-            os.remove('temp.log')
-
-        #Now that we should be done configuring logging, let's parse the article
+            root_name, abs_input_path = resolve_input(inpt, current_dir,
+                                                      downloads)
+
+    run = runlog.current()
+    if run is not None and run.input_bytes is None and \
+            os.path.isfile(abs_input_path):
+        run.input_bytes = os.path.getsize(abs_input_path)
+
+    if log_file:
+        log_name = root_name + '.log'
+        log_path = os.path.join(os.path.dirname(abs_input_path), log_name)
+        oae_logging.open_article_log(inpt, log_path)
+
+    #Now that we should be done configuring logging, let's parse the article
+    with runlog.stage('parse'):
         parsed_article = Article(abs_input_path,
                                  validation=not args['--no-validate'])
+    if run is not None:
+        run.doi = parsed_article.doi
 
-        if parsed_article.publisher is None:
-            command_log.critical('Publisher support was not established, aborting')
-            sys.exit(1)
+    if parsed_article.publisher is None:
+        raise UnsupportedPublisherError('Publisher support was not established')
 
-        #Get the output directory
-        if args['--output'] is not None:
-            output_directory = openaccess_epub.utils.get_absolute_path(args['--output'])
-        else:
-            if os.path.isabs(config.default_output):  # Absolute remains so
-                output_directory = config.default_output
-            else:  # Else rendered relative to input
-                abs_dirname = os.path.dirname(abs_input_path)
-                output_directory = os.path.normpath(os.path.join(abs_dirname, config.default_output))
+    #Get the output directory
+    if args['--output'] is not None:
+        output_directory = openaccess_epub.utils.get_absolute_path(args['--output'])
+    else:
+        if os.path.isabs(config.default_output):  # Absolute remains so
+            output_directory = config.default_output
+        else:  # Else rendered relative to input
+            abs_dirname = os.path.dirname(abs_input_path)
+            output_directory = os.path.normpath(os.path.join(abs_dirname, config.default_output))
 
-        #The root name must be added on for output
-        output_directory = os.path.join(output_directory, root_name)
+    #The root name must be added on for output
+    output_directory = os.path.join(output_directory, root_name)
 
-        #Make the call to make_EPUB
+    #Make the call to make_EPUB. If it fails part way, the output directory
+    #is cleaned up as it would be after a finished conversion
+    try:
         success = make_EPUB(parsed_article,
                             output_directory,
                             abs_input_path,
                             args['--images'],
                             config_module=config,
                             epub_version=epub_version)
-
-        #Cleanup removes the produced output directory, keeps the EPUB
-        if not args['--no-cleanup']:
+    except OutputDirectoryError:  # The existing directory is kept
+        raise
+    except BaseException:
+        if not args['--no-cleanup'] and os.path.isdir(output_directory):
             command_log.info('Removing {0}'.format(output_directory))
             shutil.rmtree(output_directory)
+        raise
+    if run is not None:
+        if not success:
+            run.fail('EPUB creation failed')
+        run.output = '{0}.epub'.format(output_directory)
+
+    #Cleanup removes the produced output directory, keeps the EPUB
+    if not args['--no-cleanup']:
+        command_log.info('Removing {0}'.format(output_directory))
+        shutil.rmtree(output_directory)
 
-        #Running epubcheck on the output verifies the validity of the EPUB,
-        #requires a local installation of java and epubcheck.
-        if not args['--no-epubcheck'] and success:
-            epub_name = '{0}.epub'.format(output_directory)
+    #Running epubcheck on the output verifies the validity of the EPUB,
+    #requires a local installation of java and epubcheck.
+    if not args['--no-epubcheck'] and success:
+        epub_name = '{0}.epub'.format(output_directory)
+        with runlog.stage('epubcheck'):
             openaccess_epub.utils.epubcheck(epub_name, config)
+    return success
 
 
 if __name__ == '__main__':
@@ -9,18 +9,38 @@ Usage:
   epubzip [options] EPUBDIR
 
 Options:
-  -h --help        show this help message and exit
-  -v --version     show program version and exit
+  -h --help          show this help message and exit
+  -v --version       show program version and exit
+  -l --level=N       Deflate compression level for the text files of the EPUB,
+                     from 1 (fastest) to 9 (smallest), or 0 to store them
+                     [default: 6]
+  -t --threads=N     Number of threads compressing at once. Default chooses a
+                     number from the count of CPUs
+  -b --benchmark     Instead of writing the EPUB, zip EPUBDIR at each
+                     compression level (and single-threaded at the chosen
+                     level) and report the size, time taken, and throughput
+                     (in MB of input per second) for each
+
+Images are always stored rather than deflated, as compressing them again saves
+next to nothing. Entries are written in order of their names, and if the
+SOURCE_DATE_EPOCH environment variable is set, it is used as the timestamp of
+every entry so that the same contents always make the same EPUB file.
 """
 
 #Standard Library modules
+import os
+import sys
+import tempfile
+import time
 
 #Non-Standard Library modules
 from docopt import docopt
 
 #OpenAccess_EPUB modules
 from openaccess_epub._version import __version__
+from openaccess_epub.utils import source_date_epoch
 from openaccess_epub.utils.epub import epub_zip
+from openaccess_epub.utils.zipwriter import write_epub
 
 
 def main(argv=None):
@@ -29,8 +49,44 @@ def main(argv=None):
                   version='OpenAccess_EPUB v.' + __version__,
                   options_first=True)
 
-    epub_zip(args['EPUBDIR'])
+    try:
+        level = int(args['--level'])
+        threads = int(args['--threads']) if args['--threads'] else None
+    except ValueError:
+        sys.exit('--level and --threads must be whole numbers')
+    if not 0 <= level <= 9:
+        sys.exit('--level must be from 0 to 9')
+
+    epub_dir = os.path.normpath(args['EPUBDIR'])
+    if args['--benchmark']:
+        benchmark(epub_dir, level, threads)
+    else:
+        epub_zip(epub_dir, level, threads, source_date_epoch())
+
+
+def benchmark(epub_dir, level, threads):
+    """
+    Prints the size, time taken, and throughput to zip `epub_dir` at each
+    compression level, and with a single thread at `level`.
+    """
+    input_bytes = 0
+    for dirpath, _dirnames, filenames in os.walk(epub_dir):
+        for filename in filenames:
+            input_bytes += os.path.getsize(os.path.join(dirpath, filename))
+    print('Zipping {0:,} bytes'.format(input_bytes))
+    runs = [(each, threads) for each in range(10)] + [(level, 1)]
+    print('level  threads        bytes   seconds      MB/s')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        epub_filename = os.path.join(temp_dir, 'benchmark.epub')
+        for run_level, run_threads in runs:
+            start = time.perf_counter()
+            write_epub(epub_dir, epub_filename, run_level, run_threads)
+            duration = time.perf_counter() - start
+            print('{0:>5}  {1:>7}  {2:>11,}  {3:>8.3f}  {4:>8.1f}'.format(
+                run_level, run_threads or 'auto',
+                os.path.getsize(epub_filename), duration,
+                input_bytes / 1e6 / duration))
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+oaepub metadata
+
+Extract article metadata as JSON lines, without converting to EPUB
+
+Usage:
+  metadata [options] INPUT ...
+
+Options:
+  -h --help             show this help message and exit
+  -v --version          show program version and exit
+  -s --silent           Print no warnings to the console during execution
+
+Metadata Specific Options:
+  -o --output=FILE      Append the JSON lines to FILE instead of printing them
+  -r --recursive        Recursively traverse subdirectories of DIR inputs
+
+Each INPUT may be a local XML file or a directory of XML files. One line of
+JSON is written for each article, holding its DOI, title, contributors, dates
+and rights. Only the front matter of each article is read and no DTD is loaded
+or validated, so this is much faster than a conversion; use 'oaepub validate'
+if the XML files are not trusted. Articles that cannot be read are reported on
+the console and skipped.
+"""
+
+#Standard Library modules
+import json
+import logging
+import os
+import sys
+
+#Non-Standard Library modules
+from docopt import docopt
+from lxml import etree
+
+#OpenAccess_EPUB modules
+from openaccess_epub._version import __version__
+from openaccess_epub.article import ArticleMetadata
+from openaccess_epub.exceptions import OpenAccessEPUBError
+from openaccess_epub.utils import files_with_ext
+
+
+def main(argv=None):
+    args = docopt(__doc__,
+                  argv=argv,
+                  version='OpenAccess_EPUB v.' + __version__,
+                  options_first=True)
+
+    #The JSON lines may be on stdout, so keep the console log on stderr
+    log = logging.getLogger('openaccess_epub')
+    log.setLevel(logging.WARNING)
+    if not args['--silent']:
+        sh_echo = logging.StreamHandler(sys.stderr)
+        sh_echo.setFormatter(logging.Formatter('%(message)s'))
+        log.addHandler(sh_echo)
+    else:
+        log.addHandler(logging.NullHandler())
+
+    if args['--output']:
+        output = open(args['--output'], 'a', encoding='utf-8')
+    else:
+        output = sys.stdout
+
+    def xml_inputs():
+        for inpt in args['INPUT']:
+            if os.path.isdir(inpt):
+                for xml_file in files_with_ext('.xml', inpt,
+                                               recursive=args['--recursive']):
+                    yield xml_file
+            else:
+                yield inpt
+
+    try:
+        for xml_file in xml_inputs():
+            try:
+                metadata = ArticleMetadata(xml_file)
+            except (IOError, KeyError, OpenAccessEPUBError,
+                    etree.XMLSyntaxError) as err:
+                log.error('Skipping {0}: {1}'.format(xml_file, err))
+                continue
+            output.write(json.dumps(metadata.as_dict(), ensure_ascii=False))
+            output.write('\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,8 @@ Validate Specific Options:
   -P --record-pass      Keep records of XML files which pass DTD validation,
                         otherwise only the failures will be recorded
   -r --recursive        Recursively traverse subdirectories for validation
+  --run-log=FILE        Append a JSON lines record of the timing and outcome of
+                        each validation to FILE
 
 This command is especially useful for validating large numbers of XML files, so
 that one can safely disable validation during repeated EPUB conversions of the
@@ -46,6 +48,7 @@ from openaccess_epub import JPTS10_PATH, JPTS11_PATH, JPTS20_PATH,\
     JPTS21_PATH, JPTS22_PATH, JPTS23_PATH, JPTS30_PATH
 from openaccess_epub.utils import files_with_ext
 import openaccess_epub.utils.logs as logs
+import openaccess_epub.utils.runlog as runlog
 
 
 DTDS = {'-//NLM//DTD Journal Archiving and Interchange DTD v1.0 20021201//EN': lxml.etree.DTD(JPTS10_PATH),
@@ -73,55 +76,85 @@ def main(argv=None):
         sh_echo.setFormatter(formatter)
         log.addHandler(sh_echo)
 
-    for directory in args['DIR']:
-        #Render the path to the directory
-        if os.path.isabs(directory):
-            dir_path = directory
-        else:
-            dir_path = os.path.normpath(os.path.join(os.getcwd(), directory))
-
-        #Create the filename for the log
-        if args['--log-to']:
-            log_path = args['--log-to']
-        else:
-            logname = os.path.basename(dir_path) + '_validation.log'
-            log_path = os.path.join(dir_path, logname)
-
-        #Add the filehandler for the log if logging is enabled
-        if not args['--print-only']:
-            logs.replace_filehandler('openaccess_epub.commands.validate',
-                                     new_file=log_path,
-                                     level='INFO',
-                                     frmt='%(message)s')
-
-        #Iteration over the XML files
-        for xml_file in files_with_ext('.xml', directory,
-                                       recursive=args['--recursive']):
-            try:
-                document = lxml.etree.parse(xml_file)
-            except lxml.etree.XMLSyntaxError as err:
-                log.info('FAILED: Parse Error; {0} '.format(xml_file))
-                log.info(str(err))
-                continue
-
-            #Find its public id so we can identify the appropriate DTD
-            public_id = document.docinfo.public_id
-            #Get the dtd by the public id
-            try:
-                dtd = DTDS[public_id]
-            except KeyError as err:
-                log.info('FAILED: Unknown DTD Error; {0}'.format(xml_file))
-                log.info(str(err))
-
-            #Actual DTD validation
-            if not dtd.validate(document):
-                log.info('FAILED: DTD Validation Error; {0}'.format(xml_file))
-                log.info(str(dtd.error_log.filter_from_errors()))
-                #Clear the error_log
-                dtd._clear_error_log()
-            else:
-                if args['--record-pass']:
-                    log.info('PASSED: Validated by DTD; {0}'.format(xml_file))
+    run_log = None
+    if args['--run-log']:
+        run_log = runlog.RunLog(args['--run-log'], 'validate')
+
+    try:
+        for directory in args['DIR']:
+            validate_directory(directory, args, log, run_log)
+    finally:
+        if run_log is not None:
+            run_log.close()
+
+
+def validate_directory(directory, args, log, run_log=None):
+    """
+    Validates the XML files of a directory, recording the results in its log.
+    """
+    #Render the path to the directory
+    if os.path.isabs(directory):
+        dir_path = directory
+    else:
+        dir_path = os.path.normpath(os.path.join(os.getcwd(), directory))
+
+    #Create the filename for the log
+    if args['--log-to']:
+        log_path = args['--log-to']
+    else:
+        logname = os.path.basename(dir_path) + '_validation.log'
+        log_path = os.path.join(dir_path, logname)
+
+    #Add the filehandler for the log if logging is enabled
+    if not args['--print-only']:
+        logs.replace_filehandler('openaccess_epub.commands.validate',
+                                 new_file=log_path,
+                                 level='INFO',
+                                 frmt='%(message)s')
+
+    #Iteration over the XML files
+    for xml_file in files_with_ext('.xml', directory,
+                                   recursive=args['--recursive']):
+        with runlog.article(run_log, xml_file) as run:
+            with runlog.stage('validate'):
+                error = validate_file(xml_file, args, log)
+                if error is not None and run is not None:
+                    run.fail(error)
+
+
+def validate_file(xml_file, args, log):
+    """
+    Validates a single XML file against its DTD. Returns None if it passes,
+    otherwise a short description of the failure.
+    """
+    try:
+        document = lxml.etree.parse(xml_file)
+    except lxml.etree.XMLSyntaxError as err:
+        log.info('FAILED: Parse Error; {0} '.format(xml_file))
+        log.info(str(err))
+        return 'Parse Error'
+
+    #Find its public id so we can identify the appropriate DTD
+    public_id = document.docinfo.public_id
+    #Get the dtd by the public id
+    try:
+        dtd = DTDS[public_id]
+    except KeyError as err:
+        log.info('FAILED: Unknown DTD Error; {0}'.format(xml_file))
+        log.info(str(err))
+        return 'Unknown DTD Error'
+
+    #Actual DTD validation
+    if not dtd.validate(document):
+        log.info('FAILED: DTD Validation Error; {0}'.format(xml_file))
+        log.info(str(dtd.error_log.filter_from_errors()))
+        #Clear the error_log
+        dtd._clear_error_log()
+        return 'DTD Validation Error'
+    else:
+        if args['--record-pass']:
+            log.info('PASSED: Validated by DTD; {0}'.format(xml_file))
+        return None
 
 
 if __name__ == '__main__':
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+"""
+oaepub watch
+
+Watch a directory, converting XML files to EPUB as they arrive or change
+
+Usage:
+  watch [options] DIR
+
+Options:
+  -h --help             show this help message and exit
+  -v --version          show program version and exit
+  -s --silent           Print nothing to the console during execution
+  -V --verbosity=LEVEL  Set how much information is printed to the console
+                        during execution (one of: "CRITICAL", "ERROR",
+                        "WARNING", "INFO", "DEBUG") [default: WARNING]
+
+Watch Specific Options:
+  --no-epubcheck        Disable the use of epubcheck to validate EPUBs
+  --no-validate         Disable DTD validation of XML files during conversion.
+                        This is only advised if you have pre-validated the files
+                        (see 'oaepub validate -h')
+  -r --recursive        Watch subdirectories as well
+  -j --jobs=N           The number of conversions to run at once [default: 1]
+  --settle=SECONDS      How long a file, and its input-relative images, must be
+                        left unchanged before it is converted [default: 2]
+  --interval=SECONDS    How often to look for changes when polling [default: 1]
+  --poll                Poll for changes even where inotify is available
+  --existing            Also convert the XML files already present when
+                        watching starts
+  --journal=FILE        Record each conversion in FILE. With --existing, files
+                        which the journal shows were converted, and have not
+                        changed since, are skipped
+  -o --output=DIR       Directory in which to put the output. Default is set in
+                        config file (see 'oaepub configure where')
+  -i --images=DIR       Directory in which to find the images for the article
+                        to be converted to EPUB. Be sure to use wildcard
+                        filename matching with a "*", which will expand to the
+                        filename without extension. For more information and
+                        default configuration see the config file
+                        ('oaepub configure where')
+
+Logging Options:
+  --no-log-file         Disable logging to file
+  -l --log-to=FILE      Specify a single filepath to contain all log data
+  --log-level=LEVEL     Set the level for the logging (one of: "CRITICAL",
+                        "ERROR", "WARNING", "INFO", "DEBUG") [default: DEBUG]
+  --run-log=FILE        Append a JSON lines record of the stages, timing, and
+                        outcome of each article to FILE
+
+The 'watch' command is for a spool directory into which XML files (and their
+image directories) are delivered over time. It converts each new or changed XML
+file in the same way as the 'batch' command, without rescanning the directory:
+on Linux the changes are reported by inotify, elsewhere the directory is polled.
+A file is converted once it, and its input-relative image directory if there is
+one, have been left unchanged for the settling period, so that partially written
+deliveries are not picked up. Watching continues until interrupted with Ctrl-C,
+after which the conversions in progress are allowed to finish.
+"""
+
+#Standard Library modules
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import sys
+
+#Non-Standard Library modules
+from docopt import docopt
+
+#OpenAccess_EPUB modules
+from openaccess_epub._version import __version__
+from openaccess_epub.commands.batch import process_file
+import openaccess_epub.utils
+from openaccess_epub.utils.journal import BatchJournal
+import openaccess_epub.utils.logs as oae_logging
+import openaccess_epub.utils.runlog as runlog
+from openaccess_epub.utils.watch import Debouncer, make_watcher
+
+
+def main(argv=None):
+    args = docopt(__doc__,
+                  argv=argv,
+                  version='OpenAccess_EPUB v.' + __version__,
+                  options_first=True)
+
+    if args['--images'] is not None and '*' not in args['--images']:
+        sys.exit('Argument for --images option must contain "*"')
+    try:
+        jobs = int(args['--jobs'])
+        settle = float(args['--settle'])
+        interval = float(args['--interval'])
+    except ValueError:
+        sys.exit('--jobs, --settle and --interval must be numbers')
+    if jobs < 1:
+        sys.exit('Argument for --jobs must be at least 1')
+
+    directory = openaccess_epub.utils.get_absolute_path(args['DIR'])
+    if not os.path.isdir(directory):
+        sys.exit('{0} is not a directory'.format(directory))
+
+    #Basic logging configuration
+    oae_logging.config_logging(args['--no-log-file'],
+                               args['--log-to'],
+                               args['--log-level'],
+                               args['--silent'],
+                               args['--verbosity'])
+
+    #Load the config module, we do this after logging configuration
+    config = openaccess_epub.utils.load_config_module()
+
+    #Log files are written per article, from a background listener thread
+    queued_logging = None
+    if not args['--no-log-file']:
+        queued_logging = oae_logging.QueuedLogging(args['--log-level'])
+        queued_logging.start()
+
+    command_log = logging.getLogger('openaccess_epub.commands.watch')
+
+    run_log = None
+    if args['--run-log']:
+        run_log = runlog.RunLog(args['--run-log'], 'watch')
+
+    #Watching may be stopped and started again, so the journal is kept going
+    journal = None
+    if args['--journal']:
+        journal = BatchJournal(args['--journal'], resume=True)
+
+    exclude = build_directory_filter(directory)
+    watcher = make_watcher(directory, args['--recursive'], exclude, interval,
+                           polling=args['--poll'])
+    debouncer = Debouncer(settle, related=image_directories(config, args))
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    running = {}
+
+    def submit(path):
+        if exclude(path):
+            return
+        if journal is not None and journal.is_done(path):
+            command_log.info('Skipping converted file: {0}'.format(path))
+            return
+        command_log.info('Queueing {0}'.format(path))
+        running[path] = executor.submit(process_file, path, args, config,
+                                        journal, run_log,
+                                        log_file=queued_logging is not None,
+                                        keep_going=True)
+
+    try:
+        existing = [path for path in watcher.prime() if is_xml(path)]
+        command_log.info('Watching {0} with {1}'.format(
+            directory, type(watcher).__name__))
+        if args['--existing']:
+            for path in existing:
+                submit(path)
+        while True:
+            timeout = min(interval, settle / 2) if debouncer else interval
+            for path in watcher.changes(timeout):
+                if is_xml(path):
+                    debouncer.touch(path)
+            for path, future in list(running.items()):
+                if future.done():
+                    del running[path]
+            #A file which changes again while being converted is held back
+            #until that conversion finishes, then converted again
+            for path in debouncer.ready(hold=running):
+                submit(path)
+    except KeyboardInterrupt:
+        command_log.info('Stopping, waiting for conversions in progress')
+    finally:
+        watcher.close()
+        executor.shutdown(wait=True)
+        if journal is not None:
+            journal.close()
+        if run_log is not None:
+            run_log.close()
+        if queued_logging is not None:
+            queued_logging.stop()
+
+
+def is_xml(path):
+    return os.path.splitext(path)[1].lower() == '.xml'
+
+
+def build_directory_filter(directory):
+    """
+    Returns a function which is True for paths within an EPUB build directory
+    (one holding a mimetype file), so that the XML files written there by
+    conversions are not taken for new input.
+    """
+    def is_build_path(path):
+        current = path if os.path.isdir(path) else os.path.dirname(path)
+        while len(current) > len(directory):
+            if os.path.isfile(os.path.join(current, 'mimetype')):
+                return True
+            current = os.path.dirname(current)
+        return False
+    return is_build_path
+
+
+def image_directories(config, args):
+    """
+    Returns a function giving the image directories which may be used for an
+    XML file, so that the Debouncer waits for them to settle as well.
+    """
+    def related(path):
+        root_name = openaccess_epub.utils.file_root_name(path)
+        candidates = []
+        if args['--images'] is not None:
+            candidates.append(openaccess_epub.utils.get_absolute_path(
+                args['--images'].replace('*', root_name)))
+        elif config.use_input_relative_images:
+            input_dirname = os.path.dirname(path)
+            for images in config.input_relative_images:
+                images = images.replace('*', root_name)
+                candidates.append(os.path.normpath(os.path.join(input_dirname,
+                                                                images)))
+        return [images for images in candidates if os.path.isdir(images)]
+    return related
+
+
+if __name__ == '__main__':
+    main()
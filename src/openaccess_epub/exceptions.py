@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+openaccess_epub.exceptions defines the errors raised by OpenAccess_EPUB
+
+The library code raises these, rather than exiting the process, so that a
+failure on one article can be handled by whatever is processing it: the batch
+and collection commands log it and carry on with the next article, while the
+command line entry points are the only place they become exit statuses. All of
+them derive from :class:`OpenAccessEPUBError`.
+"""
+
+
+class OpenAccessEPUBError(Exception):
+    """
+    Base class for all errors raised by OpenAccess_EPUB.
+    """
+
+
+class ConfigurationError(OpenAccessEPUBError):
+    """
+    The installation is not configured, or the configuration is unusable.
+    """
+
+
+class InputError(OpenAccessEPUBError):
+    """
+    An input could not be located, retrieved, or recognized.
+    """
+
+
+class ArticleParseError(InputError):
+    """
+    An article XML file could not be read, or is not well-formed XML.
+    """
+
+
+class UnsupportedPublisherError(InputError):
+    """
+    The publisher of an input is not supported by OpenAccess_EPUB.
+    """
+
+
+class ArticleValidationError(OpenAccessEPUBError):
+    """
+    An article XML file did not pass validation against its DTD.
+
+    Attributes
+    ----------
+    error_log : lxml.etree._ListErrorLog or None
+        The errors reported by the validating DTD, `error_log`
+    """
+
+    def __init__(self, message, error_log=None):
+        super(ArticleValidationError, self).__init__(message)
+        self.error_log = error_log
+
+
+class UnknownDTDError(ArticleValidationError, KeyError):
+    """
+    An article XML file declares a DTD which OpenAccess_EPUB does not have.
+
+    This is also a KeyError, which was raised for this case previously.
+    """
+
+    def __str__(self):
+        return str(self.args[0])
+
+
+class ContentError(OpenAccessEPUBError):
+    """
+    An article contains content which cannot be converted.
+    """
+
+
+class OutputDirectoryError(OpenAccessEPUBError):
+    """
+    The output directory could not be created or may not be overwritten.
+    """
@@ -14,7 +14,7 @@ publisher-specific metadata methods required.
 """
 
 #Standard Library modules
-from collections import namedtuple
+from collections import OrderedDict
 import logging
 import os
 
@@ -28,7 +28,46 @@ from openaccess_epub._version import __version__
 
 log = logging.getLogger('openaccess_epub.navigation')
 
-navpoint = namedtuple('navpoint', 'id, label, playOrder, source, children')
+
+class NavPoint(object):
+    """
+    A single entry in the navigation structure.
+
+    Navigation for large collections holds one of these for every titled
+    section, figure, and table, so the class uses __slots__ rather than a
+    per-instance dict. Entries without children (figures, tables, and leaf
+    sections) share the empty tuple instead of each holding an empty list.
+
+    Attributes
+    ----------
+    id : str
+        The unique identifier for the entry, `id`
+    label : str
+        The text displayed for the entry, `label`
+    playOrder : str or None
+        The reading order position used by the NCX, `playOrder`
+    source : str
+        The href of the entry's target in the content documents, `source`
+    children : list or tuple of NavPoint
+        Nested entries, `children`
+    """
+
+    __slots__ = ('id', 'label', 'playOrder', 'source', 'children')
+
+    def __init__(self, id, label, playOrder, source, children=()):
+        self.id = id
+        self.label = label
+        self.playOrder = playOrder
+        self.source = source
+        self.children = children
+
+    def __repr__(self):
+        return 'NavPoint(id={0!r}, label={1!r}, playOrder={2!r}, source={3!r}, \
+children={4!r})'.format(self.id, self.label, self.playOrder, self.source,
+                        self.children)
+
+#Retained so that existing callers of the former namedtuple keep working
+navpoint = NavPoint
 
 
 class Navigation(object):
@@ -89,14 +128,16 @@ without a publisher!''')
 
     def map_navigation(self):
         """
-        This is a wrapper for depth-first recursive analysis of the article
+        This is a wrapper for the depth-first analysis of the article
         """
         #All articles should have titles
         title_id = 'titlepage-{0}'.format(self.article_doi)
         title_label = self.article.publisher.nav_title()
         title_source = 'main.{0}.xhtml#title'.format(self.article_doi)
+        #Only collections nest further navpoints under the title
         title_navpoint = navpoint(title_id, title_label, self.play_order,
-                                  title_source, [])
+                                  title_source,
+                                  [] if self.collection else ())
         self.nav.append(title_navpoint)
         #When processing a collection of articles, we will want all subsequent
         #navpoints for this article to be located under the title
@@ -107,8 +148,7 @@ without a publisher!''')
 
         #If the article has a body, we'll need to parse it for navigation
         if self.article.body is not None:
-            #Here is where we invoke the recursive parsing!
-            for nav_pt in self.recursive_article_navmap(self.article.body):
+            for nav_pt in self.article_navmap(self.article.body):
                 nav_insertion.append(nav_pt)
 
         #Add a navpoint to the references if appropriate
@@ -117,224 +157,263 @@ without a publisher!''')
             ref_label = 'References'
             ref_source = 'biblio.{0}.xhtml#references'.format(self.article_doi)
             ref_navpoint = navpoint(ref_id, ref_label, self.play_order,
-                                    ref_source, [])
+                                    ref_source)
             nav_insertion.append(ref_navpoint)
 
-    def recursive_article_navmap(self, src_element, depth=0, first=True):
+    def assign_ids(self, article):
         """
-        This function recursively traverses the content of an input article to
-        add the correct elements to the NCX file's navMap and Lists.
+        Gives an id to each element of the article's body which has none but
+        would be given one by process(), in the same order, without adding the
+        article to the navigation.
+
+        The rendered content picks these ids up, so in collection mode this
+        allows an article's content to be rendered before it is processed.
         """
-        if depth > self.nav_depth:
-            self.nav_depth = depth
-        navpoints = []
-        tagnames = ['sec', 'fig', 'table-wrap']
-        for child in src_element:
-            try:
-                tagname = child.tag
-            except AttributeError:
-                continue
-            else:
-                if tagname not in tagnames:
+        if article.body is None:
+            return
+        tagnames = ('sec', 'fig', 'table-wrap')
+        stack = [iter(article.body)]
+        while stack:
+            for child in stack[-1]:
+                if child.tag not in tagnames:
                     continue
+                if 'id' not in child.attrib:
+                    child.attrib['id'] = self.auto_id
+                #Only titled sections are descended into by article_navmap()
+                child_title = child.find('title')
+                if child.tag == 'sec' and child_title is not None and \
+                        element_methods.all_text(child_title):
+                    stack.append(iter(child))
+                    break
+            else:
+                stack.pop()
 
-            #Safely handle missing id attributes
-            if 'id' not in child.attrib:
-                child.attrib['id'] = self.auto_id
+    def article_navmap(self, src_element):
+        """
+        Traverses the content of an input article to add the correct elements
+        to the NCX file's navMap and Lists.
+
+        The traversal is depth-first but uses an explicit stack instead of
+        recursion, so arbitrarily deep section nesting is safe. Navpoints are
+        given their playOrder in document order, parents before children.
+
+        Parameters
+        ----------
+        src_element : lxml.etree._Element
+            The element whose sec, fig, and table-wrap children are mapped,
+            normally the article body.
+
+        Returns
+        -------
+        navpoints : list of NavPoint
+            The navpoints for the titled top-level sections, each holding
+            their own subsections as children.
+        """
+        tagnames = ('sec', 'fig', 'table-wrap')
+        navpoints = []
+        #Each frame holds an iterator over an element's children, the depth
+        #of those children, and the navpoint whose children they become
+        stack = [(iter(src_element), 0, None)]
+        while stack:
+            children, depth, parent = stack[-1]
+            if depth > self.nav_depth:
+                self.nav_depth = depth
+            siblings = navpoints if parent is None else parent.children
+            for child in children:
+                if child.tag not in tagnames:
+                    continue
 
-            #If in collection mode, we'll prepend the article DOI to avoid
-            #collisions
-            if self.collection:
-                child_id = '-'.join([self.article_doi,
-                                     child.attrib['id']])
+                #Safely handle missing id attributes; the rendered content
+                #picks these up, so they must be set on the source tree
+                if 'id' not in child.attrib:
+                    child.attrib['id'] = self.auto_id
+
+                #If in collection mode, we'll prepend the article DOI to avoid
+                #collisions
+                if self.collection:
+                    child_id = '-'.join([self.article_doi,
+                                         child.attrib['id']])
+                else:
+                    child_id = child.attrib['id']
+
+                #Attempt to infer the correct text as a label
+                #Skip the element if we cannot
+                child_title = child.find('title')
+                if child_title is None:
+                    continue  # If there is no immediate title, skip this element
+                label = element_methods.all_text(child_title)
+                if not label:
+                    continue  # If no text in the title, skip this element
+                source = 'main.{0}.xhtml#{1}'.format(self.article_doi,
+                                                   child.attrib['id'])
+                if child.tag == 'sec':
+                    nav_pt = navpoint(child_id, label, self.play_order,
+                                      source, [])
+                    siblings.append(nav_pt)
+                    #Descend into the section, resuming here once it is done
+                    stack.append((iter(child), depth + 1, nav_pt))
+                    break
+                #figs and table-wraps do not have children
+                elif child.tag == 'fig':  # Add navpoints to list_of_figures
+                    self.figures_list.append(navpoint(child.attrib['id'],
+                                                      label,
+                                                      None,
+                                                      source))
+                elif child.tag == 'table-wrap':  # Add navpoints to list_of_tables
+                    self.tables_list.append(navpoint(child.attrib['id'],
+                                                     label,
+                                                     None,
+                                                     source))
             else:
-                child_id = child.attrib['id']
-
-            #Attempt to infer the correct text as a label
-            #Skip the element if we cannot
-            child_title = child.find('title')
-            if child_title is None:
-                continue  # If there is no immediate title, skip this element
-            label = element_methods.all_text(child_title)
-            if not label:
-                continue  # If no text in the title, skip this element
-            source = 'main.{0}.xhtml#{1}'.format(self.article_doi,
-                                               child.attrib['id'])
-            if tagname == 'sec':
-                children = self.recursive_article_navmap(child, depth=depth + 1)
-                navpoints.append(navpoint(child_id,
-                                          label,
-                                          self.play_order,
-                                          source,
-                                          children))
-            #figs and table-wraps do not have children
-            elif tagname == 'fig':  # Add navpoints to list_of_figures
-                self.figures_list.append(navpoint(child.attrib['id'],
-                                                  label,
-                                                  None,
-                                                  source,
-                                                  []))
-            elif tagname == 'table-wrap':  # Add navpoints to list_of_tables
-                self.tables_list.append(navpoint(child.attrib['id'],
-                                                 label,
-                                                 None,
-                                                 source,
-                                                 []))
+                stack.pop()
+                if parent is not None and not parent.children:
+                    parent.children = ()
         return navpoints
 
-    def render_EPUB2(self, location):
+    def render_EPUB2(self, location, registry=None):
         """
         Creates the NCX specified file for EPUB2
+
+        The document is streamed to file with lxml's incremental writer, so the
+        navMap is never held in memory as a second tree. If a BuildRegistry is
+        supplied as `registry`, the file is registered with it, and sources
+        whose targets have moved (see BuildRegistry.locate()) are updated.
         """
+        ncx_ns = 'http://www.daisy.org/z3986/2005/ncx/'
+        locate = _locator(registry)
 
-        def make_navlabel(text):
+        def ncx(tag):
+            return '{' + ncx_ns + '}' + tag
+
+        def write_navlabel(xf, text):
             """
-            Creates and returns a navLabel element with the supplied text.
+            Writes a navLabel element with the supplied text.
             """
-            navlabel = etree.Element('navLabel')
-            navlabel_text = etree.SubElement(navlabel, 'text')
-            navlabel_text.text = text
-            return navlabel
-
-        def make_navMap(nav=None):
-            if nav is None:
-                nav_element = etree.Element('navMap')
-                for nav_point in self.nav:
-                    nav_element.append(make_navMap(nav=nav_point))
-            else:
-                nav_element = etree.Element('navPoint')
-                nav_element.attrib['id'] = nav.id
-                nav_element.attrib['playOrder'] = nav.playOrder
-                nav_element.append(make_navlabel(nav.label))
-                content_element = etree.SubElement(nav_element, 'content')
-                content_element.attrib['src'] = nav.source
-                for child in nav.children:
-                    nav_element.append(make_navMap(nav=child))
-            return nav_element
-        root = etree.XML('''\
-<?xml version="1.0"?>\
-<ncx version="2005-1" xmlns="http://www.daisy.org/z3986/2005/ncx/">\
-<head>\
-<meta name="dtb:uid" content="{uid}"/>\
-<meta name="dtb:depth" content="{depth}"/>\
-<meta name="dtb:totalPageCount" content="0"/>\
-<meta name="dtb:maxPageNumber" content="0"/>\
-<meta name="dtb:generator" content="OpenAccess_EPUB {version}"/>\
-</head>\
-</ncx>'''.format(**{'uid': ','.join(self.all_dois),
-                    'depth': self.nav_depth,
-                    'version': __version__}))
-        document = etree.ElementTree(root)
-        ncx = document.getroot()
-
-        #Create the docTitle element
-        doctitle = etree.SubElement(ncx, 'docTitle')
-        doctitle_text = etree.SubElement(doctitle, 'text')
-        doctitle_text.text = self.title
-
-        #Create the docAuthor elements
-        for contributor in self.contributors:
-            if contributor.role == 'author':
-                docauthor = etree.SubElement(ncx, 'docAuthor')
-                docauthor_text = etree.SubElement(docauthor, 'text')
-                docauthor_text.text = contributor.name
-
-        #Create the navMap element
-        ncx.append(make_navMap())
-
-        if self.figures_list:
-            navlist = etree.SubElement(ncx, 'navList')
-            navlist.append(make_navlabel('List of Figures'))
-            for nav_pt in self.figures_list:
-                navtarget = etree.SubElement(navlist, 'navTarget')
-                navtarget.attrib['id'] = nav_pt.id
-                navtarget.append(self.make_navlabel(nav_pt.label))
-                content = etree.SubElement(navtarget, 'content')
-                content.attrib['src'] = nav_pt.source
-
-        if self.tables_list:
-            navlist = etree.SubElement(ncx, 'navList')
-            navlist.append(make_navlabel('List of Tables'))
-            for nav_pt in self.tables_list:
-                navtarget = etree.SubElement(navlist, 'navTarget')
-                navtarget.attrib['id'] = nav_pt.id
-                navtarget.append(self.make_navlabel(nav_pt.label))
-                content = etree.SubElement(navtarget, 'content')
-                content.attrib['src'] = nav_pt.source
-
-        with open(os.path.join(location, 'EPUB', 'toc.ncx'), 'wb') as output:
-            output.write(etree.tostring(document, encoding='utf-8', pretty_print=True))
-
-    def render_EPUB3(self, location):
-        def make_nav(nav=None):
-            if nav is None:
-                nav_element = etree.Element('ol')
-                for nav_point in self.nav:
-                    nav_element.append(make_nav(nav=nav_point))
-            else:
-                nav_element = etree.Element('li')
-                a = etree.SubElement(nav_element, 'a')
-                a.attrib['href'] = nav.source
-                a.text = nav.label
-                if nav.children:
-                    ol = etree.SubElement(nav_element, 'ol')
-                    for child in nav.children:
-                        ol.append(make_nav(nav=child))
-            return nav_element
-
-        root = etree.XML('''\
-<?xml version="1.0"?>\
-<!DOCTYPE html>\
-<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\
-<head>\
-<link rel="stylesheet" type="text/css" href="css/default.css" />\
-</head>\
-</html>''')
-
-        document = etree.ElementTree(root)
-        html = document.getroot()
-        title = etree.SubElement(html[0], 'title')
-        title.text = self.title
-
-        body = etree.SubElement(html, 'body')  # Create the body element
-        #h1 = etree.SubElement(body, 'h1')
-        #h1.text = self.title
-        #Create the prinary nav element
-        nav = etree.SubElement(body, 'nav')
-        nav.attrib['{http://www.idpf.org/2007/ops}type'] = 'toc'
-        nav.attrib['id'] = 'toc'
-
-        #Create the title
-        h2 = etree.SubElement(nav, 'h2')
-        h2.text = 'Table of Contents'
-
-        #Stuff
-        nav.append(make_nav())
-
-        if self.figures_list:
-            nav = etree.SubElement(body, 'nav')
-            h2 = etree.SubElement(nav, 'h2')
-            h2.text = 'List of Figures'
-            ol = etree.SubElement(nav, 'ol')
-            for nav_pt in self.figures_list:
-                li = etree.SubElement(ol, 'li')
-                a = etree.SubElement(li, 'a')
-                a.attrib['href'] = nav_pt.source
-                a.text = nav_pt.label
-
-        if self.tables_list:
-            nav = etree.SubElement(body, 'nav')
-            h2 = etree.SubElement(nav, 'h2')
-            h2.text = 'List of Tables'
-            ol = etree.SubElement(nav, 'ol')
-            for nav_pt in self.figures_list:
-                li = etree.SubElement(ol, 'li')
-                a = etree.SubElement(li, 'a')
-                a.attrib['href'] = nav_pt.source
-                a.text = nav_pt.label
-
-        with open(os.path.join(location, 'EPUB', 'nav.xhtml'), 'wb') as output:
-            output.write(etree.tostring(document, encoding='utf-8', pretty_print=True))
+            with xf.element(ncx('navLabel')):
+                _write_leaf(xf, ncx('text'), text)
+
+        def write_navlist(xf, label, nav_list):
+            with xf.element(ncx('navList')):
+                write_navlabel(xf, label)
+                for nav_pt in nav_list:
+                    with xf.element(ncx('navTarget'), id=nav_pt.id):
+                        write_navlabel(xf, nav_pt.label)
+                        _write_leaf(xf, ncx('content'),
+                                    attrib={'src': locate(nav_pt.source)})
+
+        head_meta = [('dtb:uid', ','.join(self.all_dois)),
+                     ('dtb:depth', str(self.nav_depth)),
+                     ('dtb:totalPageCount', '0'),
+                     ('dtb:maxPageNumber', '0'),
+                     ('dtb:generator', 'OpenAccess_EPUB {0}'.format(__version__))]
+
+        ncx_path = os.path.join(location, 'EPUB', 'toc.ncx')
+        with etree.xmlfile(ncx_path, encoding='utf-8') as xf:
+            with xf.element(ncx('ncx'), nsmap={None: ncx_ns},
+                            version='2005-1'):
+                with xf.element(ncx('head')):
+                    for name, content in head_meta:
+                        meta_attrib = OrderedDict([('name', name),
+                                                   ('content', content)])
+                        _write_leaf(xf, ncx('meta'), attrib=meta_attrib)
+
+                #Create the docTitle element
+                with xf.element(ncx('docTitle')):
+                    _write_leaf(xf, ncx('text'), self.title)
+
+                #Create the docAuthor elements
+                for contributor in self.contributors:
+                    if contributor.role == 'author':
+                        with xf.element(ncx('docAuthor')):
+                            _write_leaf(xf, ncx('text'), contributor.name)
+
+                #Create the navMap element
+                with xf.element(ncx('navMap')):
+                    def open_navpoint(nav):
+                        attrib = OrderedDict([('id', nav.id),
+                                     ('playOrder', nav.playOrder)])
+                        navpoint_element = xf.element(ncx('navPoint'), attrib)
+                        navpoint_element.__enter__()
+                        write_navlabel(xf, nav.label)
+                        _write_leaf(xf, ncx('content'),
+                                    attrib={'src': locate(nav.source)})
+                        return navpoint_element
+
+                    _write_nav_tree(self.nav, open_navpoint)
+
+                if self.figures_list:
+                    write_navlist(xf, 'List of Figures', self.figures_list)
+
+                if self.tables_list:
+                    write_navlist(xf, 'List of Tables', self.tables_list)
+
+        if registry is not None:
+            registry.register('toc.ncx', item_id='ncx')
+
+    def render_EPUB3(self, location, registry=None):
+        """
+        Creates the XHTML Navigation Document for EPUB3
+
+        Like render_EPUB2, this streams the document to file and registers it
+        with `registry` if one is supplied.
+        """
+        xhtml_ns = 'http://www.w3.org/1999/xhtml'
+        ops_ns = 'http://www.idpf.org/2007/ops'
+        locate = _locator(registry)
+
+        def html(tag):
+            return '{' + xhtml_ns + '}' + tag
+
+        def write_list(xf, heading, nav_list):
+            with xf.element(html('nav')):
+                _write_leaf(xf, html('h2'), heading)
+                with xf.element(html('ol')):
+                    for nav_pt in nav_list:
+                        with xf.element(html('li')):
+                            _write_leaf(xf, html('a'), nav_pt.label,
+                                        {'href': locate(nav_pt.source)})
+
+        nav_path = os.path.join(location, 'EPUB', 'nav.xhtml')
+        with etree.xmlfile(nav_path, encoding='utf-8') as xf:
+            xf.write_doctype('<!DOCTYPE html>')
+            nsmap = {None: xhtml_ns, 'epub': ops_ns}
+            with xf.element(html('html'), nsmap=nsmap):
+                with xf.element(html('head')):
+                    link_attrib = OrderedDict([('rel', 'stylesheet'),
+                                      ('type', 'text/css'),
+                                      ('href', 'css/default.css')])
+                    _write_leaf(xf, html('link'), attrib=link_attrib)
+                    _write_leaf(xf, html('title'), self.title)
+
+                with xf.element(html('body')):
+                    #Create the primary nav element
+                    nav_attrib = OrderedDict([('{' + ops_ns + '}type', 'toc'),
+                                     ('id', 'toc')])
+                    with xf.element(html('nav'), nav_attrib):
+                        _write_leaf(xf, html('h2'), 'Table of Contents')
+                        with xf.element(html('ol')):
+                            def open_item(nav):
+                                item = xf.element(html('li'))
+                                item.__enter__()
+                                _write_leaf(xf, html('a'), nav.label,
+                                            {'href': locate(nav.source)})
+                                if not nav.children:
+                                    return item
+                                #Nested navpoints go in a list of their own
+                                nested = xf.element(html('ol'))
+                                nested.__enter__()
+                                return _ExitAll(nested, item)
+
+                            _write_nav_tree(self.nav, open_item)
+
+                    if self.figures_list:
+                        write_list(xf, 'List of Figures', self.figures_list)
+
+                    if self.tables_list:
+                        write_list(xf, 'List of Tables', self.tables_list)
+
+        if registry is not None:
+            registry.register('nav.xhtml', item_id='htmltoc', properties='nav')
 
     @property
     def play_order(self):
@@ -347,3 +426,66 @@ without a publisher!''')
         id_gen = 'OAE-{0}'.format(self._auto_id)
         log.debug('Navigation element missing ID: assigned {0}'.format(id_gen))
         return id_gen
+
+
+class _ExitAll(object):
+    """
+    Closes several already-entered xmlfile element contexts, innermost first.
+    """
+
+    __slots__ = ('contexts',)
+
+    def __init__(self, *contexts):
+        self.contexts = contexts
+
+    def __exit__(self, *exc_info):
+        for context in self.contexts:
+            context.__exit__(*exc_info)
+
+
+def _locator(registry):
+    """
+    Returns a function giving the current href of a navigation source, which
+    only differs if the BuildRegistry `registry` records its target as moved.
+    """
+    if registry is None:
+        return lambda source: source
+    return registry.locate
+
+
+def _write_leaf(xf, tag, text=None, attrib=None):
+    """
+    Writes an element with optional text and no children to an lxml xmlfile.
+    """
+    with xf.element(tag, attrib or {}):
+        if text:
+            xf.write(text)
+
+
+def _write_nav_tree(nav, open_element):
+    """
+    Writes a tree of navpoints to an lxml xmlfile without recursion.
+
+    Parameters
+    ----------
+    nav : list of NavPoint
+        The top-level navpoints to write.
+    open_element : callable
+        Called with each navpoint in document order, it must write the
+        navpoint's opening content and return an entered context for it, to be
+        exited once all of the navpoint's children have been written.
+    """
+    iterators = [iter(nav)]
+    open_contexts = []
+    while iterators:
+        for nav_pt in iterators[-1]:
+            context = open_element(nav_pt)
+            if nav_pt.children:
+                open_contexts.append(context)
+                iterators.append(iter(nav_pt.children))
+                break
+            context.__exit__(None, None, None)
+        else:
+            iterators.pop()
+            if open_contexts:
+                open_contexts.pop().__exit__(None, None, None)
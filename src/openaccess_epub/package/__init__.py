@@ -15,31 +15,35 @@ document represents.
 #general and capable of producing package info for EPUB2, and EPUB3.
 
 #Standard Library modules
-from collections import namedtuple
+from collections import OrderedDict
 import logging
 import os
-import datetime
 
 #Non-Standard Library modules
 from lxml import etree
 
 #OpenAccess_EPUB modules
 #from openaccess_epub._version import __version__
-from openaccess_epub.utils import OrderedSet
+from openaccess_epub.utils import OrderedSet, build_datetime, write_xml
+from openaccess_epub.utils.registry import BuildRegistry
 
 log = logging.getLogger('openaccess_epub.package')
 
-spine_item = namedtuple('Spine_Item', 'idref, linear')
-
 
 class Package(object):
     """
     The Package class
+
+    The manifest and spine are rendered from `registry`, a BuildRegistry with
+    which every file placed in the EPUB directory should be registered. One is
+    created if not supplied.
     """
 
-    def __init__(self, collection=False, title=''):
+    def __init__(self, collection=False, title='', registry=None):
         self.collection = collection
-        self.spine_list = []
+        if registry is None:
+            registry = BuildRegistry()
+        self.registry = registry
 
         self.article = None
         self.article_doi = None
@@ -58,7 +62,7 @@ class Package(object):
         self.publishers = OrderedSet()        # 0+ All publishers of content
         self.relation = OrderedSet()          # 0+ Not used yet
         self.rights = OrderedSet()            # 1  License, details TBD
-        self.rights_associations = {}         # Keeps track per-article
+        self.rights_associations = OrderedDict()  # Keeps track per-article
         self.source = OrderedSet()            # 0+ Not used yet
         self.subjects = OrderedSet()          # 0+ Subjects covered in doc
         self.title = None                     # 1  Title of publication
@@ -73,13 +77,11 @@ class Package(object):
         proper references in the EPUB spine.
 
         This method may only be called once unless the Package was instantiated
-        in collection mode using ``Package(collection=True)``. It places entries
-        in an internal spine list for the Main Content Document, the
-        Bibliographic Content Document (if there are ref elements in Back), and
-        the Tables Content Document (if there are table elements). It then
-        employs the publisher specific methods for extracting article metadata
-        using the article's publisher attribute (an instance of a Publisher
-        class).
+        in collection mode using ``Package(collection=True)``. It employs the
+        publisher specific methods for extracting article metadata using the
+        article's publisher attribute (an instance of a Publisher class). The
+        spine entries for the article's content documents are registered when
+        those documents are rendered.
 
         Parameters
         ----------
@@ -100,23 +102,6 @@ without a publisher!''')
         self.article_doi = self.article.doi.split('/')[1]
         self.all_dois.append(self.article.doi)
 
-        #Analyze the article to add entries to the spine
-        dash_doi = self.article_doi.replace('.', '-')
-
-        #Entry for the main content document
-        main_idref = 'main-{0}-xhtml'.format(dash_doi)
-        self.spine_list.append(spine_item(main_idref, True))
-
-        #Entry for the biblio content document
-        biblio_idref = 'biblio-{0}-xhtml'.format(dash_doi)
-        if self.article.root.xpath('./back/ref-list/ref'):
-                self.spine_list.append(spine_item(biblio_idref, True))
-
-        #Entry for the tables content document
-        tables_idref = 'tables-{0}-xhtml'.format(dash_doi)
-        if self.article.publisher.has_out_of_flow_tables():
-            self.spine_list.append(spine_item(tables_idref, False))
-
         self.acquire_metadata()
 
     def acquire_metadata(self):
@@ -155,52 +140,24 @@ without a publisher!''')
         else:
             self.rights_associations[art_rights].append(self.article.doi)
 
-    def file_manifest(self, location):
+    def manifest_items(self):
         """
-        An iterator through the files in a location which yields item elements
+        An iterator through the registered files which yields item elements
         suitable for insertion into the package manifest.
         """
-        #Maps file extensions to mimetypes
-        mimetypes = {'.jpg': 'image/jpeg',
-                     '.jpeg': 'image/jpeg',
-                     '.xml': 'application/xhtml+xml',
-                     '.png': 'image/png',
-                     '.css': 'text/css',
-                     '.ncx': 'application/x-dtbncx+xml',
-                     '.gif': 'image/gif',
-                     '.tif': 'image/tif',
-                     '.pdf': 'application/pdf',
-                     '.xhtml': 'application/xhtml+xml',
-                     '.ttf': 'application/vnd.ms-opentype',
-                     '.otf': 'application/vnd.ms-opentype'}
-
-        current_dir = os.getcwd()
-        os.chdir(location)
-        for dirpath, _dirnames, filenames in os.walk('.'):
-            dirpath = dirpath[2:]  # A means to avoid dirpath prefix of './'
-            for fn in filenames:
-                fn_ext = os.path.splitext(fn)[-1]
-                item = etree.Element('item')
-                #Here we set three attributes: href, media-type, and id
-                if not dirpath:
-                    item.attrib['href'] = fn
-                else:
-                    item.attrib['href'] = '/'.join([dirpath, fn])
-                item.attrib['media-type'] = mimetypes[fn_ext]
-                #Special handling for common image types
-                if fn_ext in ['.jpg', '.png', '.tif', '.jpeg']:
-                    #the following lines assume we are using the convention
-                    #where the article doi is prefixed by 'images-'
-                    item.attrib['id'] = '-'.join([dirpath[7:],
-                                                  fn.replace('.', '-')])
-                else:
-                    item.attrib['id'] = fn.replace('.', '-')
-                yield item
-        os.chdir(current_dir)
+        for registered in self.registry:
+            item = etree.Element('item')
+            item.attrib['href'] = registered.href
+            item.attrib['media-type'] = registered.media_type
+            item.attrib['id'] = registered.id
+            if registered.properties is not None:
+                item.attrib['properties'] = registered.properties
+            yield item
 
     def make_element(self, tagname, doc, attrs={}, text=''):
         new_element = etree.Element(self.ns_rectify(tagname, doc))
-        for kwd, val in attrs.items():
+        #Sorted, so attribute order never depends on dict ordering
+        for kwd, val in sorted(attrs.items()):
             if val is None:  # None values will not become attributes
                 continue
             new_element.attrib[self.ns_rectify(kwd, doc)] = val
@@ -228,7 +185,7 @@ without a publisher!''')
         document = etree.ElementTree(root)
         return document
 
-    def render_EPUB2(self, location):
+    def render_EPUB2(self, location, pretty_print=False):
         log.info('Rendering Package Document for EPUB2')
         document = self._init_package_doc(version='2.0')
         package = document.getroot()
@@ -342,23 +299,21 @@ applies.'''
 
         #Make the Manifest
         manifest = etree.SubElement(package, 'manifest')
-        for item in self.file_manifest(os.path.join(location, 'EPUB')):
-            if item.attrib['id'] == 'toc-ncx':
-                item.attrib['id'] = 'ncx'  # Special id for toc.ncx
+        for item in self.manifest_items():
             manifest.append(item)
 
         #Make the Spine
         spine = etree.SubElement(package, 'spine')
         spine.attrib['toc'] = 'ncx'
-        for item in self.spine_list:
+        for item in self.registry.spine:
             itemref = etree.SubElement(spine, 'itemref')
             itemref.attrib['idref'] = item.idref
             itemref.attrib['linear'] = 'yes' if item.linear else 'no'
 
-        with open(os.path.join(location, 'EPUB', 'package.opf'), 'wb') as output:
-            output.write(etree.tostring(document, encoding='utf-8', pretty_print=True))
+        write_xml(document, os.path.join(location, 'EPUB', 'package.opf'),
+                  pretty_print)
 
-    def render_EPUB3(self, location):
+    def render_EPUB3(self, location, pretty_print=False):
         log.info('Rendering Package Document for EPUB3')
         document = self._init_package_doc(version='3.0')
         package = document.getroot()
@@ -367,7 +322,8 @@ applies.'''
         metadata = etree.SubElement(package, 'metadata')
 
         #Metadata: Identifier
-        today = datetime.date.today().strftime('%Y.%m.%d')
+        built = build_datetime()
+        today = built.strftime('%Y.%m.%d')
         if not self.collection:  # Identifier for single article
             ident = self.make_element('dc:identifier',
                                       document,
@@ -486,13 +442,13 @@ applies.'''
         #EPUB3 differs significantly from EPUB2, only one dc:date is allowed
         #and it must be the date of EPUB publication
         #Must also be of proper format: http://www.w3.org/TR/NOTE-datetime
-        simple_date = datetime.date.today().strftime('%Y-%m-%d')
+        simple_date = built.strftime('%Y-%m-%d')
         metadata.append(self.make_element('dc:date',
                                           document,
                                           {'id': 'pub-date'},
                                           simple_date))
         #Must have meta with dcterms:modified
-        now = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        now = built.strftime('%Y-%m-%dT%H:%M:%SZ')
         metadata.append(self.make_element('meta',
                                           document,
                                           {'property': 'dcterms:modified'},
@@ -559,20 +515,15 @@ applies.'''
 
         #Make the Manifest
         manifest = etree.SubElement(package, 'manifest')
-        for item in self.file_manifest(os.path.join(location, 'EPUB')):
-            if item.attrib['id'] == 'nav-xhtml':
-                item.attrib['id'] = 'htmltoc'  # Special id for nav.xhtml
-                item.attrib['properties'] = 'nav'
-            if item.attrib['id'] == 'toc-ncx':
-                item.attrib['id'] = 'ncx'  # Special id for toc.ncx
+        for item in self.manifest_items():
             manifest.append(item)
 
         #Make the Spine
         spine = etree.SubElement(package, 'spine')
-        for item in self.spine_list:
+        for item in self.registry.spine:
             itemref = etree.SubElement(spine, 'itemref')
             itemref.attrib['idref'] = item.idref
             itemref.attrib['linear'] = 'yes' if item.linear else 'no'
 
-        with open(os.path.join(location, 'EPUB', 'package.opf'), 'wb') as output:
-            output.write(etree.tostring(document, encoding='utf-8', pretty_print=True))
+        write_xml(document, os.path.join(location, 'EPUB', 'package.opf'),
+                  pretty_print)
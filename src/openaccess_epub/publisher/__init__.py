@@ -7,26 +7,27 @@ conversion
 
 #Standard Library modules
 import os
-from collections import namedtuple
+from collections import namedtuple, Counter
 from copy import copy, deepcopy
+import functools
 from importlib import import_module
+import importlib.util
 import logging
+import re
 import sys
-try:
-    from importlib.abc import SourceLoader
-except ImportError:  # Compatibility for Python 3.0 and 3.1
-    from importlib.abc import PyLoader as SourceLoader
+import threading
 import weakref
+from xml.sax.saxutils import escape, unescape
 
 #Non-Standard Library modules
 from lxml import etree
 
 #OpenAccess_EPUB modules
 from openaccess_epub.utils.element_methods import *
-from openaccess_epub.utils import publisher_plugin_location
+from openaccess_epub.utils import publisher_plugin_location, write_xml
 
 __all__ = ['contributor_tuple', 'date_tuple', 'identifier_tuple',
-           'import_by_doi', 'Publisher']
+           'import_by_doi', 'memoized', 'Publisher', 'PublisherRegistry']
 
 log = logging.getLogger('openaccess_epub.publisher')
 
@@ -39,75 +40,141 @@ identifier_tuple = namedtuple('Identifier', 'value, scheme')
 ################################################################################
 #The code in this section is devoting to creating easy publisher-wise extension
 #for rapid testing and development without modifying installed source
-plugin_dir = publisher_plugin_location()
-doi_map_file = os.path.join(plugin_dir, 'doi_map')
 
+#The built-in publisher modules, by DOI prefix. A doi_map file in the
+#publisher_plugins directory may add to or override these
 doi_map = {'10.1371': 'plos',
            '10.3389': 'frontiers'}
 
-#By inserting at the beginning, the plugin directory will override the source
-#modules if they exist
-__path__.insert(0, publisher_plugin_location())
 
-if not os.path.isfile(doi_map_file):
-    os.makedirs(os.path.dirname(doi_map_file))
-    with open(doi_map_file, 'a'):
-        os.utime(doi_map_file, None)
-
-with open(doi_map_file, 'r') as mapping:
-    for line in mapping:
-        key, val = line.split(':')
-        doi_map[key.strip()] = val.strip()
-
-
-class PublisherFinder(object):
-    prefix = 'openaccess_epub.publisher'
-
-    def __init__(self, path_entry):
-        if path_entry not in __path__:
-            raise ImportError
-        else:
-            self.path_entry = path_entry
-            return None
-
-    def find_module(self, fullname, path=None):
-        path = path or self.path_entry
-        name = fullname.split('.')[-1]
-        for fname in [os.path.join(i, name + '.py') for i in __path__]:
-            if os.path.isfile(fname):
-                return PublisherLoader(path)
-        return None
+class PublisherRegistry(object):
+    """
+    Finds and loads the publisher module for a DOI prefix.
+
+    Nothing is read from disk until a publisher is first asked for: the index
+    of DOI prefixes to modules, from `builtin` and the doi_map file of the
+    publisher_plugins directory, is then built once. A module is loaded on
+    first use, from the plugin directory if it holds a file of that name (so
+    that plugins override the installed modules), and is afterwards returned
+    without any lookup on disk. No import hooks are installed; plugin modules
+    are loaded from their files directly.
+
+    Parameters
+    ----------
+    builtin : dict, optional
+        The module names of the built-in publishers, by DOI prefix
+    plugin_dir : str, optional
+        The publisher_plugins directory, by default the one in the cache
+        location
+    """
 
+    def __init__(self, builtin=None, plugin_dir=None):
+        self.builtin = doi_map if builtin is None else builtin
+        self.plugin_dir = plugin_dir
+        self._index = None
+        self._modules = {}
+        self._lock = threading.Lock()
 
-class PublisherLoader(SourceLoader):
+    def index(self):
+        """
+        Returns the index of DOI prefixes to (module name, plugin file path or
+        None), building it on the first call.
+        """
+        with self._lock:
+            if self._index is None:
+                self._index = self._build_index()
+            return self._index
+
+    def _build_index(self):
+        plugin_dir = self.plugin_dir or publisher_plugin_location()
+        names = dict(self.builtin)
+        doi_map_file = os.path.join(plugin_dir, 'doi_map')
+        if os.path.isfile(doi_map_file):
+            with open(doi_map_file, 'r') as mapping:
+                for line in mapping:
+                    if not line.strip():
+                        continue
+                    try:
+                        key, val = line.split(':')
+                    except ValueError:
+                        log.warning('Ignoring malformed line in {0}: {1}'.format(
+                            doi_map_file, line.strip()))
+                        continue
+                    names[key.strip()] = val.strip()
+        index = {}
+        for prefix, name in names.items():
+            path = os.path.join(plugin_dir, name + '.py')
+            index[prefix] = (name, path if os.path.isfile(path) else None)
+        return index
+
+    def module(self, doi_prefix):
+        """
+        Returns the publisher module for `doi_prefix`, loading it if need be.
 
-    def __init__(self, path_entry):
-        self.path_entry = path_entry
-        return None
+        Raises ImportError if the prefix is not mapped to a module, or the
+        module cannot be loaded.
+        """
+        module = self._modules.get(doi_prefix)
+        if module is not None:
+            return module
+        try:
+            name, path = self.index()[doi_prefix]
+        except KeyError:  # Informative recasting of KeyError to ImportError
+            raise ImportError('DOI publisher prefix "{0}" not mapped to module \
+name'.format(doi_prefix))
+        with self._lock:
+            module = self._modules.get(doi_prefix)
+            if module is None:
+                module = self._load(name, path)
+                self._modules[doi_prefix] = module
+        return module
+
+    def _load(self, name, path):
+        full_name = '.'.join([__name__, name])
+        loaded = sys.modules.get(full_name)
+        if path is None:
+            #A plugin loaded before the registry was reset is not kept
+            loaded_file = getattr(loaded, '__file__', None) or ''
+            if loaded is not None and \
+                    os.path.dirname(loaded_file) != os.path.dirname(__file__):
+                del sys.modules[full_name]
+            return import_module(full_name)
+        if loaded is not None and getattr(loaded, '__file__', None) == path:
+            return loaded
+        log.info('Loading publisher plugin {0}'.format(path))
+        spec = importlib.util.spec_from_file_location(full_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[full_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            if loaded is None:
+                del sys.modules[full_name]
+            else:  # Whatever was loaded before stands
+                sys.modules[full_name] = loaded
+            raise
+        return module
+
+    def reset(self):
+        """
+        Forgets the index and the loaded modules, so that the plugin directory
+        is read again on the next use.
+        """
+        with self._lock:
+            self._index = None
+            self._modules = {}
 
-    #This is poorly documented, the argument to get_data is implicitly supplied
-    #by a call to get_filename
-    def get_data(self, filepath):
-        with open(filepath, 'r') as source:
-            return bytes(source.read(), 'utf-8')
-
-    def get_filename(self, path):
-        name = path.split('.')[-1]
-        for fname in [os.path.join(i, name + '.py') for i in __path__]:
-            if os.path.isfile(fname):
-                return fname
-        return None
 
-sys.path_hooks.append(PublisherFinder)
+#Shared by every Article
+publishers = PublisherRegistry()
 
 
 def import_by_doi(doi):
-    try:
-        mod_name = doi_map[doi]
-    except KeyError:  # Informative recasting of KeyError to ImportError
-        raise ImportError('DOI publisher prefix "{0}" not mapped to module name'.format(doi))
-    module = import_module('.'.join([__name__, mod_name]))
-    return module
+    """
+    Returns the publisher module for the DOI prefix `doi`; see
+    PublisherRegistry.module().
+    """
+    return publishers.module(doi)
 ### Section End - Dynamic Extension with publisher_plugins folder ##############
 ################################################################################
 
@@ -122,6 +189,40 @@ def func_registrar():
     return register
 
 
+#The running totals of memoized metadata calls, over every article
+metadata_stats = Counter()
+_metadata_stats_lock = threading.Lock()
+
+
+def memoized(method):
+    """
+    Decorator for the metadata methods of Publisher subclasses.
+
+    The same metadata is wanted by the Navigation, the Package, and the
+    rendering of the content; a decorated method runs only once per article for
+    each set of arguments, and later calls return the cached result (which
+    callers must therefore not modify). Each call is counted in the
+    publisher's `metadata_stats`, and in the running totals of this module, as
+    one of 'extractions' if the method ran, or 'hits' if the cache answered.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        key = (method.__name__,) + args
+        try:
+            result = self._metadata_cache[key]
+        except KeyError:
+            result = method(self, *args)
+            self._metadata_cache[key] = result
+            outcome = 'extractions'
+        else:
+            outcome = 'hits'
+        self.metadata_stats[outcome] += 1
+        with _metadata_stats_lock:
+            metadata_stats[outcome] += 1
+        return result
+    return wrapper
+
+
 class Publisher(object):
     """
     Meta class for publishers, sub-class per publisher to add support
@@ -148,6 +249,27 @@ class Publisher(object):
         self.biblio_fragment = 'biblio.{0}.xhtml'.format(article_doi) + '#{0}'
         self.tables_fragment = 'tables.{0}.xhtml'.format(article_doi) + '#{0}'
 
+        #The document in which the target of an xref is expected, by ref-type;
+        #used where the target is in several documents, or in none
+        self.xref_ref_type_map = {'bibr': self.biblio_fragment,
+                                  'fig': self.main_fragment,
+                                  'supplementary-material': self.main_fragment,
+                                  'table': self.main_fragment,
+                                  'aff': self.main_fragment,
+                                  'sec': self.main_fragment,
+                                  'table-fn': self.tables_fragment,
+                                  'boxed-text': self.main_fragment,
+                                  'other': self.main_fragment,
+                                  'disp-formula': self.main_fragment,
+                                  'fn': self.main_fragment,
+                                  'app': self.main_fragment,
+                                  None: self.main_fragment}
+
+        #The documents holding each id of the rendered content, and the xref
+        #targets found in none of them; see index_ids()
+        self.id_index = {}
+        self.unresolved_xrefs = set()
+
         self.epub2_support = False
         self.epub3_support = False
         self.epub_default = 2
@@ -156,6 +278,14 @@ class Publisher(object):
         self.epub2_special_methods = self.special2.all
         self.epub3_special_methods = self.special3.all
 
+        #The file names of the images referenced by the rendered content, or
+        #None for a publisher which does not record them with image_path()
+        self.referenced_images = None
+
+        #The results of the memoized metadata methods, and their call counts
+        self._metadata_cache = {}
+        self.metadata_stats = Counter()
+
     @property
     def article(self):
         return self._article()
@@ -170,6 +300,17 @@ class Publisher(object):
     def doi_suffix(self):
         return self.article.doi.split('/', 1)[1]
 
+    def image_path(self, file_name):
+        """
+        Returns the src, relative to the EPUB directory, for the image of the
+        article named `file_name`, and records that the image is referenced by
+        the content, so that only referenced images are placed in the EPUB.
+        """
+        if self.referenced_images is None:
+            self.referenced_images = set()
+        self.referenced_images.add(file_name)
+        return '/'.join(['images-' + self.doi_suffix(), file_name])
+
     def post_process(self, document, epub_version):
         def recursive_traverse(element):
 
@@ -223,7 +364,23 @@ post-processing, removing it''')
 
         return document
 
-    def render_content(self, output_directory, epub_version=None):
+    def render_content(self, output_directory, epub_version=None,
+                       registry=None, split_bytes=None, pretty_print=False):
+        """
+        Renders the article to the main, biblio, and tables content documents
+        in the EPUB directory of `output_directory`.
+
+        If a BuildRegistry is supplied as `registry`, each document written is
+        registered with it and placed in the spine; the tables document is
+        non-linear.
+
+        If `split_bytes` is given, the main document is split into documents of
+        about that many bytes at its top-level sections (see split_main()).
+        Links to the content moved out of the main document are rewritten, and
+        the moves are recorded with the `registry` for the navigation.
+
+        The documents are indented only if `pretty_print` is True.
+        """
         if epub_version is None:
             epub_version = self.epub_default
         self.main = self.make_document('main')
@@ -257,17 +414,171 @@ post-processing, removing it''')
             log.error('Improper EPUB version specified')
             raise ValueError('epub_version should be 2 or 3')
 
+        #The content is in its final documents, so xrefs may be resolved
+        self.index_ids()
+
         #Conduct post-processing on all documents and write them
         self.post_process(self.main, epub_version)
         self.depth_headings(self.main)
-        self.write_document(self.main_filename(output_directory), self.main)
+        parts, moved = [], {}
+        if split_bytes:
+            parts, moved = self.split_main(split_bytes, pretty_print)
+            documents = []
+        else:
+            documents = [(self.main_fragment, self.main, True)]
 
-        for fn, doc in [(self.biblio_filename(output_directory), self.biblio),
-                        (self.tables_filename(output_directory), self.tables)]:
+        for fragment, doc, linear in [(self.biblio_fragment, self.biblio, True),
+                                      (self.tables_fragment, self.tables, False)]:
             if len(doc.getroot().find('body')) == 0:
                 continue
             self.post_process(doc, epub_version)
-            self.write_document(fn, doc)
+            documents.append((fragment, doc, linear))
+
+        if self.unresolved_xrefs:
+            log.warning('{0} cross-references have no target in the content: \
+{1}'.format(len(self.unresolved_xrefs), ', '.join(sorted(self.unresolved_xrefs))))
+
+        if moved:
+            self.relocate_links([doc for _f, doc, _l in documents], moved)
+            if registry is not None:
+                for element_id, fragment in moved.items():
+                    registry.move_target(self.main_fragment.format(element_id),
+                                         fragment.format(element_id))
+
+        for fragment, chunks in parts:
+            self.write_part(os.path.join(output_directory, 'EPUB',
+                                         fragment[:-4]), chunks, pretty_print)
+            if registry is not None:
+                registry.register(fragment[:-4], linear=True)
+        for fragment, doc, linear in documents:
+            self.write_document(os.path.join(output_directory, 'EPUB',
+                                             fragment[:-4]), doc, pretty_print)
+            if registry is not None:
+                registry.register(fragment[:-4], linear=linear)
+
+    def index_ids(self):
+        """
+        Indexes the ids in the bodies of the main, biblio, and tables documents
+        by the fragment format of each document holding them, in that order,
+        so that process_xref_tag() can link to wherever its target ended up.
+        """
+        self.id_index = {}
+        self.unresolved_xrefs = set()
+        for fragment, document in [(self.main_fragment, self.main),
+                                   (self.biblio_fragment, self.biblio),
+                                   (self.tables_fragment, self.tables)]:
+            for element in document.getroot().find('body').iter():
+                element_id = element.get('id')
+                if element_id is None:
+                    continue
+                fragments = self.id_index.setdefault(element_id, [])
+                if fragment not in fragments:
+                    fragments.append(fragment)
+
+    def split_fragment(self, number):
+        """
+        Returns the fragment format, like main_fragment, for the `number`th
+        document of a split main document; the first is main_fragment itself.
+        """
+        if number == 1:
+            return self.main_fragment
+        return 'main-{0}.'.format(number) + self.main_fragment[len('main.'):]
+
+    def split_main(self, split_bytes, pretty_print=False):
+        """
+        Splits the rendered main document into parts of about `split_bytes`
+        bytes each. A new part is only begun at one of the article's top-level
+        sections, so a section larger than `split_bytes` is kept whole, and the
+        content before the first section stays in the main document.
+
+        Each top-level element of the body is serialized just once: the part it
+        goes in is chosen by the length of its serialization, and the parts are
+        written from these (see write_part()), with the links to the content
+        moved out of the main document rewritten in them. The body of the main
+        document is emptied.
+
+        Returns
+        -------
+        parts : list of (str, list of bytes)
+            The fragment format (see split_fragment()) and the serialized body
+            of each part, in reading order; the first is the main document
+        moved : dict
+            The fragment format of the part holding each id which was moved out
+            of the main document, keyed by id
+        """
+        sections = set(sec.attrib['id'] for sec in self.article.body
+                       if sec.tag == 'sec' and 'id' in sec.attrib) \
+            if self.article.body is not None else set()
+        body = self.main.getroot().find('body')
+        #Serialized on its own, an element redeclares the namespaces of its
+        #ancestors, which are left out as the body declares them
+        declarations = [(' xmlns:{0}="{1}"' if prefix else ' xmlns="{1}"').format(
+            prefix, uri).encode('utf-8') for prefix, uri in body.nsmap.items()]
+        parts = [[]]
+        moved = {}
+        size = 0
+        if body.text:
+            parts[-1].append(escape(body.text).encode('utf-8'))
+            size += len(parts[-1][-1])
+        for element in body:
+            serialized = etree.tostring(element, encoding='utf-8',
+                                        pretty_print=pretty_print)
+            start_tag_end = serialized.find(b'>')
+            start_tag = serialized[:start_tag_end]
+            for declaration in declarations:
+                start_tag = start_tag.replace(declaration, b'', 1)
+            serialized = start_tag + serialized[start_tag_end:]
+            if element.get('id') in sections and parts[-1] and \
+                    size + len(serialized) > split_bytes:
+                parts.append([])
+                size = 0
+            parts[-1].append(serialized)
+            size += len(serialized)
+            if len(parts) > 1:  # Moved from the main document
+                fragment = self.split_fragment(len(parts))
+                for descendant in element.iter():
+                    if 'id' in descendant.attrib:
+                        moved[descendant.attrib['id']] = fragment
+        body.text = None
+        body[:] = []
+
+        if moved:
+            #The links are rewritten as they were serialized, with the
+            #attribute value escaped
+            prefix = escape(self.main_fragment.format(''), {'"': '&quot;'})
+            link = re.compile(b' href="' + re.escape(prefix.encode('utf-8')) +
+                              b'([^"]*)"')
+
+            def relocate(match):
+                target = unescape(match.group(1).decode('utf-8'),
+                                  {'&quot;': '"'})
+                if target not in moved:
+                    return match.group(0)
+                href = escape(moved[target].format(target), {'"': '&quot;'})
+                return ' href="{0}"'.format(href).encode('utf-8')
+
+            parts = [[link.sub(relocate, chunk) for chunk in chunks]
+                     for chunks in parts]
+        if len(parts) > 1:
+            log.info('Split the main document into {0} parts'.format(
+                len(parts)))
+        return ([(self.split_fragment(number), chunks)
+                 for number, chunks in enumerate(parts, 1)], moved)
+
+    def relocate_links(self, documents, moved):
+        """
+        Points the links in `documents` to the main document at the part of a
+        split main document which now holds their target (see split_main()).
+        """
+        prefix = self.main_fragment.format('')
+        for document in documents:
+            for anchor in document.iter('a'):
+                href = anchor.get('href')
+                if href is None or not href.startswith(prefix):
+                    continue
+                target = href[len(prefix):]
+                if target in moved:
+                    anchor.attrib['href'] = moved[target].format(target)
 
     def main_filename(self, output_directory):
         return os.path.join(output_directory, 'EPUB', self.main_fragment[:-4])
@@ -278,14 +589,30 @@ post-processing, removing it''')
     def tables_filename(self, output_directory):
         return os.path.join(output_directory, 'EPUB', self.tables_fragment[:-4])
 
-    def write_document(self, name, document):
+    def write_part(self, name, chunks, pretty_print=False):
         """
-        This function will write a document to an XML file.
+        Writes a part of the split main document (see split_main()) to an XML
+        file: the main document, its body holding the serialized elements in
+        `chunks`, which are written out as they are.
         """
+        skeleton = etree.tostring(self.main, encoding='utf-8',
+                                  pretty_print=pretty_print)
+        body_start = skeleton.rindex(b'<body')
+        body_end = skeleton.index(b'/>', body_start)
         with open(name, 'wb') as out:
-            out.write(etree.tostring(document,
-                                     encoding='utf-8',
-                                     pretty_print=True))
+            out.write(skeleton[:body_end])
+            out.write(b'>')
+            for chunk in chunks:
+                out.write(chunk)
+            out.write(b'</body>')
+            out.write(skeleton[body_end + 2:])
+
+    def write_document(self, name, document, pretty_print=False):
+        """
+        This function will write a document to an XML file, streaming it rather
+        than building it in memory (see openaccess_epub.utils.write_xml()).
+        """
+        write_xml(document, name, pretty_print)
 
     def nav_contributors(self):
         """
@@ -622,28 +949,22 @@ post-processing, removing it''')
             element.attrib['href'] = xlink_href
 
     def process_xref_tag(self, element, epub_version):
-        #TODO: Consider creating an xref_ref_type_map instance variable instead
-        #of defining it in this method. It might allow for useful customization
-        ref_map = {'bibr': self.biblio_fragment,
-                   'fig': self.main_fragment,
-                   'supplementary-material': self.main_fragment,
-                   'table': self.main_fragment,
-                   'aff': self.main_fragment,
-                   'sec': self.main_fragment,
-                   'table-fn': self.tables_fragment,
-                   'boxed-text': self.main_fragment,
-                   'other': self.main_fragment,
-                   'disp-formula': self.main_fragment,
-                   'fn': self.main_fragment,
-                   'app': self.main_fragment,
-                   None: self.main_fragment}
-
         element.tag = 'a'
         ref_type = element.attrib.get('ref-type')
         rid = element.attrib['rid']  # What good is an xref without 'rid'
         remove_all_attributes(element)
-        reference = ref_map[ref_type].format(rid)
-        element.attrib['href'] = reference
+        expected = self.xref_ref_type_map.get(ref_type, self.main_fragment)
+        #Linked to the document which holds the target, preferring the one
+        #expected for the ref-type if the target is in more than one
+        fragments = self.id_index.get(rid)
+        if fragments is None:
+            self.unresolved_xrefs.add(rid)
+            fragment = expected
+        elif expected in fragments:
+            fragment = expected
+        else:
+            fragment = fragments[0]
+        element.attrib['href'] = fragment.format(rid)
 
     def process_sec_tag(self, element, epub_version):
         element.tag = 'div'
@@ -11,11 +11,13 @@ from copy import copy, deepcopy
 from lxml import etree
 
 #OpenAccess_EPUB modules
+from openaccess_epub.exceptions import ContentError
 from openaccess_epub.publisher import (
     Publisher,
     contributor_tuple,
     date_tuple,
-    identifier_tuple
+    identifier_tuple,
+    memoized
 )
 from openaccess_epub.utils.element_methods import *
 
@@ -27,6 +29,7 @@ class PLoS(Publisher):
         super(PLoS, self).__init__(article)
         self.epub2_support = True
         self.epub3_support = True
+        self.referenced_images = set()
 
     def get_contrib_names(self, contrib):
         """
@@ -62,21 +65,39 @@ class PLoS(Publisher):
                 file_as_name = proper_name
         return proper_name, file_as_name
 
+    @memoized
+    def contributors(self, contrib_type):
+        """
+        Returns a list of (contrib element, name, file-as name) for each
+        contributor of `contrib_type` ('author' or 'editor').
+
+        This serves the metadata methods and the rendering of the Heading and
+        ArticleInfo alike, so the contributors are only found and named once.
+        """
+        contribs = self.article.root.xpath("./front/article-meta/contrib-group/contrib[@contrib-type=$contrib_type]",
+                                           contrib_type=contrib_type)
+        return [(contrib,) + self.get_contrib_names(contrib) for contrib in contribs]
+
+    @memoized
+    def article_title(self):
+        """
+        Returns the article-title element.
+        """
+        return self.article.root.xpath('./front/article-meta/title-group/article-title')[0]
+
+    @memoized
     def nav_contributors(self):
         contributor_list = []
-        authors = self.article.root.xpath("../front/article-meta/contrib-group/contrib[@contrib-type='author']")
-        for author in authors:
-            author_name, author_file_as_name = self.get_contrib_names(author)
+        for _author, author_name, author_file_as_name in self.contributors('author'):
             contributor_list.append(contributor_tuple(author_name,
                                                       'author',
                                                       author_file_as_name))
         return contributor_list
 
+    @memoized
     def nav_title(self):
         #Serializes the article-title element, since it is not just text
-        #Why does this need the leading double slash?
-        title = self.article.root.xpath('./front/article-meta/title-group/article-title')
-        return serialize(title[0], strip=True)
+        return serialize(self.article_title(), strip=True)
 
     def package_identifier(self):
         #Returning the DOI
@@ -90,17 +111,14 @@ class PLoS(Publisher):
         #Sends the same result as for the Navigation Document
         return self.nav_title()
 
+    @memoized
     def package_contributors(self):
         contributor_list = []
-        authors = self.article.root.xpath("./front/article-meta/contrib-group/contrib[@contrib-type='author']")
-        editors = self.article.root.xpath("./front/article-meta/contrib-group/contrib[@contrib-type='editor']")
-        for author in authors:
-            author_name, author_file_as_name = self.get_contrib_names(author)
+        for _author, author_name, author_file_as_name in self.contributors('author'):
             contributor_list.append(contributor_tuple(author_name,
                                                       'aut',
                                                       author_file_as_name))
-        for editor in editors:
-            editor_name, editor_file_as_name = self.get_contrib_names(author)
+        for _editor, editor_name, editor_file_as_name in self.contributors('editor'):
             contributor_list.append(contributor_tuple(editor_name,
                                                       'edt',
                                                       editor_file_as_name))
@@ -109,6 +127,7 @@ class PLoS(Publisher):
     def package_publisher(self):
         return 'Public Library of Science'
 
+    @memoized
     def package_description(self):
         """
         Given an Article class instance, this is responsible for returning an
@@ -119,6 +138,7 @@ class PLoS(Publisher):
         abstract = self.article.root.xpath('./front/article-meta/abstract')
         return serialize(abstract[0], strip=True) if abstract else None
 
+    @memoized
     def package_date(self):
         date_list = []
         #These terms come from the EPUB/dublincore spec
@@ -144,15 +164,17 @@ class PLoS(Publisher):
             #date_list.append(date_tuple(year, month, day, season, event))
         return date_list
 
+    @memoized
     def package_subject(self):
         #Concerned only with kwd elements, not compound-kwd elements
         #Basically just compiling a list of their serialized text
         subject_list = []
-        for kwd_grp in self.article.root.xpath('./front/article-meta/kwd-group'):
+        for kwd_group in self.article.root.xpath('./front/article-meta/kwd-group'):
             for kwd in kwd_group.findall('kwd'):
                 subject_list.append(serialize(kwd))
         return subject_list
 
+    @memoized
     def package_rights(self):
         #Perhaps we could just return a static string if everything in PLoS is
         #published under the same license. But this inspects the file
@@ -172,8 +194,7 @@ class PLoS(Publisher):
         #Creation of the title
         heading_div.append(self.heading_title())
         #Creation of the Authors
-        authors = self.article.root.xpath("./front/article-meta/contrib-group/contrib[@contrib-type='author']")
-        heading_div.append(self.make_heading_authors(authors))
+        heading_div.append(self.make_heading_authors(self.contributors('author')))
         #Creation of the Authors Affiliations text
         self.make_heading_affiliations(heading_div)
         #Creation of the Abstract content for the Heading
@@ -185,8 +206,7 @@ class PLoS(Publisher):
 
         Metadata element, content derived from FrontMatter
         """
-        art_title = self.article.root.xpath('./front/article-meta/title-group/article-title')[0]
-        article_title = deepcopy(art_title)
+        article_title = deepcopy(self.article_title())
         article_title.tag = 'h1'
         article_title.attrib['id'] = 'title'
         article_title.attrib['class'] = 'article-title'
@@ -195,14 +215,15 @@ class PLoS(Publisher):
     def make_heading_authors(self, authors):
         """
         Constructs the Authors content for the Heading. This should display
-        directly after the Article Title.
+        directly after the Article Title. `authors` is a list of contributors
+        as returned by contributors().
 
         Metadata element, content derived from FrontMatter
         """
         author_element = etree.Element('h3', {'class': 'authors'})
         #Construct content for the author element
         first = True
-        for author in authors:
+        for author, author_name, _ in authors:
             if first:
                 first = False
             else:
@@ -214,7 +235,6 @@ class PLoS(Publisher):
             elif anon is not None:  # If anonymous, just add "Anonymous"
                 append_new_text(author_element, 'Anonymous')
             else:  # Author is neither Anonymous or a Collaboration
-                author_name, _ = self.get_contrib_names(author)
                 append_new_text(author_element, author_name)
             #TODO: Handle author footnote references, also put footnotes in the ArticleInfo
             #Example: journal.pbio.0040370.xml
@@ -368,8 +388,8 @@ class PLoS(Publisher):
         #Creation of the self Citation
         article_info_div.append(self.make_article_info_citation())
         #Creation of the Editors
-        editors = self.article.root.xpath("./front/article-meta/contrib-group/contrib[@contrib-type='editor']")
-        self.make_article_info_editors(editors, article_info_div)
+        self.make_article_info_editors(self.contributors('editor'),
+                                       article_info_div)
         #Creation of the important Dates segment
         article_info_div.append(self.make_article_info_dates())
         #Creation of the Copyright statement
@@ -395,7 +415,7 @@ class PLoS(Publisher):
         b.text = 'Citation: '
 
         #Add author stuff to the citation
-        authors = self.article.root.xpath("./front/article-meta/contrib-group/contrib[@contrib-type='author']")
+        authors = [author for author, _, _ in self.contributors('author')]
         for author in authors:
             author_index = authors.index(author)
             #At the 6th author, simply append an et al., then stop iterating
@@ -455,8 +475,7 @@ class PLoS(Publisher):
         #As best as I can tell from the reference implementation, they
         #serialize the article title to text-only, and expunge redundant spaces
         #This might need later review
-        article_title = self.article.root.xpath('./front/article-meta/title-group/article-title')[0]
-        article_title_text = serialize(article_title)
+        article_title_text = serialize(self.article_title())
         normalized = ' '.join(article_title_text.split())  # Remove redundant whitespace
         #Add a period unless there is some other valid punctuation
         if normalized[-1] not in '.?!':
@@ -486,8 +505,7 @@ class PLoS(Publisher):
         else:
             editor_bold.text = 'Editor: '
         first = True
-        for editor in editors:
-            name, _ = self.get_contrib_names(editor)
+        for editor, name, _ in editors:
             if first:
                 first = False
             else:
@@ -794,8 +812,7 @@ class PLoS(Publisher):
             xlink_href = ns_format(graphic_el, 'xlink:href')
             graphic_xlink_href = graphic_el.attrib[xlink_href]
             file_name = graphic_xlink_href.split('.')[-1] + '.png'
-            img_dir = 'images-' + self.doi_suffix()
-            img_path = '/'.join([img_dir, file_name])
+            img_path = self.image_path(file_name)
 
             #Create the img element
             img_element = etree.Element('img', {'alt': 'A Display Formula',
@@ -840,8 +857,7 @@ class PLoS(Publisher):
             xlink_href = ns_format(inline_graphic, 'xlink:href')
             graphic_xlink_href = inline_graphic_attributes[xlink_href]
             file_name = graphic_xlink_href.split('.')[-1] + '.png'
-            img_dir = 'images-' + self.doi_suffix()
-            img_path = '/'.join([img_dir, file_name])
+            img_path = self.image_path(file_name)
             #Set the source to the image path
             inline_graphic.attrib['src'] = img_path
             inline_graphic.attrib['class'] = 'inline-formula'
@@ -995,8 +1011,7 @@ class PLoS(Publisher):
             xlink_href = ns_format(graphic_el, 'xlink:href')
             graphic_xlink_href = graphic_el.attrib[xlink_href]
             file_name = graphic_xlink_href.split('.')[-1] + '.png'
-            img_dir = 'images-' + self.doi_suffix()
-            img_path = '/'.join([img_dir, file_name])
+            img_path = self.image_path(file_name)
 
             #Create the content: using image path, label, and caption
             img_el = etree.Element('img', {'alt': 'A Figure', 'src': img_path,
@@ -1277,8 +1292,7 @@ class PLoS(Publisher):
                 xlink_href = ns_format(graphic, 'xlink:href')
                 graphic_xlink_href = graphic.attrib[xlink_href]
                 file_name = graphic_xlink_href.split('.')[-1] + '.png'
-                img_dir = 'images-' + self.doi_suffix()
-                img_path = '/'.join([img_dir, file_name])
+                img_path = self.image_path(file_name)
                 #Create the new img element
                 img_element = etree.Element('img', {'alt': 'A Table',
                                                     'src': img_path,
@@ -1317,7 +1331,7 @@ class PLoS(Publisher):
                 #Simply append the table to the table div
                 table_div.append(table)
             elif graphic is None and table is None:
-                sys.exit('Encountered table-wrap element with neither graphic nor table. Exiting.')
+                raise ContentError('Encountered table-wrap element with neither graphic nor table')
 
             #Replace the original table-wrap with the newly constructed div
             replace(table_wrap, table_div)
@@ -1355,8 +1369,7 @@ class PLoS(Publisher):
             if ns_xlink_href in graphic.attrib:
                 xlink_href = graphic.attrib[ns_xlink_href]
                 file_name = xlink_href.split('.')[-1] + '.png'
-                img_dir = 'images-' + self.doi_suffix()
-                img_path = '/'.join([img_dir, file_name])
+                img_path = self.image_path(file_name)
                 graphic.attrib['src'] = img_path
             remove_all_attributes(graphic, exclude=['id', 'class', 'alt', 'src'])
 
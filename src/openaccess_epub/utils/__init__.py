@@ -5,6 +5,11 @@ Common utility functions
 
 #Standard Library modules
 import collections
+import datetime
+try:
+    from collections.abc import MutableSet
+except ImportError:  # Python < 3.3
+    from collections import MutableSet
 import logging
 import os
 import platform
@@ -15,21 +20,35 @@ import sys
 #Non-Standard Library modules
 
 #OpenAccess_EPUB modules
+from openaccess_epub.exceptions import ConfigurationError, OutputDirectoryError
 from openaccess_epub.utils.inputs import doi_input, url_input
 
 log = logging.getLogger('openaccess_epub.utils')
 
 Identifier = collections.namedtuple('Identifer', 'id, type')
 
+#Plain dicts only guarantee insertion order from Python 3.7
+if sys.version_info >= (3, 7):
+    _ordered_dict = dict
+else:
+    _ordered_dict = collections.OrderedDict
 
-#Python documentation refers to this recipe for an OrderedSet
-#http://code.activestate.com/recipes/576694/
-class OrderedSet(collections.MutableSet):
+
+class OrderedSet(MutableSet):
+    """
+    A set which remembers the order in which its members were first added.
+
+    Members are stored as the keys of a single dict (whose values are unused),
+    relying on the insertion ordering of dicts. This costs one dict entry per
+    member, where the earlier linked-list recipe
+    (http://code.activestate.com/recipes/576694/) kept an additional
+    three-element list for each one.
+    """
+
+    __slots__ = ('map',)
 
     def __init__(self, iterable=None):
-        self.end = end = []
-        end += [None, end, end]         # sentinel node for doubly linked list
-        self.map = {}                   # key --> [key, prev, next]
+        self.map = _ordered_dict()
         if iterable is not None:
             self |= iterable
 
@@ -40,36 +59,24 @@ class OrderedSet(collections.MutableSet):
         return key in self.map
 
     def add(self, key):
-        if key not in self.map:
-            end = self.end
-            curr = end[1]
-            curr[2] = end[1] = self.map[key] = [key, curr, end]
+        self.map[key] = None
 
     def discard(self, key):
-        if key in self.map:
-            key, prev, next = self.map.pop(key)
-            prev[2] = next
-            next[1] = prev
+        self.map.pop(key, None)
 
     def __iter__(self):
-        end = self.end
-        curr = end[2]
-        while curr is not end:
-            yield curr[0]
-            curr = curr[2]
+        return iter(self.map)
 
     def __reversed__(self):
-        end = self.end
-        curr = end[1]
-        while curr is not end:
-            yield curr[0]
-            curr = curr[1]
+        return reversed(list(self.map))
 
     def pop(self, last=True):
         if not self:
             raise KeyError('set is empty')
-        key = self.end[1][0] if last else self.end[2][0]
-        self.discard(key)
+        if last:
+            return self.map.popitem()[0]
+        key = next(iter(self.map))
+        del self.map[key]
         return key
 
     def __repr__(self):
@@ -83,6 +90,48 @@ class OrderedSet(collections.MutableSet):
         return set(self) == set(other)
 
 
+def source_date_epoch():
+    """
+    Returns the SOURCE_DATE_EPOCH timestamp from the environment, or None.
+
+    Setting SOURCE_DATE_EPOCH (see https://reproducible-builds.org) puts
+    OpenAccess_EPUB in its reproducible mode: the dates written into the EPUB
+    and the timestamps of its zip entries are taken from it rather than from
+    the clock, so unchanged input makes a byte-identical EPUB.
+    """
+    value = os.environ.get('SOURCE_DATE_EPOCH')
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        log.warning('Ignoring SOURCE_DATE_EPOCH, not an integer: {0}'.format(value))
+        return None
+
+
+def build_datetime():
+    """
+    Returns the UTC datetime to record as the time the EPUB was made, which is
+    SOURCE_DATE_EPOCH if it is set.
+    """
+    epoch = source_date_epoch()
+    if epoch is None:
+        return datetime.datetime.utcnow()
+    return datetime.datetime.utcfromtimestamp(epoch)
+
+
+def write_xml(document, path, pretty_print=False):
+    """
+    Writes an lxml ElementTree, with its doctype, to the file at `path`.
+
+    The document is serialized straight to the file by libxml2, a buffer at a
+    time, rather than first being built as one string in memory as
+    etree.tostring() does. Pretty printing (indentation) is off by default, as
+    it only makes the EPUB larger and slower to write.
+    """
+    document.write(path, encoding='utf-8', pretty_print=pretty_print)
+
+
 def cache_location():
     '''Cross-platform placement of cached files'''
     plat = platform.platform()
@@ -103,7 +152,7 @@ def cache_location():
         path = os.path.expanduser('~user')
         if path == '~user':
             log.critical('Could not resolve the correct cache location')
-            sys.exit('Could not resolve the correct cache location')
+            raise ConfigurationError('Could not resolve the correct cache location')
     cache_loc = os.path.join(path, '.OpenAccess_EPUB')
     log.debug('Cache located: {0}'.format(cache_loc))
     return cache_loc
@@ -133,15 +182,15 @@ def publisher_plugin_location():
 def load_config_module():
     """
     If the config.py file exists, import it as a module. If it does not exist,
-    call sys.exit() with a request to run oaepub configure.
+    raise a ConfigurationError with a request to run oaepub configure.
     """
     import imp
     config_path = config_location()
     try:
         config = imp.load_source('config', config_path)
     except IOError:
-        log.critical('Config file not found. oaepub exiting...')
-        sys.exit('Config file not found. Please run \'oaepub configure\'')
+        log.critical('Config file not found at {0}'.format(config_path))
+        raise ConfigurationError('Config file not found. Please run \'oaepub configure\'')
     else:
         log.debug('Config file loaded from {0}'.format(config_path))
         return config
@@ -196,8 +245,7 @@ def get_output_directory(args):
     try:
         config = imp.load_source('config', config_path)
     except IOError:
-        print('Could not find {0}, please run oae-quickstart'.format(config_path))
-        sys.exit()
+        raise ConfigurationError('Could not find {0}, please run oaepub configure'.format(config_path))
     #args.output is the explicit user instruction, None if unspecified
     if args.output:
         #args.output may be an absolute path
@@ -239,8 +287,7 @@ def get_output_directory(args):
             elif args.collection:
                 return os.getcwd()
             else:  # Un-handled or currently unsupported options
-                print('The output location could not be determined...')
-                sys.exit()
+                raise OutputDirectoryError('The output location could not be determined')
 
 
 def file_root_name(name):
@@ -313,7 +360,7 @@ def dir_exists(directory):
     will ask the user whether or not to continue with the deletion.
 
     If the user responds affirmatively, then the directory will be removed. If
-    the user responds negatively, then the process will abort.
+    the user responds negatively, then an OutputDirectoryError is raised.
     """
     log.info('Directory exists! Asking the user')
     reply = input('''The directory {0} already exists.
@@ -324,7 +371,7 @@ Replace? [Y/n]'''.format(directory))
         os.makedirs(directory)
     else:
         log.critical('Aborting process, user declined overwriting {0}'.format(directory))
-        sys.exit('Aborting process!')
+        raise OutputDirectoryError('Declined overwriting {0}'.format(directory))
 
 
 suggested_article_types = ['abstract', 'addendum', 'announcement',
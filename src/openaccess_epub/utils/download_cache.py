@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+A persistent cache for the downloads made for doi: and URL inputs
+
+Converting the same DOI again, whether for another EPUB version or after fixing
+a problem, would otherwise resolve the DOI and download the XML file all over
+again. The DownloadCache keeps the URL each DOI resolved to, and each downloaded
+file with its headers, in a directory on disk:
+
+  * an entry younger than the time-to-live is used without asking the server
+  * an older entry is revalidated with its ETag or Last-Modified date, and only
+    downloaded again if the server reports that it has changed
+  * if the server can not be reached, an older entry is used with a warning
+  * in offline mode the network is never used; entries are used however old
+    they are, and anything not cached is an InputError
+
+Every entry is written to a temporary file and moved into place, so processes
+sharing a cache never read a partial entry.
+"""
+
+#Standard Library modules
+from collections import namedtuple
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+#Non-Standard Library modules
+
+#OpenAccess_EPUB modules
+from openaccess_epub.exceptions import ConfigurationError, InputError
+import openaccess_epub.utils
+
+log = logging.getLogger('openaccess_epub.utils.download_cache')
+
+#One day
+DEFAULT_TTL = 86400
+
+#The response headers kept with each download
+CACHED_HEADERS = ('Content-Type', 'Content-Disposition', 'ETag',
+                  'Last-Modified')
+
+cached_download = namedtuple('cached_download', 'url, headers, path, cached')
+
+
+def _write_atomic(path, data):
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class DownloadCache(object):
+    """
+    Caches DOI resolutions and downloaded files in `directory`.
+
+    Parameters
+    ----------
+    directory : str
+        The directory holding the cache; it is created if need be
+    ttl : float, optional
+        The number of seconds for which an entry is used without asking the
+        server
+    offline : bool, optional
+        If True, the network is never used
+    opener : urllib.request.OpenerDirector, optional
+        Makes the requests for downloads, by default
+        urllib.request.build_opener()
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, offline=False, opener=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        self.opener = opener or urllib.request.build_opener()
+
+    def _paths(self, key):
+        """
+        Returns the paths of the metadata and data files for `key`.
+        """
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, digest[:2], digest)
+        return base + '.json', base + '.data'
+
+    def _load(self, key):
+        meta_path = self._paths(key)[0]
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as meta_file:
+                entry = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        if entry.get('key') != key:
+            return None
+        return entry
+
+    def _store(self, key, entry, data=None):
+        meta_path, data_path = self._paths(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        #The data goes first, so that no entry refers to missing data
+        if data is not None:
+            _write_atomic(data_path, data)
+        entry['key'] = key
+        _write_atomic(meta_path, json.dumps(entry, sort_keys=True).encode('utf-8'))
+
+    def _fresh(self, entry):
+        return self.offline or time.time() - entry['fetched'] < self.ttl
+
+    def resolve(self, doi, resolver):
+        """
+        Returns the URL for `doi`, calling `resolver(doi)` to find it only if
+        there is no fresh resolution in the cache.
+        """
+        key = 'doi:' + doi
+        entry = self._load(key)
+        if entry is not None and self._fresh(entry):
+            log.debug('Cached resolution of {0}: {1}'.format(doi, entry['url']))
+            return entry['url']
+        if self.offline:
+            raise InputError('{0} has not been resolved before, and cannot be \
+while offline'.format(doi))
+        try:
+            url = resolver(doi)
+        except InputError as err:
+            if entry is None:
+                raise
+            log.warning('{0}, using the cached resolution'.format(err))
+            return entry['url']
+        self._store(key, {'url': url, 'fetched': time.time()})
+        return url
+
+    def fetch(self, url):
+        """
+        Returns a cached_download for `url`, whose `path` is the downloaded
+        file in the cache.
+
+        Raises urllib.error.URLError if the download fails and there is no
+        cached copy, or InputError if offline and there is no cached copy.
+        """
+        key = 'url:' + url
+        data_path = self._paths(key)[1]
+        entry = self._load(key)
+        if entry is not None and not os.path.isfile(data_path):
+            entry = None
+        if entry is not None and self._fresh(entry):
+            log.debug('Using cached download of {0}'.format(url))
+            return cached_download(url, entry['headers'], data_path, True)
+        if self.offline:
+            raise InputError('{0} has not been downloaded before, and cannot \
+be while offline'.format(url))
+
+        request = urllib.request.Request(url)
+        if entry is not None:
+            if 'ETag' in entry['headers']:
+                request.add_header('If-None-Match', entry['headers']['ETag'])
+            if 'Last-Modified' in entry['headers']:
+                request.add_header('If-Modified-Since',
+                                   entry['headers']['Last-Modified'])
+        try:
+            response = self.opener.open(request)
+        except urllib.error.HTTPError as err:
+            if err.code == 304 and entry is not None:
+                log.debug('{0} is not modified, using the cached copy'.format(url))
+                entry['fetched'] = time.time()
+                self._store(key, entry)
+                return cached_download(url, entry['headers'], data_path, True)
+            failure = err
+        except urllib.error.URLError as err:
+            failure = err
+        else:
+            with response:
+                data = response.read()
+                headers = {}
+                for name in CACHED_HEADERS:
+                    if response.headers[name] is not None:
+                        headers[name] = response.headers[name]
+            log.debug('Downloaded {0} ({1:,} bytes)'.format(url, len(data)))
+            self._store(key, {'url': url, 'fetched': time.time(),
+                              'headers': headers}, data)
+            return cached_download(url, headers, data_path, False)
+
+        if entry is None:
+            raise failure
+        log.warning('Unable to download {0} ({1}), using the cached copy'.format(
+            url, failure))
+        return cached_download(url, entry['headers'], data_path, True)
+
+
+def download_cache(config, offline=False):
+    """
+    Returns the DownloadCache set up in the config module, or None if the
+    download cache is disabled.
+
+    Raises ConfigurationError if `offline` is requested without the cache.
+    """
+    if not getattr(config, 'use_download_cache', True):
+        if offline:
+            raise ConfigurationError('Working offline requires the download \
+cache, which is disabled in the config file')
+        return None
+    directory = getattr(config, 'download_cache', None) or \
+        os.path.join(openaccess_epub.utils.cache_location(), 'downloads')
+    return DownloadCache(directory,
+                         getattr(config, 'download_cache_ttl', DEFAULT_TTL),
+                         offline)
@@ -5,15 +5,18 @@ Utilities related to the making and managing of EPUB files
 #Standard Library modules
 import logging
 import os
-import zipfile
 
 #Non-Standard Library modules
 
 #OpenAccess_EPUB modules
 import openaccess_epub
+from openaccess_epub.exceptions import UnsupportedPublisherError
 from openaccess_epub.utils.css import DEFAULT_CSS
 from openaccess_epub.navigation import Navigation
 from openaccess_epub.package import Package
+from openaccess_epub.utils.registry import BuildRegistry
+import openaccess_epub.utils.runlog as runlog
+from openaccess_epub.utils.zipwriter import DEFAULT_COMPRESSION_LEVEL, write_epub
 
 log = logging.getLogger('openaccess_epub.utils.epub')
 
@@ -63,7 +66,9 @@ def make_EPUB(parsed_article,
         automatically resolved (in favor of keeping previous data, skipping
         creation of EPUB).
 
-    Returns False in the case of a fatal error, True if successful.
+    Returns False in the case of a fatal error, True if successful. Raises
+    UnsupportedPublisherError if the article has no publisher support, and
+    OutputDirectoryError if the user declines to overwrite the output.
     """
     #command_log.info('Creating {0}.epub'.format(output_directory))
     if config_module is None:
@@ -73,6 +78,10 @@ def make_EPUB(parsed_article,
         log.error('Invalid EPUB version: {0}'.format(epub_version))
         raise ValueError('Invalid EPUB version. Should be 2 or 3')
 
+    if parsed_article.publisher is None:
+        log.critical('Publisher support was not established, aborting')
+        raise UnsupportedPublisherError('No publisher support for {0}'.format(input_path))
+
     if epub_version is None:
         epub_version = parsed_article.publisher.epub_default
 
@@ -90,43 +99,57 @@ def make_EPUB(parsed_article,
             if err.errno != 17:
                 log.exception('Unable to recursively create output directories')
 
+    #Every file placed in the EPUB is registered here for the manifest
+    registry = BuildRegistry()
+
     #Copy over the basic epub directory
-    make_epub_base(output_directory)
-
-    #Get the images, if possible, fail gracefully if not
-    success = openaccess_epub.utils.images.get_images(output_directory,
-                                                      image_directory,
-                                                      input_path,
-                                                      config_module,
-                                                      parsed_article)
-    if not success:
-        log.critical('Images for the article were not located! Aborting!')
-        return False
+    make_epub_base(output_directory, registry)
 
     #Instantiate Navigation and Package
     epub_nav = Navigation()
-    epub_package = Package()
+    epub_package = Package(registry=registry)
 
     #Process the article for navigation and package info
     epub_nav.process(parsed_article)
     epub_package.process(parsed_article)
 
     #Render the content using publisher-specific methods
-    parsed_article.publisher.render_content(output_directory, epub_version)
-    if epub_version == 2:
-        epub_nav.render_EPUB2(output_directory)
-        epub_package.render_EPUB2(output_directory)
-    elif epub_version == 3:
-        epub_nav.render_EPUB3(output_directory)
-        epub_package.render_EPUB3(output_directory)
+    pretty_print = getattr(config_module, 'pretty_print_xml', False)
+    with runlog.stage('render'):
+        parsed_article.publisher.render_content(
+            output_directory, epub_version, registry,
+            getattr(config_module, 'content_split_bytes', None), pretty_print)
+
+    #Get the images, if possible, fail gracefully if not. This follows the
+    #rendering, so that only the images the content references are placed
+    with runlog.stage('images'):
+        success = openaccess_epub.utils.images.get_images(
+            output_directory, image_directory, input_path, config_module,
+            parsed_article, registry,
+            parsed_article.publisher.referenced_images)
+    if not success:
+        log.critical('Images for the article were not located! Aborting!')
+        return False
+    with runlog.stage('package'):
+        if epub_version == 2:
+            epub_nav.render_EPUB2(output_directory, registry)
+            epub_package.render_EPUB2(output_directory, pretty_print)
+        elif epub_version == 3:
+            epub_nav.render_EPUB3(output_directory, registry)
+            epub_package.render_EPUB3(output_directory, pretty_print)
+
+    stats = parsed_article.publisher.metadata_stats
+    log.debug('Metadata: {0} extractions, {1} repeated calls served from the \
+cache'.format(stats['extractions'], stats['hits']))
 
     #Zip the directory into EPUB
-    epub_zip(output_directory)
+    with runlog.stage('zip'):
+        epub_zip(output_directory, **zip_options(config_module))
 
     return True
 
 
-def make_epub_base(location):
+def make_epub_base(location, registry=None):
     """
     Creates the base structure for an EPUB file in a specified location.
 
@@ -137,6 +160,8 @@ def make_epub_base(location):
     ----------
     location : str
         A path string to a local directory in which the EPUB is to be built
+    registry : openaccess_epub.utils.registry.BuildRegistry, optional
+        If supplied, the default stylesheet is registered for the manifest
     """
     log.info('Making EPUB base files in {0}'.format(location))
     with open(os.path.join(location, 'mimetype'), 'w') as out:  # mimetype file
@@ -158,34 +183,37 @@ def make_epub_base(location):
 
     with open(os.path.join(location, 'EPUB', 'css', 'default.css') ,'wb') as out:
         out.write(bytes(DEFAULT_CSS, 'UTF-8'))
+    if registry is not None:
+        registry.register('css/default.css')
 
 
-def epub_zip(outdirect):
+def epub_zip(outdirect, compression_level=DEFAULT_COMPRESSION_LEVEL,
+             threads=None, timestamp=None, sources=None):
     """
     Zips up the input file directory into an EPUB file.
-    """
-
-    def recursive_zip(zipf, directory, folder=None):
-        if folder is None:
-            folder = ''
-        for item in os.listdir(directory):
-            if os.path.isfile(os.path.join(directory, item)):
-                zipf.write(os.path.join(directory, item),
-                           os.path.join(directory, item))
-            elif os.path.isdir(os.path.join(directory, item)):
-                recursive_zip(zipf, os.path.join(directory, item),
-                              os.path.join(folder, item))
 
+    The mimetype file is written first, as required by the OCF specification.
+    Text files are deflated at `compression_level` while images are stored, and
+    the entries are compressed by a pool of `threads` threads; see
+    openaccess_epub.utils.zipwriter. Entries are written in order of their
+    names, and if `timestamp` is given every entry carries it rather than the
+    file's mtime. Paths are resolved against `outdirect` rather than by changing
+    the working directory, so this is safe to call from multiple threads.
+    Files registered with a source path rather than placed in `outdirect` are
+    passed as `sources` (see BuildRegistry.external_files()).
+    """
     log.info('Zipping up the directory {0}'.format(outdirect))
     epub_filename = outdirect + '.epub'
-    epub = zipfile.ZipFile(epub_filename, 'w')
-    current_dir = os.getcwd()
-    os.chdir(outdirect)
-    epub.write('mimetype')
-    log.info('Recursively zipping META-INF and EPUB')
-    for item in os.listdir('.'):
-        if item == 'mimetype':
-            continue
-        recursive_zip(epub, item)
-    os.chdir(current_dir)
-    epub.close()
\ No newline at end of file
+    write_epub(outdirect, epub_filename, compression_level, threads, timestamp,
+               sources)
+
+
+def zip_options(config):
+    """
+    Returns the epub_zip keyword arguments set in the config module, and the
+    fixed timestamp if SOURCE_DATE_EPOCH is set.
+    """
+    return {'compression_level': getattr(config, 'zip_compression_level',
+                                         DEFAULT_COMPRESSION_LEVEL),
+            'threads': getattr(config, 'zip_threads', None),
+            'timestamp': openaccess_epub.utils.source_date_epoch()}
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Optional optimization of the images placed in an EPUB
+
+Figures arrive as they were fetched or copied, which for some publishers means
+very large PNG or TIFF files. When enabled in the config file, this stage runs
+after the images are placed and before they are registered and zipped:
+
+  * images larger than the configured maximum dimension are downscaled
+  * PNG and JPEG images are recompressed, keeping the original if that is
+    smaller and no downscaling was needed
+  * TIFF images, which EPUB readers do not support, are converted to PNG (the
+    name the PLoS content already refers to them by)
+
+Processed images are kept in a cache keyed by a hash of the source image and
+the settings, so an image is only ever processed once for the same settings.
+The images of an article are processed in a pool of worker processes.
+
+The Pillow library is required; if it is not installed a warning is logged and
+the images are left as they are.
+"""
+
+#Standard Library modules
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+#Non-Standard Library modules
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional
+    Image = None
+
+#OpenAccess_EPUB modules
+
+log = logging.getLogger('openaccess_epub.utils.image_processing')
+
+#Bumped whenever processing changes, so that cached variants are not reused
+PROCESSING_VERSION = 1
+
+DEFAULT_MAX_DIMENSION = 1600
+DEFAULT_JPEG_QUALITY = 85
+
+#The processed file extension for each source image extension
+OUTPUT_EXTENSIONS = {'.png': '.png',
+                     '.jpg': '.jpg',
+                     '.jpeg': '.jpeg',
+                     '.tif': '.png',
+                     '.tiff': '.png'}
+
+#Named as the module attributes, so that they can be pickled to and from the
+#worker processes
+image_settings = namedtuple('image_settings', 'max_dimension, jpeg_quality')
+processed_image = namedtuple('processed_image', 'source, target, source_bytes, '
+                                                'target_bytes, cached')
+
+
+def settings_from_config(config):
+    """
+    Returns the image_settings from the config module.
+    """
+    return image_settings(getattr(config, 'image_max_dimension',
+                                  DEFAULT_MAX_DIMENSION),
+                          getattr(config, 'image_jpeg_quality',
+                                  DEFAULT_JPEG_QUALITY))
+
+
+def cache_key(data, settings):
+    """
+    Returns the cache key for a source image's bytes under `settings`.
+    """
+    digest = hashlib.sha256(data)
+    digest.update(repr((PROCESSING_VERSION, tuple(settings))).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def optimize(data, extension, settings):
+    """
+    Returns the processed bytes of an image with the given file extension.
+
+    The original bytes are returned for a PNG or JPEG image which needed no
+    downscaling and could not be made smaller.
+    """
+    image = Image.open(io.BytesIO(data))
+    resized = False
+    if settings.max_dimension and max(image.size) > settings.max_dimension:
+        image.thumbnail((settings.max_dimension, settings.max_dimension),
+                        Image.LANCZOS)
+        resized = True
+
+    output = io.BytesIO()
+    if OUTPUT_EXTENSIONS[extension] == '.png':
+        if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+        image.save(output, 'PNG', optimize=True)
+    else:
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        image.save(output, 'JPEG', quality=settings.jpeg_quality,
+                   optimize=True, progressive=True)
+    result = output.getvalue()
+
+    converted = OUTPUT_EXTENSIONS[extension] != extension
+    if not resized and not converted and len(result) >= len(data):
+        return data
+    return result
+
+
+def process_image(path, settings, cache_dir):
+    """
+    Processes the image at `path` in place, through the cache. Images of other
+    types are ignored.
+
+    This is run in the worker processes, so everything it needs is passed in.
+
+    Returns
+    -------
+    processed_image or None
+    """
+    root, extension = os.path.splitext(path)
+    extension = extension.lower()
+    if extension not in OUTPUT_EXTENSIONS:
+        return None
+    target = root + OUTPUT_EXTENSIONS[extension]
+    with open(path, 'rb') as source:
+        data = source.read()
+
+    key = cache_key(data, settings)
+    cached_path = os.path.join(cache_dir, key[:2],
+                               key + OUTPUT_EXTENSIONS[extension])
+    cached = os.path.isfile(cached_path)
+    if cached:
+        with open(cached_path, 'rb') as cached_file:
+            result = cached_file.read()
+    else:
+        result = optimize(data, extension, settings)
+        #Written under a temporary name and moved, as other processes may be
+        #reading the cache
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(cached_path))
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(result)
+        os.replace(temp_path, cached_path)
+
+    if result != data:
+        with open(target, 'wb') as out:
+            out.write(result)
+        if target != path:
+            os.remove(path)
+    return processed_image(path, target, len(data), len(result), cached)
+
+
+def process_images(img_dir, config, workers=None):
+    """
+    Optimizes the images in `img_dir` with the settings in the config module.
+
+    Images are processed in a pool of `workers` processes (by default, one per
+    CPU); a single image is processed in this process.
+    """
+    if Image is None:
+        log.warning('Image optimization is enabled, but Pillow is not installed')
+        return
+
+    settings = settings_from_config(config)
+    cache_dir = getattr(config, 'processed_image_cache', None) or \
+        os.path.join(config.image_cache, 'processed')
+    paths = []
+    for dirpath, _dirnames, filenames in os.walk(img_dir):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in OUTPUT_EXTENSIONS:
+                paths.append(os.path.join(dirpath, filename))
+    if not paths:
+        return
+
+    results = []
+    if len(paths) == 1:
+        try:
+            results.append(process_image(paths[0], settings, cache_dir))
+        except Exception as err:
+            log.warning('Unable to optimize {0}: {1}'.format(paths[0], err))
+    else:
+        workers = workers or getattr(config, 'image_workers', None)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(path, pool.submit(process_image, path, settings,
+                                          cache_dir)) for path in paths]
+            for path, future in futures:
+                #Failures are logged here, as logging from the worker
+                #processes does not reach the article's log; the image is
+                #then left as it was
+                try:
+                    results.append(future.result())
+                except Exception as err:
+                    log.warning('Unable to optimize {0}: {1}'.format(path, err))
+
+    results = [result for result in results if result is not None]
+    source_total = sum(result.source_bytes for result in results)
+    target_total = sum(result.target_bytes for result in results)
+    log.info('Optimized {0} images in {1}: {2:,} bytes to {3:,}'.format(
+        len(results), img_dir, source_total, target_total))
+
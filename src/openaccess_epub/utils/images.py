@@ -9,17 +9,22 @@ import time
 import re
 import os.path
 import shutil
+import tempfile
 import logging
+from openaccess_epub.article import Article
 import openaccess_epub.utils as utils
+from openaccess_epub.utils.image_processing import OUTPUT_EXTENSIONS, process_images
+import openaccess_epub.utils.runlog as runlog
 
 
 log = logging.getLogger('openaccess_epub.utils.images')
 
 
-def move_images_to_cache(source, destination):
+def move_images_to_cache(source, destination, ignore=None):
     """
     Handles the movement of images to the cache. Must be helpful if it finds
-    that the folder for this article already exists.
+    that the folder for this article already exists. Files passed over by the
+    `ignore` function (see referenced_only()) are not cached.
     """
     if os.path.isdir(destination):
         log.debug('Cached images for this article already exist')
@@ -27,14 +32,106 @@ def move_images_to_cache(source, destination):
     else:
         log.debug('Cache location: {0}'.format(destination))
         try:
-            shutil.copytree(source, destination)
+            shutil.copytree(source, destination, ignore=ignore)
         except:
             log.exception('Images could not be moved to cache')
         else:
             log.info('Moved images to cache'.format(destination))
 
 
-def explicit_images(images, image_destination, rootname, config):
+def register_image(registry, img_dir, path, article_doi, source=None):
+    """
+    Registers a single image at `path` in the EPUB image directory, where it
+    has been placed unless a `source` to read it from is given.
+    """
+    rel_path = os.path.relpath(path, img_dir).replace(os.sep, '/')
+    href = '/'.join([os.path.basename(img_dir), rel_path])
+    item_id = '-'.join([article_doi, rel_path.replace('/', '-').replace('.', '-')])
+    registry.register(href, item_id=item_id, source=source)
+
+
+def register_image_directory(registry, img_dir, article_doi):
+    """
+    Registers every file of an image directory, in sorted order.
+    """
+    for dirpath, dirnames, filenames in os.walk(img_dir):
+        dirnames.sort()  # Walked in sorted order
+        for filename in sorted(filenames):
+            register_image(registry, img_dir, os.path.join(dirpath, filename),
+                           article_doi)
+
+
+def register_image_sources(registry, img_dir, source, article_doi,
+                           referenced=None):
+    """
+    Registers the images in the `source` directory as the files of the EPUB
+    image directory, without copying them there; they are read from `source`
+    when the EPUB is zipped. If `referenced` is given, only those image file
+    names are registered.
+
+    Returns the referenced names not found in `source`.
+    """
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames.sort()  # Walked in sorted order
+        if referenced is not None:
+            dirnames[:] = []  # Referenced images are never in subdirectories
+        for filename in sorted(filenames):
+            if referenced is not None and filename not in referenced:
+                continue
+            path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(path, source)
+            register_image(registry, img_dir, os.path.join(img_dir, rel_path),
+                           article_doi, source=path)
+    if referenced is None:
+        return []
+    return sorted(name for name in referenced
+                  if not os.path.isfile(os.path.join(source, name)))
+
+
+def referenced_only(referenced, converted=False):
+    """
+    Returns an ignore function for shutil.copytree which passes over every file
+    that is not one of the `referenced` image file names, and every directory.
+
+    If `converted` is True, a file which the image optimization would convert
+    to a referenced file (such as g001.tif for g001.png) is kept as well.
+    """
+    def ignore(directory, names):
+        ignored = []
+        for name in names:
+            root, ext = os.path.splitext(name)
+            if name in referenced:
+                keep = True
+            elif converted:
+                keep = root + OUTPUT_EXTENSIONS.get(ext.lower(), ext) in referenced
+            else:
+                keep = False
+            if not keep or os.path.isdir(os.path.join(directory, name)):
+                ignored.append(name)
+        return ignored
+    return ignore
+
+
+def prune_unreferenced(img_dir, referenced):
+    """
+    Removes everything in the image directory which is not one of the
+    `referenced` image file names. Returns the referenced names not found.
+    """
+    for name in os.listdir(img_dir):
+        path = os.path.join(img_dir, name)
+        if name in referenced and os.path.isfile(path):
+            continue
+        log.debug('Removing unreferenced image {0}'.format(name))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    present = set(os.listdir(img_dir))
+    return sorted(name for name in referenced if name not in present)
+
+
+def explicit_images(images, image_destination, rootname, config,
+                    copy_function=shutil.copy2, ignore=None):
     """
     The method used to handle an explicitly defined image directory by the
     user as a parsed argument.
@@ -44,7 +141,8 @@ def explicit_images(images, image_destination, rootname, config):
         images = images.replace('*', rootname)
         log.debug('Wildcard expansion for image directory: {0}'.format(images))
     try:
-        shutil.copytree(images, image_destination)
+        shutil.copytree(images, image_destination,
+                        copy_function=copy_function, ignore=ignore)
     except:
         #The following is basically a recipe for log.exception() but with a
         #CRITICAL level if the execution should be killed immediately
@@ -55,11 +153,26 @@ def explicit_images(images, image_destination, rootname, config):
         return True
 
 
-def input_relative_images(input_path, image_destination, rootname, config):
+def input_relative_images(input_path, image_destination, rootname, config,
+                          copy_function=shutil.copy2, ignore=None):
     """
     The method used to handle Input-Relative image inclusion.
     """
     log.debug('Looking for input relative images')
+    images = find_input_relative_images(input_path, rootname, config)
+    if images is None:
+        return False
+    log.info('Input-Relative image directory found: {0}'.format(images))
+    shutil.copytree(images, image_destination,
+                    copy_function=copy_function, ignore=ignore)
+    return True
+
+
+def find_input_relative_images(input_path, rootname, config):
+    """
+    Returns the first of the Input-Relative image directories which exists for
+    the input, or None.
+    """
     input_dirname = os.path.dirname(input_path)
     for path in config.input_relative_images:
         if '*' in path:
@@ -67,25 +180,26 @@ def input_relative_images(input_path, image_destination, rootname, config):
             log.debug('Wildcard expansion for image directory: {0}'.format(path))
         images = os.path.normpath(os.path.join(input_dirname, path))
         if os.path.isdir(images):
-            log.info('Input-Relative image directory found: {0}'.format(images))
-            shutil.copytree(images, image_destination)
-            return True
-    return False
+            return images
+    return None
 
 
-def image_cache(article_cache, img_dir):
+def image_cache(article_cache, img_dir, copy_function=shutil.copy2,
+                ignore=None):
     """
     The method to be used by get_images() for copying images out of the cache.
     """
     log.debug('Looking for image directory in the cache')
     if os.path.isdir(article_cache):
         log.info('Cached image directory found: {0}'.format(article_cache))
-        shutil.copytree(article_cache, img_dir)
+        shutil.copytree(article_cache, img_dir, copy_function=copy_function,
+                        ignore=ignore)
         return True
     return False
 
 
-def get_images(output_directory, explicit, input_path, config, parsed_article):
+def get_images(output_directory, explicit, input_path, config, parsed_article,
+               registry=None, referenced=None, stage=True):
     """
     Main logic controller for the placement of images into the output directory
 
@@ -93,8 +207,20 @@ def get_images(output_directory, explicit, input_path, config, parsed_article):
     EPUB directory. This function interacts with interface arguments as well as
     the local installation config.py file. These may change behavior of this
     function in terms of how it looks for images relative to the input, where it
-    finds explicit images, whether it will attempt to download images, and
-    whether successfully downloaded images will be stored in the cache.
+    finds explicit images, whether it will attempt to download images,
+    whether successfully downloaded images will be stored in the cache, and
+    whether the placed images are optimized (see
+    openaccess_epub.utils.image_processing).
+
+    If the images referenced by the rendered content are known, only those are
+    placed (and cached), anything else found in the image directory is left
+    out of the EPUB, and referenced images which could not be found are
+    reported.
+
+    With `stage` False, images already on disk (explicit, Input-Relative, or
+    cached) are not copied into the output directory at all: they are
+    registered with their source paths, and read from there when the EPUB is
+    zipped. Images which must be fetched or optimized are still staged.
 
     Parameters
     ----------
@@ -109,6 +235,15 @@ def get_images(output_directory, explicit, input_path, config, parsed_article):
         The imported configuration module
     parsed_article : openaccess_epub.article.Article object
         The Article instance for the article being converted to EPUB
+    registry : openaccess_epub.utils.registry.BuildRegistry, optional
+        If supplied, every image placed in the EPUB is registered with it
+    referenced : set of str, optional
+        The file names of the images referenced by the rendered content, as
+        recorded by the publisher (see Publisher.image_path()). If None, every
+        image found is placed.
+    stage : bool, optional
+        If False, and a `registry` is supplied, images on disk are registered
+        from where they are found rather than copied
     """
     #Split the DOI
     journal_doi, article_doi = parsed_article.doi.split('/')
@@ -127,9 +262,75 @@ def get_images(output_directory, explicit, input_path, config, parsed_article):
     #Construct path to cache for article
     article_cache = os.path.join(config.image_cache, journal_doi, article_doi)
 
+    optimize = getattr(config, 'optimize_images', False)
+    ignore = None
+    if referenced is not None:
+        ignore = referenced_only(referenced, converted=optimize)
+
+    source = None
+    if not stage and not optimize and registry is not None:
+        source = find_image_source(article_cache, explicit, input_path,
+                                   rootname, config)
+    if source is not None:
+        log.info('Reading images from {0}'.format(source))
+        if config.use_image_cache and source != article_cache:
+            move_images_to_cache(source, article_cache, ignore)
+        missing = register_image_sources(registry, img_dir, source,
+                                         article_doi, referenced)
+        for name in missing:
+            log.warning('Referenced image {0} was not found for {1}'.format(
+                name, parsed_article.doi))
+        return True
+
+    success = place_images(img_dir, article_cache, explicit, input_path,
+                           rootname, config, parsed_article, ignore)
+    #The optional optimization may rename images, so it comes first
+    if success and optimize:
+        with runlog.stage('optimize'):
+            process_images(img_dir, config)
+    if success and referenced is not None:
+        for name in prune_unreferenced(img_dir, referenced):
+            log.warning('Referenced image {0} was not found for {1}'.format(
+                name, parsed_article.doi))
+    #Registered once placed, in sorted order, so that the manifest does not
+    #depend on the order in which files were copied
+    if success and registry is not None:
+        register_image_directory(registry, img_dir, article_doi)
+    return success
+
+
+def find_image_source(article_cache, explicit, input_path, rootname, config):
+    """
+    Returns the existing image directory which place_images() would copy from,
+    by the same order of image methods, or None if the images would have to be
+    fetched (or the explicit directory is missing).
+    """
+    if explicit:
+        images = explicit.replace('*', rootname)
+        return images if os.path.isdir(images) else None
+    if config.use_input_relative_images:
+        images = find_input_relative_images(input_path, rootname, config)
+        if images is not None:
+            return images
+    if config.use_image_cache and os.path.isdir(article_cache):
+        return article_cache
+    return None
+
+
+def place_images(img_dir, article_cache, explicit, input_path, rootname,
+                 config, parsed_article, ignore=None):
+    """
+    Places the images for the article in `img_dir` by the first of the image
+    methods which succeeds, as described for get_images(). Files passed over by
+    the `ignore` function (see referenced_only()) are not copied. Returns True
+    if successful.
+    """
+    journal_doi, article_doi = parsed_article.doi.split('/')
+
     #Use manual image directory, explicit images
     if explicit:
-        success = explicit_images(explicit, img_dir, rootname, config)
+        success = explicit_images(explicit, img_dir, rootname, config,
+                                  ignore=ignore)
         if success and config.use_image_cache:
             move_images_to_cache(img_dir, article_cache)
         #Explicit images prevents all other image methods
@@ -138,7 +339,8 @@ def get_images(output_directory, explicit, input_path, config, parsed_article):
     #Input-Relative import, looks for any one of the listed options
     if config.use_input_relative_images:
         #Prevents other image methods only if successful
-        if input_relative_images(input_path, img_dir, rootname, config):
+        if input_relative_images(input_path, img_dir, rootname, config,
+                                 ignore=ignore):
             if config.use_image_cache:
                 move_images_to_cache(img_dir, article_cache)
             return True
@@ -146,7 +348,7 @@ def get_images(output_directory, explicit, input_path, config, parsed_article):
     #Use cache for article if it exists
     if config.use_image_cache:
         #Prevents other image methods only if successful
-        if image_cache(article_cache, img_dir):
+        if image_cache(article_cache, img_dir, ignore=ignore):
             return True
 
     #Download images from Internet
@@ -154,20 +356,57 @@ def get_images(output_directory, explicit, input_path, config, parsed_article):
         os.mkdir(img_dir)
         if journal_doi == '10.3389':
             fetch_frontiers_images(article_doi, img_dir)
-            if config.use_image_cache:
-                move_images_to_cache(img_dir, article_cache)
-            return True
+            success = True
         elif journal_doi == '10.1371':
             success = fetch_plos_images(article_doi, img_dir, parsed_article)
-            if success and config.use_image_cache:
-                move_images_to_cache(img_dir, article_cache)
-            return success
         else:
             log.error('Fetching images for this publisher is not supported!')
             return False
+        if success and config.use_image_cache:
+            move_images_to_cache(img_dir, article_cache)
+        return success
     return False
 
 
+def prefetch_images(input_path, explicit, config):
+    """
+    Fetches the images for an article into the image cache ahead of its
+    conversion, so that the download may overlap other work; get_images() then
+    finds them in the cache.
+
+    This only does anything where get_images() would otherwise fetch the images
+    itself: there is no explicit or Input-Relative image directory, image
+    fetching and the image cache are both enabled, the article is not cached
+    yet, and the publisher is PLoS. Returns True if images were fetched.
+    """
+    if explicit or not (config.use_image_fetching and config.use_image_cache):
+        return False
+    rootname = utils.file_root_name(input_path)
+    if config.use_input_relative_images and \
+            find_input_relative_images(input_path, rootname, config) is not None:
+        return False
+
+    parsed_article = Article(input_path, validation=False)
+    journal_doi, article_doi = parsed_article.doi.split('/')
+    article_cache = os.path.join(config.image_cache, journal_doi, article_doi)
+    if journal_doi != '10.1371' or os.path.isdir(article_cache):
+        return False
+
+    #Fetched beside the cache entry and moved into place once complete, so
+    #that a partial download is never taken for cached images
+    os.makedirs(os.path.dirname(article_cache), exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=os.path.dirname(article_cache))
+    try:
+        success = fetch_plos_images(article_doi, temp_dir, parsed_article)
+        if success:
+            os.rename(temp_dir, article_cache)
+            log.info('Prefetched images to {0}'.format(article_cache))
+    finally:
+        if os.path.isdir(temp_dir):
+            shutil.rmtree(temp_dir)
+    return success
+
+
 def make_image_cache(img_cache):
     """
     Initiates the image cache if it does not exist
@@ -7,11 +7,11 @@ provide the basis for instantiating Article class objects and the naming of
 output files.
 """
 
+from openaccess_epub.exceptions import InputError, UnsupportedPublisherError
 import openaccess_epub.utils
 import urllib.request
 import urllib.parse
 import urllib.error
-import sys
 import os
 import zipfile
 import shutil
@@ -19,20 +19,24 @@ import logging
 
 log = logging.getLogger('openaccess_epub.utils.input')
 
+#The URL template for DOI resolution
+DOI_RESOLVER = 'http://dx.doi.org/{0}'
 
-def plos_doi_to_xmlurl(doi_string):
+
+def plos_doi_to_xmlurl(doi_string, resolver=DOI_RESOLVER):
     """
     Attempts to resolve a PLoS DOI into a URL path to the XML file.
     """
     #Create URL to request DOI resolution from http://dx.doi.org
-    doi_url = 'http://dx.doi.org/{0}'.format(doi_string)
+    doi_url = resolver.format(doi_string)
     log.debug('DOI URL: {0}'.format(doi_url))
     #Open the page, follow the redirect
     try:
         resolved_page = urllib.request.urlopen(doi_url)
+        resolved_page.close()  # Only the address is needed
     except urllib.error.URLError as err:
-        print('Unable to resolve DOI URL, or could not connect')
-        raise err
+        log.error('Unable to resolve DOI URL {0}: {1}'.format(doi_url, err))
+        raise InputError('Unable to resolve DOI URL, or could not connect') from err
     else:
         #Given the redirection, attempt to shape new request for PLoS servers
         resolved_address = resolved_page.geturl()
@@ -48,43 +52,59 @@ def plos_doi_to_xmlurl(doi_string):
         return xml_url
 
 
-def doi_input(doi_string, download=True):
+def doi_input(doi_string, download=True, cache=None):
     """
     This method accepts a DOI string and attempts to download the appropriate
     xml file. If successful, it returns a path to that file. As with all URL
     input types, the success of this method depends on supporting per-publisher
     conventions and will fail on unsupported publishers
+
+    If a DownloadCache (see openaccess_epub.utils.download_cache) is supplied
+    as `cache`, the resolution of the DOI and the download are cached.
     """
     log.debug('DOI Input - {0}'.format(doi_string))
     doi_string = doi_string[4:]
     if '10.1371' in doi_string:  # Corresponds to PLoS
         log.debug('DOI string shows PLoS')
-        xml_url = plos_doi_to_xmlurl(doi_string)
+        if cache is not None:
+            xml_url = cache.resolve(doi_string, plos_doi_to_xmlurl)
+        else:
+            xml_url = plos_doi_to_xmlurl(doi_string)
     else:
         log.critical('DOI input for this publisher is not supported')
-        sys.exit('This publisher is not yet supported by OpenAccess_EPUB')
-    return url_input(xml_url, download)
+        raise UnsupportedPublisherError('This publisher is not yet supported by OpenAccess_EPUB')
+    return url_input(xml_url, download, cache)
 
 
-def url_input(url_string, download=True):
+def url_input(url_string, download=True, cache=None):
     """
     This method expects a direct URL link to an xml file. It will apply no
     modifications to the received URL string, so ensure good input.
+
+    If a DownloadCache is supplied as `cache`, the file is taken from the cache
+    where it can be.
     """
     log.debug('URL Input - {0}'.format(url_string))
     try:
-        open_xml = urllib.request.urlopen(url_string)
+        if cache is not None:
+            open_xml = cache.fetch(url_string)
+        else:
+            open_xml = urllib.request.urlopen(url_string)
     except urllib.error.URLError as err:
-        print('utils.input.url_input received a bad URL, or could not connect')
-        raise err
+        log.error('Bad URL {0}, or could not connect: {1}'.format(url_string, err))
+        raise InputError('URL input received a bad URL, or could not connect') from err
     else:
+        headers = open_xml.headers
         #Employ a quick check on the mimetype of the link
-        if not open_xml.headers['Content-Type'] == 'text/xml':
-            sys.exit('URL request does not appear to be XML')
-        filename = open_xml.headers['Content-Disposition'].split('\"')[1]
+        if not headers.get('Content-Type') == 'text/xml':
+            raise InputError('URL request does not appear to be XML')
+        filename = headers['Content-Disposition'].split('\"')[1]
         if download:
-            with open(filename, 'wb') as xml_file:
-                xml_file.write(open_xml.read())
+            if cache is not None:
+                shutil.copyfile(open_xml.path, filename)
+            else:
+                with open(filename, 'wb') as xml_file:
+                    xml_file.write(open_xml.read())
         return openaccess_epub.utils.file_root_name(filename)
 
 
@@ -100,8 +120,7 @@ def frontiersZipInput(zip_path, output_prefix, download=None):
     path, name = os.path.split(pathname)
     if not pathext == '.zip':  # Checks for a path to zipfile
         log.error('Pathname provided does not end with .zip')
-        print('Invalid file path: Does not have a zip extension.')
-        sys.exit(1)
+        raise InputError('Invalid file path: Does not have a zip extension')
     #Construct the pair of zipfile pathnames
     file_root = name.split('-r')[0]
     zipname1 = "{0}-r{1}.zip".format(file_root, '1')
@@ -119,7 +138,7 @@ def frontiersZipInput(zip_path, output_prefix, download=None):
             xml_zip.extract(xml)
         except KeyError:
             log.critical('There is no item {0} in the zipfile'.format(xml))
-            sys.exit('There is no item {0} in the zipfile'.format(xml))
+            raise InputError('There is no item {0} in the zipfile'.format(xml))
         else:
             if not os.path.isdir(output_meta):
                 os.makedirs(output_meta)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+A crash-safe journal of the progress of a batch conversion
+
+The journal is a JSON lines file to which an entry is appended when work on an
+input starts, and again when it is done or has failed. Every entry is flushed
+and fsync'd before work continues, so after a crash the journal reflects all
+completed work; a torn final line is ignored when the journal is read back.
+Resuming from a journal skips inputs which were completed (and have not been
+modified since), and retries those which failed or were interrupted.
+"""
+
+#Standard Library modules
+import datetime
+import json
+import logging
+import os
+import threading
+
+#Non-Standard Library modules
+
+#OpenAccess_EPUB modules
+
+log = logging.getLogger('openaccess_epub.utils.journal')
+
+STARTED = 'started'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def fingerprint(path):
+    """
+    Returns the (size, mtime_ns) of a file, used to notice modified inputs.
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class BatchJournal(object):
+    """
+    Records the start, completion, and failure of each input of a batch.
+
+    Parameters
+    ----------
+    path : str
+        The journal file
+    resume : bool, optional
+        If True, existing entries are read and new ones appended. Otherwise
+        the journal is started afresh.
+
+    Attributes
+    ----------
+    entries : dict
+        The latest entry for each input, keyed by input path, `entries`
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        torn = False
+        if resume and os.path.isfile(path):
+            torn = self._read()
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        #New entries must not be run onto the end of a torn final line
+        if torn:
+            self._file.write('\n')
+
+    def _read(self):
+        """
+        Reads the entries of the journal. Returns True if its final line is
+        torn (was not completely written).
+        """
+        line = ''
+        with open(self.path, 'r', encoding='utf-8') as journal:
+            for line_number, line in enumerate(journal, 1):
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry['input']] = entry
+                except (ValueError, KeyError, TypeError):
+                    log.warning('Ignoring unreadable line {0} of journal \
+{1}'.format(line_number, self.path))
+        log.info('Read {0} journal entries from {1}'.format(len(self.entries),
+                                                            self.path))
+        return bool(line) and not line.endswith('\n')
+
+    def _append(self, entry):
+        entry['time'] = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.entries[entry['input']] = entry
+
+    def is_done(self, input_path):
+        """
+        True if the input was completed, and has not been modified since.
+        """
+        entry = self.entries.get(input_path)
+        if entry is None or entry['status'] != DONE:
+            return False
+        try:
+            return list(fingerprint(input_path)) == entry.get('fingerprint')
+        except OSError:
+            return False
+
+    def previous_output(self, input_path):
+        """
+        Returns the output location recorded for an input which was started but
+        not completed, or None.
+        """
+        entry = self.entries.get(input_path)
+        if entry is None or entry['status'] == DONE:
+            return None
+        return entry.get('output')
+
+    def started(self, input_path, output=None):
+        self._append({'input': input_path, 'status': STARTED, 'output': output})
+
+    def done(self, input_path):
+        try:
+            input_fingerprint = list(fingerprint(input_path))
+        except OSError:
+            input_fingerprint = None
+        self._append({'input': input_path, 'status': DONE,
+                      'fingerprint': input_fingerprint})
+
+    def failed(self, input_path, error=None):
+        #Keep the output location, so a retry can clear away what was left
+        output = self.entries.get(input_path, {}).get('output')
+        self._append({'input': input_path, 'status': FAILED, 'output': output,
+                      'error': error})
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
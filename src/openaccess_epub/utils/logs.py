@@ -1,10 +1,24 @@
 # -*- coding: utf-8 -*-
 """
 OpenAccess_EPUB utilities for logging.
+
+Commands which write a log file per article (such as batch and convert) use
+QueuedLogging. Records are then passed through a queue to a listener thread,
+which routes each one to the log file of the article it was emitted for. The
+article is identified by a key set with article_context in the emitting thread,
+so several articles may be processed at once in threads, or in worker processes
+set up with init_worker_logging.
 """
 
+import contextlib
 import logging
+import logging.handlers
+import multiprocessing
+import queue
 import sys
+import threading
+
+from openaccess_epub.exceptions import ConfigurationError
 
 logger = logging.getLogger('openaccess_epub.utils.logs')
 
@@ -22,7 +36,7 @@ def get_level(level_string):
     try:
         level = levels[level_string.lower()]
     except KeyError:
-        sys.exit('{0} is not a recognized logging level'.format(level_string))
+        raise ConfigurationError('{0} is not a recognized logging level'.format(level_string))
     else:
         return level
 
@@ -150,3 +164,236 @@ def replace_filehandler(logname, new_file, level=None, frmt=None):
     if old_filehandler is not None:
         old_filehandler.close()
         log.removeHandler(old_filehandler)
+
+
+#Holds the article key for the current thread, see article_context
+_context = threading.local()
+
+
+@contextlib.contextmanager
+def article_context(key):
+    """
+    Marks every record logged by the current thread, within the with-block, as
+    belonging to the article identified by `key` (a hashable such as the input
+    path or DOI).
+    """
+    previous = getattr(_context, 'key', None)
+    _context.key = key
+    try:
+        yield key
+    finally:
+        _context.key = previous
+
+
+class ArticleContextFilter(logging.Filter):
+    """
+    Stamps each record with the article key of the thread that emitted it, as
+    the attribute `article` (None outside of any article_context).
+    """
+
+    def filter(self, record):
+        if not hasattr(record, 'article'):
+            record.article = getattr(_context, 'key', None)
+        return True
+
+
+class ArticleLogRouter(logging.Handler):
+    """
+    Runs in the QueueListener thread, writing records to per-article sinks.
+
+    Every record is passed to the shared handlers (such as the console handler
+    and a single --log-to file). A record belonging to an article is also
+    written to that article's log file once it has been opened; records which
+    arrive before then are held and written when it opens. Sinks are opened
+    and closed by control records sent through the same queue, so they are
+    ordered correctly relative to the article's own records.
+
+    Parameters
+    ----------
+    level : int
+        The level for per-article log files
+    frmt : str
+        The format string for per-article log files
+    shared : list of logging.Handler, optional
+        Handlers which receive every record, subject to their own levels
+    """
+
+    def __init__(self, level, frmt=STANDARD_FORMAT, shared=None):
+        super(ArticleLogRouter, self).__init__()
+        self.sink_level = level
+        self.sink_formatter = logging.Formatter(frmt)
+        self.shared = list(shared) if shared is not None else []
+        self.sinks = {}
+        self.pending = {}
+
+    def emit(self, record):
+        control = getattr(record, 'oae_control', None)
+        if control is not None:
+            action, key, path = control
+            if action == 'open':
+                self.open_sink(key, path)
+            elif action == 'close':
+                self.close_sink(key)
+            return
+
+        for handler in self.shared:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+        key = getattr(record, 'article', None)
+        if key is None or record.levelno < self.sink_level:
+            return
+        sink = self.sinks.get(key)
+        if sink is not None:
+            sink.handle(record)
+        else:
+            self.pending.setdefault(key, []).append(record)
+
+    def open_sink(self, key, path):
+        if key in self.sinks:
+            self.close_sink(key)
+        try:
+            sink = logging.FileHandler(path, mode='w')
+        except (IOError, OSError):
+            logger.exception('Unable to open log file {0}'.format(path))
+            self.pending.pop(key, None)
+            return
+        sink.setLevel(self.sink_level)
+        sink.setFormatter(self.sink_formatter)
+        self.sinks[key] = sink
+        for record in self.pending.pop(key, []):
+            sink.handle(record)
+
+    def close_sink(self, key):
+        self.pending.pop(key, None)
+        sink = self.sinks.pop(key, None)
+        if sink is not None:
+            sink.close()
+
+    def close(self):
+        for key in list(self.sinks):
+            self.close_sink(key)
+        self.pending.clear()
+        for handler in self.shared:
+            handler.flush()
+        super(ArticleLogRouter, self).close()
+
+
+class QueuedLogging(object):
+    """
+    Moves the handlers of a Logger behind a queue, adding per-article log files.
+
+    On start, the handlers currently attached to the Logger (normally those
+    added by config_logging) are handed to an ArticleLogRouter running in a
+    QueueListener thread, and are replaced by a single QueueHandler. Emitting a
+    record then costs only a queue put. Use open_article_log and
+    close_article_log to manage the per-article files. QueuedLogging may also
+    be used as a context manager, which starts and stops it.
+
+    Parameters
+    ----------
+    log_level : str
+        Level name for the per-article log files, 'DEBUG' for example
+    logname : str, optional
+        The name of the Logger to reconfigure
+    frmt : str, optional
+        Format string for the per-article log files
+    multiprocess : bool, optional
+        Use a multiprocessing.Queue, so that worker processes set up with
+        init_worker_logging(queued.queue) can log through it
+    """
+
+    def __init__(self, log_level, logname='openaccess_epub',
+                 frmt=STANDARD_FORMAT, multiprocess=False):
+        self.logname = logname
+        self.level = get_level(log_level)
+        self.frmt = frmt
+        if multiprocess:
+            self.queue = multiprocessing.Queue(-1)
+        else:
+            self.queue = queue.Queue(-1)
+        self.handler = None
+        self.listener = None
+        self.router = None
+        self._moved = []
+
+    def start(self):
+        log = logging.getLogger(self.logname)
+        self._moved = list(log.handlers)
+        for handler in self._moved:
+            log.removeHandler(handler)
+        self.router = ArticleLogRouter(self.level, self.frmt, self._moved)
+        self.handler = logging.handlers.QueueHandler(self.queue)
+        self.handler.addFilter(ArticleContextFilter())
+        log.addHandler(self.handler)
+        self.listener = logging.handlers.QueueListener(self.queue, self.router)
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """
+        Drains the queue, closes per-article files, and restores the Logger's
+        original handlers.
+        """
+        if self.listener is None:
+            return
+        log = logging.getLogger(self.logname)
+        self.listener.stop()
+        log.removeHandler(self.handler)
+        self.router.close()
+        for handler in self._moved:
+            log.addHandler(handler)
+        self.listener = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def init_worker_logging(log_queue, logname='openaccess_epub'):
+    """
+    Configures logging in a worker process to send everything through the
+    queue of a QueuedLogging created with multiprocess=True in the parent.
+
+    This is suitable as the initializer of a multiprocessing Pool or a
+    concurrent.futures.ProcessPoolExecutor.
+    """
+    log = logging.getLogger(logname)
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    log.setLevel(logging.DEBUG)
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(ArticleContextFilter())
+    log.addHandler(handler)
+
+
+def _control(action, key, path=None, logname='openaccess_epub'):
+    """
+    Sends a control record to the ArticleLogRouter, through the QueueHandler
+    of the named Logger. Returns False if the Logger is not queued.
+    """
+    for handler in logging.getLogger(logname).handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            record = logging.LogRecord(logger.name, logging.DEBUG, __file__, 0,
+                                       '', None, None)
+            record.oae_control = (action, key, path)
+            handler.enqueue(record)
+            return True
+    return False
+
+
+def open_article_log(key, path, logname='openaccess_epub'):
+    """
+    Opens `path` as the log file for the article identified by `key`. Records
+    already logged for the article are written to it first.
+    """
+    return _control('open', key, path, logname)
+
+
+def close_article_log(key, logname='openaccess_epub'):
+    """
+    Closes the log file for the article identified by `key`.
+    """
+    return _control('close', key, None, logname)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+A registry of the files produced while building an EPUB
+
+Every stage which writes a file into the EPUB directory (the base structure,
+image staging, content rendering, and navigation rendering) registers that file
+with a BuildRegistry as it does so. The Package then renders its manifest and
+spine directly from the registry, so nothing needs to walk the output directory
+or change the working directory to find out what was produced. Registration is
+guarded by a lock, so producers may run in separate threads.
+
+A file may also be registered with a source path outside the EPUB directory,
+in which case it is never copied there: it is read into the EPUB from its
+source when the EPUB is zipped (see external_files).
+
+The registry also records content targets which were moved out of the document
+they were expected in, as when a long main document is split, so that hrefs
+written before the move (such as those of the navigation) can be pointed at
+their new document with locate().
+"""
+
+#Standard Library modules
+from collections import namedtuple, OrderedDict
+import logging
+import posixpath
+import threading
+
+#Non-Standard Library modules
+
+#OpenAccess_EPUB modules
+
+log = logging.getLogger('openaccess_epub.utils.registry')
+
+manifest_item = namedtuple('Manifest_Item', 'id, href, media_type, properties')
+spine_item = namedtuple('Spine_Item', 'idref, linear')
+
+#Maps file extensions to mimetypes
+MEDIA_TYPES = {'.jpg': 'image/jpeg',
+               '.jpeg': 'image/jpeg',
+               '.xml': 'application/xhtml+xml',
+               '.png': 'image/png',
+               '.css': 'text/css',
+               '.ncx': 'application/x-dtbncx+xml',
+               '.gif': 'image/gif',
+               '.tif': 'image/tif',
+               '.pdf': 'application/pdf',
+               '.xhtml': 'application/xhtml+xml',
+               '.ttf': 'application/vnd.ms-opentype',
+               '.otf': 'application/vnd.ms-opentype'}
+
+#Used, with a warning, for any extension missing from MEDIA_TYPES
+FALLBACK_MEDIA_TYPE = 'application/octet-stream'
+
+
+def media_type(href):
+    """
+    Returns the media type for an href, inferred from its file extension.
+
+    Unknown extensions are logged as a warning and given
+    FALLBACK_MEDIA_TYPE, rather than halting the build.
+    """
+    ext = posixpath.splitext(href)[1].lower()
+    try:
+        return MEDIA_TYPES[ext]
+    except KeyError:
+        log.warning('Unknown media type for {0}, using {1}'.format(
+            href, FALLBACK_MEDIA_TYPE))
+        return FALLBACK_MEDIA_TYPE
+
+
+class BuildRegistry(object):
+    """
+    Records the files of an EPUB in the order they are produced.
+
+    Hrefs are relative to the EPUB directory (the directory holding
+    package.opf) and always use "/" as their separator.
+
+    Attributes
+    ----------
+    items : collections.OrderedDict
+        The registered manifest_items, keyed by href, in registration order
+    spine : list of spine_item
+        The registered spine entries, in registration order
+    sources : dict
+        The source path of each file registered with one, keyed by href
+    moved : dict
+        The new href (with fragment) of each moved target, keyed by its old
+        href
+    """
+
+    def __init__(self):
+        self.items = OrderedDict()
+        self.spine = []
+        self.sources = {}
+        self.moved = {}
+        self._ids = set()
+        self._lock = threading.Lock()
+
+    def register(self, href, item_id=None, media=None, properties=None,
+                 linear=None, source=None):
+        """
+        Registers a produced file for inclusion in the manifest.
+
+        Parameters
+        ----------
+        href : str
+            The path of the file relative to the EPUB directory.
+        item_id : str, optional
+            The manifest id for the file. If not supplied, the file name with
+            "." replaced by "-" is used. An id which is already taken by another
+            file is made unique with a numeric suffix.
+        media : str, optional
+            The media type of the file. If not supplied, it is inferred from
+            the file extension.
+        properties : str, optional
+            The value for the manifest item's properties attribute.
+        linear : bool or None, optional
+            If not None, the file is also added to the spine, with linear
+            set to "yes" or "no" accordingly.
+        source : str, optional
+            The path from which the file is read into the EPUB, if it has not
+            been placed in the EPUB directory.
+
+        Returns
+        -------
+        manifest_item
+            The registered item.
+        """
+        href = href.replace('\\', '/')
+        if item_id is None:
+            item_id = posixpath.basename(href).replace('.', '-')
+        if media is None:
+            media = media_type(href)
+        with self._lock:
+            if href in self.items:
+                log.debug('{0} registered more than once'.format(href))
+                return self.items[href]
+            if item_id in self._ids:
+                base_id, count = item_id, 1
+                while item_id in self._ids:
+                    count += 1
+                    item_id = '{0}-{1}'.format(base_id, count)
+                log.warning('Manifest id {0} already in use, {1} used for \
+{2}'.format(base_id, item_id, href))
+            item = manifest_item(item_id, href, media, properties)
+            self._ids.add(item_id)
+            self.items[href] = item
+            if source is not None:
+                self.sources[href] = source
+            if linear is not None:
+                self.spine.append(spine_item(item_id, linear))
+        return item
+
+    def move_target(self, href, new_href):
+        """
+        Records that the target `href`, such as "main.x.xhtml#sec1", is found at
+        `new_href` instead.
+        """
+        with self._lock:
+            self.moved[href] = new_href
+
+    def locate(self, href):
+        """
+        Returns the href at which the target `href` is found.
+        """
+        return self.moved.get(href, href)
+
+    def external_files(self, prefix='EPUB/'):
+        """
+        Returns the source path of each file registered with one, keyed by its
+        name in the EPUB zip (its href, under `prefix`).
+        """
+        with self._lock:
+            return dict((prefix + href, source) for href, source in
+                        self.sources.items())
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self.items.values()))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, href):
+        return href in self.items
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+A structured, JSON lines record of a run of an oaepub command
+
+Where the log files hold free text for people, the run log holds one JSON
+object per line for scripts: a record as each stage of work on an article
+completes, and a summary record for the article as a whole. Every record has
+the following keys:
+
+  time          ISO 8601 UTC time at which the record was written
+  command       The oaepub command, "batch" for example
+  input         The input path (or DOI/URL) of the article
+  doi           The article DOI, once known, otherwise null
+  stage         The stage name, or "article" for the summary record
+  duration      Seconds spent in the stage (or on the whole article)
+  input_bytes   Size of the input file, if it exists locally
+  output_bytes  Size of the produced output, if any, otherwise null
+  warnings      Number of WARNING or higher log records for the article so far
+  success       Whether the stage (or the article) completed successfully
+  error         A short description of the failure, otherwise null
+
+At the end of a batch, one more record, with the stage "run", summarizes the
+run as a whole. It has the time, command, stage, duration, and success keys
+(success being whether every article succeeded), and:
+
+  failed                The number of articles for which no EPUB was made
+  metadata_extractions  Calls to memoized publisher metadata methods which
+                        ran (see openaccess_epub.publisher.memoized)
+  metadata_hits         Repeated calls served from the cache instead
+
+The file is opened for appending with a large buffer and flushed after every
+article, so it can be tailed while a long run is in progress.
+"""
+
+#Standard Library modules
+import contextlib
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+#Non-Standard Library modules
+
+#OpenAccess_EPUB modules
+
+log = logging.getLogger('openaccess_epub.utils.runlog')
+
+#Holds the ArticleRun for the current thread
+_local = threading.local()
+
+
+class WarningCounter(logging.Handler):
+    """
+    Counts WARNING and higher records against the ArticleRun of the thread
+    which emitted them.
+
+    This must be attached to the Logger after QueuedLogging is started (if it
+    is used), so that it is called in the emitting thread.
+    """
+
+    def __init__(self):
+        super(WarningCounter, self).__init__(level=logging.WARNING)
+
+    def emit(self, record):
+        run = getattr(_local, 'run', None)
+        if run is not None:
+            run.warnings += 1
+
+
+class RunLog(object):
+    """
+    Appends JSON lines records for a run to a file.
+
+    Parameters
+    ----------
+    path : str
+        The file to append to
+    command : str
+        The name of the oaepub command being run
+    logname : str, optional
+        The Logger whose warnings should be counted for each article
+    """
+
+    def __init__(self, path, command, logname='openaccess_epub'):
+        self.path = path
+        self.command = command
+        self.logname = logname
+        self._file = open(path, 'a', buffering=1 << 16, encoding='utf-8')
+        self._lock = threading.Lock()
+        self._counter = WarningCounter()
+        logging.getLogger(logname).addHandler(self._counter)
+
+    def write(self, record):
+        """
+        Writes a single record, adding the time and command.
+        """
+        now = datetime.datetime.utcnow()
+        line = {'time': now.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+                'command': self.command}
+        line.update(record)
+        text = json.dumps(line, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(text)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def summary(self, duration, failed, metadata):
+        """
+        Writes the record summarizing the run, which took `duration` seconds
+        and in which `failed` articles failed. `metadata` holds the counts of
+        'extractions' and 'hits' of the memoized metadata methods.
+        """
+        self.write({'stage': 'run',
+                    'duration': round(duration, 6),
+                    'failed': failed,
+                    'metadata_extractions': metadata['extractions'],
+                    'metadata_hits': metadata['hits'],
+                    'success': failed == 0})
+        self.flush()
+
+    def article(self, input_path, doi=None):
+        """
+        Returns an ArticleRun for `input_path`, for use as a context manager.
+        """
+        return ArticleRun(self, input_path, doi)
+
+    def close(self):
+        logging.getLogger(self.logname).removeHandler(self._counter)
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ArticleRun(object):
+    """
+    Collects the records for the processing of one article.
+
+    Entering the ArticleRun makes it current for this thread, so that stage()
+    anywhere in the call stack times into it and warnings are counted against
+    it. Leaving it writes the summary record; an exception (including
+    SystemExit) marks the article as failed, and is not suppressed.
+
+    Attributes
+    ----------
+    input : str
+        The article input, `input`
+    doi : str or None
+        The article DOI, may be set once known, `doi`
+    output : str or None
+        Path of the produced output, may be set once known, `output`
+    success : bool or None
+        False once the article has failed, `success`
+    error : str or None
+        Description of the failure, `error`
+    warnings : int
+        The number of warnings logged for the article, `warnings`
+    """
+
+    def __init__(self, run_log, input_path, doi=None):
+        self.run_log = run_log
+        self.input = input_path
+        self.doi = doi
+        self.output = None
+        self.success = None
+        self.error = None
+        self.warnings = 0
+        self._stage_error = None
+        self._previous = None
+        self._start = None
+        try:
+            self.input_bytes = os.path.getsize(input_path)
+        except (OSError, TypeError):
+            self.input_bytes = None
+
+    def _record(self, stage, duration, success, error=None, output_bytes=None):
+        self.run_log.write({'input': self.input,
+                            'doi': self.doi,
+                            'stage': stage,
+                            'duration': round(duration, 6),
+                            'input_bytes': self.input_bytes,
+                            'output_bytes': output_bytes,
+                            'warnings': self.warnings,
+                            'success': success,
+                            'error': error})
+
+    def fail(self, error):
+        """
+        Records a failure which raised no exception. The current stage, if any,
+        and the article are both marked as unsuccessful.
+        """
+        self.success = False
+        self.error = error
+        self._stage_error = error
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Times the with-block as the stage `name`, writing a record for it.
+        """
+        self._stage_error = None
+        start = time.perf_counter()
+        try:
+            yield self
+        except BaseException as err:
+            self._record(name, time.perf_counter() - start, False,
+                         describe_error(err))
+            raise
+        else:
+            error, self._stage_error = self._stage_error, None
+            self._record(name, time.perf_counter() - start, error is None,
+                         error)
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'run', None)
+        _local.run = self
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.run = self._previous
+        if exc_type is not None and not exit_succeeded(exc):
+            self.success = False
+            self.error = describe_error(exc)
+        elif self.success is None:
+            self.success = True
+        output_bytes = None
+        if self.output is not None and os.path.isfile(self.output):
+            output_bytes = os.path.getsize(self.output)
+        self._record('article', time.perf_counter() - self._start,
+                     self.success, self.error, output_bytes)
+        self.run_log.flush()
+        return False
+
+
+def describe_error(err):
+    """
+    Returns a short description of an exception for the run log.
+    """
+    if isinstance(err, SystemExit):
+        return 'SystemExit: {0}'.format(err.code)
+    return '{0}: {1}'.format(type(err).__name__, err)
+
+
+def exit_succeeded(err):
+    """
+    True if the exception is a SystemExit with a successful exit status.
+    """
+    return isinstance(err, SystemExit) and err.code in (None, 0)
+
+
+def article(run_log, input_path, doi=None):
+    """
+    Returns run_log.article(input_path, doi), or a context manager yielding
+    None if `run_log` is None, so that callers need not check.
+    """
+    if run_log is None:
+        return _no_run()
+    return run_log.article(input_path, doi)
+
+
+@contextlib.contextmanager
+def _no_run():
+    yield None
+
+
+def current():
+    """
+    Returns the ArticleRun current for this thread, or None.
+    """
+    return getattr(_local, 'run', None)
+
+
+def stage(name):
+    """
+    Times the with-block as stage `name` of the current ArticleRun. Does
+    nothing if there is none.
+    """
+    run = current()
+    if run is None:
+        return _no_run()
+    return run.stage(name)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Scheduling of the articles of a parallel batch across worker processes
+
+Articles vary from short letters to data papers hundreds of times their size,
+and a batch converted in the order its files are listed may leave one worker
+grinding through a large article at the end while the others sit idle. The cost
+of each article is estimated from its file size and a quick count of the
+figures, tables, and references in its first few hundred kilobytes, and the
+work is handed out in chunks by a WorkQueue:
+
+  * articles are taken largest first, so that the longest conversions start
+    early and the smallest fill in the gaps at the end
+  * each chunk takes articles until it holds a share of the remaining cost,
+    so that there are few chunks to dispatch while there is plenty of work
+    left, and the chunks shrink, down to single articles, as the batch nears
+    its end and the workers should finish together
+
+Articles may be added to the queue while chunks are being taken from it, so
+that work begins before the whole batch has been estimated.
+"""
+
+#Standard Library modules
+import heapq
+import logging
+import os
+import re
+
+#Non-Standard Library modules
+
+#OpenAccess_EPUB modules
+
+log = logging.getLogger('openaccess_epub.utils.scheduling')
+
+#Rough costs, in equivalent bytes of XML, of the work done for every article
+#(parsing, packaging, zipping) and for each of its figures (an image to place
+#and zip), tables, and references
+ARTICLE_COST = 50000
+FIGURE_COST = 200000
+TABLE_COST = 50000
+REFERENCE_COST = 2000
+
+#Chunks are sized so that the remaining work would make this many chunks for
+#each worker
+CHUNKS_PER_WORKER = 4
+
+#The most articles in a single chunk
+MAX_CHUNK_SIZE = 16
+
+#The most bytes of an article read to count its figures, tables, and references
+ESTIMATE_READ_BYTES = 256 * 1024
+
+_COUNTED = re.compile(br'<(fig|table-wrap|ref)[\s>]')
+
+
+def estimate_cost(path, read_bytes=ESTIMATE_READ_BYTES):
+    """
+    Returns the estimated cost of converting the article XML file at `path`,
+    from its size and the number of its figures, tables, and references. These
+    are counted in no more than the first `read_bytes` bytes of the file, and
+    for a larger file are taken to continue at the same rate. A file which can
+    not be read is given the cost of an empty article; its conversion will
+    report the problem.
+    """
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as xml_file:
+            data = xml_file.read(read_bytes)
+    except (IOError, OSError):
+        return ARTICLE_COST
+    counts = {b'fig': 0, b'table-wrap': 0, b'ref': 0}
+    for match in _COUNTED.finditer(data):
+        counts[match.group(1)] += 1
+    scale = size / len(data) if data else 0
+    return (ARTICLE_COST + size +
+            scale * (FIGURE_COST * counts[b'fig'] +
+                     TABLE_COST * counts[b'table-wrap'] +
+                     REFERENCE_COST * counts[b'ref']))
+
+
+class WorkQueue(object):
+    """
+    Hands out chunks of weighted items for `workers` workers, in order of
+    decreasing cost.
+
+    Each chunk takes items until its cost would exceed the cost of the items
+    remaining in the queue divided by `chunks_per_worker` times `workers` (or
+    it holds `max_size` items). A chunk always holds at least one item. Items
+    may be added at any time; those of equal cost are taken in the order they
+    were added.
+
+    Parameters
+    ----------
+    workers : int
+        The number of workers
+    chunks_per_worker : int, optional
+    max_size : int, optional
+    """
+
+    def __init__(self, workers, chunks_per_worker=CHUNKS_PER_WORKER,
+                 max_size=MAX_CHUNK_SIZE):
+        self.workers = workers
+        self.chunks_per_worker = chunks_per_worker
+        self.max_size = max_size
+        self.remaining = 0
+        self._heap = []
+        self._added = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, item, cost):
+        """
+        Adds `item`, of estimated `cost`, to the queue.
+        """
+        heapq.heappush(self._heap, (-cost, self._added, item))
+        self._added += 1
+        self.remaining += cost
+
+    def take(self):
+        """
+        Returns the next chunk of items, as a list; it is empty if the queue is.
+        """
+        target = self.remaining / (self.chunks_per_worker * self.workers)
+        chunk, chunk_cost = [], 0
+        while self._heap and len(chunk) < self.max_size:
+            cost = -self._heap[0][0]
+            if chunk and chunk_cost + cost > target:
+                break
+            chunk.append(heapq.heappop(self._heap)[2])
+            chunk_cost += cost
+        self.remaining -= chunk_cost
+        return chunk
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Detection of new and changed files in a directory, for continuous conversion
+
+A watcher reports the paths of files which have appeared or changed in the
+watched directory since it was last asked. On Linux, InotifyWatcher has the
+kernel report changes as they happen, so nothing is rescanned; elsewhere, or if
+inotify is unavailable, PollingWatcher scans the directory at an interval and
+compares each file against an index of sizes and modification times.
+
+A file which has just changed may still be in the middle of being written, so
+changed paths are passed through a Debouncer, which releases each only once it
+(and any directories related to it, such as its images) has been left alone
+for a settling period.
+"""
+
+#Standard Library modules
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+#Non-Standard Library modules
+
+#OpenAccess_EPUB modules
+from openaccess_epub.utils.journal import fingerprint
+
+log = logging.getLogger('openaccess_epub.utils.watch')
+
+#Event masks from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+#The changes of interest: a file finished being written, or moved into place,
+#and (so that they may be watched in turn) new directories
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | \
+    IN_MOVE_SELF
+
+#struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _never(path):
+    return False
+
+
+class Watcher(object):
+    """
+    Base class for watchers, keeping an index of the files seen so far.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to watch
+    recursive : bool, optional
+        Whether subdirectories are watched as well
+    exclude : callable, optional
+        Called with the path of each file and directory found; anything for
+        which it returns True is ignored, along with the contents of a
+        directory.
+
+    Attributes
+    ----------
+    index : dict
+        The (size, mtime_ns) of each file seen, keyed by path, `index`
+    """
+
+    def __init__(self, directory, recursive=False, exclude=None):
+        self.directory = os.path.abspath(directory)
+        self.recursive = recursive
+        self.exclude = exclude or _never
+        self.index = {}
+
+    def _walk(self, directory):
+        """
+        Yields the path and fingerprint of every file under `directory`.
+        """
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = list(os.scandir(current))
+            except OSError as err:
+                log.debug('Unable to scan {0}: {1}'.format(current, err))
+                continue
+            for entry in entries:
+                if self.exclude(entry.path):
+                    continue
+                try:
+                    if entry.is_dir():
+                        if self.recursive:
+                            stack.append(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        yield entry.path, (stat.st_size, stat.st_mtime_ns)
+                except OSError:  # Removed while scanning
+                    continue
+
+    def scan(self, directory=None):
+        """
+        Scans `directory` (by default, the watched directory) and returns the
+        paths of files which are new or changed according to the index.
+        """
+        changed = []
+        seen = set()
+        for path, file_fingerprint in self._walk(directory or self.directory):
+            seen.add(path)
+            if self.index.get(path) != file_fingerprint:
+                self.index[path] = file_fingerprint
+                changed.append(path)
+        if directory is None:  # Forget removed files
+            for path in set(self.index) - seen:
+                del self.index[path]
+        return changed
+
+    def prime(self):
+        """
+        Indexes the files already present, so that only later changes are
+        reported. Returns their paths.
+        """
+        return self.scan()
+
+    def changes(self, timeout):
+        """
+        Returns the paths of files which have appeared or changed since the
+        last call, waiting up to `timeout` seconds for there to be any.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PollingWatcher(Watcher):
+    """
+    Finds changes by rescanning the directory, at most once every `interval`
+    seconds.
+    """
+
+    def __init__(self, directory, recursive=False, exclude=None, interval=1.0):
+        super(PollingWatcher, self).__init__(directory, recursive, exclude)
+        self.interval = interval
+        self._last_scan = 0
+
+    def changes(self, timeout):
+        wait = self._last_scan + self.interval - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self._last_scan = time.monotonic()
+        return self.scan()
+
+
+class InotifyWatcher(Watcher):
+    """
+    Receives changes from the Linux kernel through inotify.
+
+    Raises OSError if inotify is not available, or a directory can not be
+    watched (for instance, because the limit on watches has been reached).
+    """
+
+    def __init__(self, directory, recursive=False, exclude=None):
+        super(InotifyWatcher, self).__init__(directory, recursive, exclude)
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise self._error('inotify_init1')
+        self._watches = {}
+        try:
+            self._add_tree(self.directory)
+        except OSError:
+            self.close()
+            raise
+
+    def _error(self, call):
+        err = ctypes.get_errno()
+        return OSError(err, '{0}: {1}'.format(call, os.strerror(err)))
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd,
+                                          os.fsencode(directory),
+                                          WATCH_MASK)
+        if wd < 0:
+            raise self._error('inotify_add_watch')
+        self._watches[wd] = directory
+
+    def _add_tree(self, directory):
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            self._add_watch(current)
+            if not self.recursive:
+                continue
+            try:
+                entries = list(os.scandir(current))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir() and not self.exclude(entry.path):
+                    stack.append(entry.path)
+
+    def _read_events(self):
+        """
+        Returns the (directory, name, mask, wd) of each pending event.
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data,
+                                                                      offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((self._watches.get(wd), os.fsdecode(name), mask,
+                               wd))
+        return events
+
+    def changes(self, timeout):
+        readable, _w, _x = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        changed = []
+        for directory, name, mask, wd in self._read_events():
+            if mask & IN_Q_OVERFLOW:
+                #Events were lost, so fall back to comparing with the index
+                log.warning('inotify queue overflowed, rescanning {0}'.format(
+                    self.directory))
+                changed.extend(self.scan())
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if self.exclude(path):
+                continue
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self._add_tree(path)
+                    except OSError as err:
+                        log.warning('Unable to watch {0}: {1}'.format(path,
+                                                                      err))
+                    #Files may have landed before the watch was in place
+                    changed.extend(self.scan(path))
+                continue
+            try:
+                file_fingerprint = fingerprint(path)
+            except OSError:  # Already gone again
+                continue
+            if self.index.get(path) != file_fingerprint:
+                self.index[path] = file_fingerprint
+                changed.append(path)
+        return changed
+
+    def close(self):
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+        self._fd = None
+
+
+def make_watcher(directory, recursive=False, exclude=None, interval=1.0,
+                 polling=False):
+    """
+    Returns an InotifyWatcher where possible, otherwise a PollingWatcher.
+    """
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory, recursive, exclude)
+        except OSError as err:
+            log.warning('Unable to use inotify ({0}), polling instead'.format(
+                err))
+    return PollingWatcher(directory, recursive, exclude, interval)
+
+
+class Debouncer(object):
+    """
+    Holds back changed paths until they have settled.
+
+    A path is released once `settle` seconds have passed since it last
+    changed, and it has kept the same size and modification time meanwhile.
+    The optional `related` callable returns, for a path, a list of other paths
+    (such as its image directory) which must also have been left alone for the
+    settling period.
+
+    Parameters
+    ----------
+    settle : float
+        The settling period in seconds
+    related : callable, optional
+        Returns the related paths for a path
+    """
+
+    def __init__(self, settle, related=None):
+        self.settle = settle
+        self.related = related
+        self.pending = {}
+
+    def touch(self, path):
+        """
+        Notes a change to `path`, (re)starting its settling period.
+        """
+        try:
+            file_fingerprint = fingerprint(path)
+        except OSError:
+            file_fingerprint = None
+        self.pending[path] = (time.time(), file_fingerprint)
+
+    def _newest_change(self, path):
+        """
+        Returns the latest modification time of `path` or anything under it.
+        """
+        newest = 0
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                stat = os.stat(current)
+            except OSError:
+                continue
+            newest = max(newest, stat.st_mtime)
+            if os.path.isdir(current):
+                try:
+                    stack.extend(entry.path for entry in os.scandir(current))
+                except OSError:
+                    continue
+        return newest
+
+    def ready(self, hold=()):
+        """
+        Returns, and stops holding, the paths which have settled. Paths in
+        `hold` are kept back even if they have settled.
+        """
+        now = time.time()
+        released = []
+        for path, (changed, file_fingerprint) in list(self.pending.items()):
+            if path in hold or now - changed < self.settle:
+                continue
+            try:
+                current = fingerprint(path)
+            except OSError:  # Removed before it settled
+                del self.pending[path]
+                continue
+            if current != file_fingerprint:
+                self.pending[path] = (now, current)
+                continue
+            if self.related is not None:
+                newest = max([self._newest_change(related_path) for
+                              related_path in self.related(path)] or [0])
+                if now - newest < self.settle:
+                    continue
+            del self.pending[path]
+            released.append(path)
+        return released
+
+    def __len__(self):
+        return len(self.pending)
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+A ZIP writer for EPUB files which compresses entries in parallel
+
+The standard zipfile module compresses each entry in turn as it is written. Here
+entries are read and deflated in a thread pool (zlib releases the GIL while it
+compresses) and the finished entries are written out in their original order.
+Text files (XHTML, NCX, OPF, CSS) are deflated at a configurable level, while
+files which are already compressed, such as PNG and JPEG images, are stored as
+they are; so is anything which deflate would not make smaller. The mimetype
+file, as the OCF specification requires, is stored, uncompressed and without
+extra fields, as the first entry.
+
+Stored entries are never read into memory: their CRC is computed over a memory
+map of the file, and the file is copied into the ZIP by the kernel with
+os.sendfile() where it is available, so that large images pass through no
+Python buffers.
+
+Only what EPUB needs is written: no ZIP64, encryption, or comments.
+"""
+
+#Standard Library modules
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+
+#Non-Standard Library modules
+
+#OpenAccess_EPUB modules
+
+log = logging.getLogger('openaccess_epub.utils.zipwriter')
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+DEFAULT_COMPRESSION_LEVEL = 6
+
+#Files which gain little or nothing from being deflated again
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.zip', '.epub', '.gz',
+                     '.mp3', '.mp4', '.m4a', '.m4v', '.webm', '.woff',
+                     '.woff2'}
+
+#The permissions recorded for every entry when timestamps are fixed
+FIXED_MODE = 0o100644
+
+#Entries too large for the plain ZIP format would need ZIP64
+ZIP_LIMIT = 0xFFFFFFFF
+
+#The buffer size for copying stored files where os.sendfile() can not be used
+COPY_BUFFER = 1024 * 1024
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+
+#A stored entry has no data, and is copied from its source path when written
+zip_entry = namedtuple('Zip_Entry', 'arcname, method, crc, size, data, '
+                                    'date_time, mode, source')
+
+
+def dos_date_time(timestamp, utc=False):
+    """
+    Returns the (date, time) fields of a ZIP header for a Unix timestamp, in
+    local time unless `utc` is True.
+    """
+    convert = time.gmtime if utc else time.localtime
+    year, month, day, hour, minute, second = convert(timestamp)[:6]
+    if year < 1980:  # The earliest time a ZIP header can hold
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    dos_date = (year - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | second // 2
+    return dos_date, dos_time
+
+
+def file_crc(path, size):
+    """
+    Returns the CRC-32 of the file at `path`, of `size` bytes, computed over a
+    memory map rather than a copy of its contents.
+    """
+    if size == 0:  # An empty file can not be mapped
+        return 0
+    with open(path, 'rb') as in_file:
+        with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            return zlib.crc32(view) & 0xFFFFFFFF
+
+
+def compress_entry(path, arcname, level=DEFAULT_COMPRESSION_LEVEL,
+                   store=False, timestamp=None):
+    """
+    Reads the file at `path` and prepares it as the entry `arcname`.
+
+    The file is deflated at `level`, unless `store` is True, its extension is
+    in STORED_EXTENSIONS, or deflating it would not make it smaller. If a fixed
+    `timestamp` is given, it is used (as UTC) in place of the file's mtime, and
+    the permissions are recorded as 0644, so that the entry does not depend on
+    the file system.
+
+    A file which is to be stored is not read here: the entry records its path,
+    and the file is copied when the entry is written.
+
+    Returns
+    -------
+    zip_entry
+    """
+    stat = os.stat(path)
+    if timestamp is None:
+        date_time, mode = dos_date_time(stat.st_mtime), stat.st_mode & 0xFFFF
+    else:
+        date_time, mode = dos_date_time(timestamp, utc=True), FIXED_MODE
+    extension = os.path.splitext(arcname)[1].lower()
+    if store or level <= 0 or extension in STORED_EXTENSIONS:
+        return zip_entry(arcname, ZIP_STORED, file_crc(path, stat.st_size),
+                         stat.st_size, None, date_time, mode, path)
+
+    with open(path, 'rb') as in_file:
+        data = in_file.read()
+    crc = zlib.crc32(data) & 0xFFFFFFFF
+    size = len(data)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    if len(deflated) < size:
+        return zip_entry(arcname, ZIP_DEFLATED, crc, size, deflated, date_time,
+                         mode, None)
+    return zip_entry(arcname, ZIP_STORED, crc, size, data, date_time, mode,
+                     None)
+
+
+class ZipWriter(object):
+    """
+    Writes prepared entries to a new ZIP file, in the order given.
+
+    Parameters
+    ----------
+    filename : str
+        The ZIP file to create
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'wb')
+        self._central = []
+        self._offset = 0
+
+    def write_entry(self, entry):
+        name = entry.arcname.encode('utf-8')
+        flags = 0 if max(name, default=0) < 0x80 else 0x800  # UTF-8 name
+        if entry.data is None:
+            compressed_size = entry.size
+        else:
+            compressed_size = len(entry.data)
+        if max(self._offset, compressed_size, entry.size) > ZIP_LIMIT:
+            raise ValueError('{0} is too large for a ZIP file without ZIP64'.format(
+                entry.arcname))
+        dos_date, dos_time = entry.date_time
+        header = _LOCAL_HEADER.pack(b'PK\x03\x04', 20, flags, entry.method,
+                                    dos_time, dos_date, entry.crc,
+                                    compressed_size, entry.size, len(name), 0)
+        self._file.write(header)
+        self._file.write(name)
+        if entry.data is None:
+            self._copy_file(entry.source, entry.size)
+        else:
+            self._file.write(entry.data)
+        self._central.append((entry, name, flags, compressed_size,
+                              self._offset))
+        self._offset += len(header) + len(name) + compressed_size
+
+    def _copy_file(self, path, size):
+        """
+        Copies `size` bytes of the file at `path` to the ZIP file, with
+        os.sendfile() if possible.
+        """
+        copied = 0
+        with open(path, 'rb') as in_file:
+            if hasattr(os, 'sendfile'):
+                self._file.flush()
+                out_fd = self._file.fileno()
+                try:
+                    while copied < size:
+                        sent = os.sendfile(out_fd, in_file.fileno(), copied,
+                                           size - copied)
+                        if sent == 0:
+                            break
+                        copied += sent
+                except OSError:  # Not supported for these files
+                    if copied:
+                        raise
+                #The file object has not seen the bytes written to its
+                #descriptor, so its position is brought up to date
+                self._file.seek(0, os.SEEK_END)
+            if copied == 0 and size:
+                in_file.seek(0)
+                while copied < size:
+                    chunk = in_file.read(min(COPY_BUFFER, size - copied))
+                    if not chunk:
+                        break
+                    self._file.write(chunk)
+                    copied += len(chunk)
+        if copied != size:
+            raise ValueError('{0} changed while it was being zipped'.format(path))
+
+    def close(self):
+        """
+        Writes the central directory and closes the file.
+        """
+        if self._file.closed:
+            return
+        start = self._offset
+        for entry, name, flags, compressed_size, offset in self._central:
+            dos_date, dos_time = entry.date_time
+            self._file.write(_CENTRAL_HEADER.pack(
+                b'PK\x01\x02', 3 << 8 | 20, 20, flags, entry.method, dos_time,
+                dos_date, entry.crc, compressed_size, entry.size, len(name), 0,
+                0, 0, 0, entry.mode << 16, offset))
+            self._file.write(name)
+        size = self._file.tell() - start
+        count = len(self._central)
+        if count > 0xFFFF:
+            raise ValueError('Too many entries for a ZIP file without ZIP64')
+        self._file.write(_END_RECORD.pack(b'PK\x05\x06', 0, 0, count, count,
+                                          size, start, 0))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:  # Leave no truncated ZIP file behind
+            self._file.close()
+            os.remove(self.filename)
+
+
+def write_epub(directory, epub_filename,
+               level=DEFAULT_COMPRESSION_LEVEL, threads=None, timestamp=None,
+               sources=None):
+    """
+    Writes the contents of an unzipped EPUB directory to `epub_filename`.
+
+    After mimetype, entries are written in order of their names, so that the
+    output does not depend on the order of directory listings.
+
+    Parameters
+    ----------
+    directory : str
+        The EPUB directory, containing mimetype, META-INF, and EPUB
+    epub_filename : str
+        The EPUB file to create
+    level : int, optional
+        The deflate compression level, from 0 (store everything) to 9
+    threads : int or None, optional
+        The number of compression threads. None, or 0, chooses a number
+        from the count of CPUs.
+    timestamp : int or None, optional
+        A fixed Unix timestamp for every entry, such as SOURCE_DATE_EPOCH.
+        If None, the modification time of each file is used.
+    sources : dict, optional
+        Further entries, read from files outside `directory`, keyed by their
+        names in the EPUB. A file of the same name in `directory` takes
+        precedence.
+    """
+    paths = []
+    for dirpath, _dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            arcname = os.path.relpath(path, directory).replace(os.sep, '/')
+            if arcname != 'mimetype':
+                paths.append((path, arcname))
+    if sources:
+        present = set(arcname for _path, arcname in paths)
+        for arcname, path in sources.items():
+            if arcname in present:
+                log.warning('{0} is in {1}, not adding it from {2}'.format(
+                    arcname, directory, path))
+            else:
+                paths.append((path, arcname))
+    paths.sort(key=lambda path_arcname: path_arcname[1])
+
+    with ZipWriter(epub_filename) as writer:
+        writer.write_entry(compress_entry(os.path.join(directory, 'mimetype'),
+                                          'mimetype', store=True,
+                                          timestamp=timestamp))
+        workers = threads or min(32, (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            #Bound the number of compressed entries held in memory at once
+            window = 2 * workers
+            pending = deque()
+            for path, arcname in paths:
+                pending.append(pool.submit(compress_entry, path, arcname,
+                                           level, timestamp=timestamp))
+                if len(pending) >= window:
+                    writer.write_entry(pending.popleft().result())
+            while pending:
+                writer.write_entry(pending.popleft().result())
+    log.debug('Wrote {0} entries to {1}'.format(len(paths) + 1, epub_filename))
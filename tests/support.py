@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Shared support for the tests: the path to the package sources, a local HTTP
+server standing in for a publisher, and an isolated configuration
+"""
+
+#Standard Library modules
+import contextlib
+import http.server
+import io
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(TESTS_DIR, 'data')
+
+#The tests run against the sources, whether or not the package is installed
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'src'))
+
+#A PLoS article, which renders without problems but does not validate
+ARTICLE = os.path.join(DATA_DIR, 'journal.pone.0000001.xml')
+ARTICLE_DOI = '10.1371/journal.pone.0000001'
+
+
+def article_bytes():
+    with open(ARTICLE, 'rb') as article:
+        return article.read()
+
+
+class StandIn(object):
+    """
+    A local HTTP server standing in for a publisher.
+
+    Each path (with its query) is answered by the function registered for it
+    with add(), which is passed the request handler and returns the status,
+    a dict of headers, and the body. Every request is recorded, with its
+    headers, in `requests`, and `max_active` holds the most requests that
+    were ever being answered at once. Each response is held back by `delay`
+    seconds.
+    """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.routes = {}
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stand_in.answer(self)
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+
+    def add(self, path, respond):
+        self.routes[path] = respond
+
+    def url(self, path):
+        return 'http://127.0.0.1:{0}{1}'.format(self.server.server_address[1],
+                                               path)
+
+    def requests_for(self, path):
+        return [headers for request_path, headers in self.requests
+                if request_path == path]
+
+    def answer(self, handler):
+        with self._lock:
+            self.requests.append((handler.path, dict(handler.headers)))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            respond = self.routes.get(handler.path)
+            if respond is None:
+                status, headers, body = 404, {}, b'Not found'
+            else:
+                status, headers, body = respond(handler)
+        finally:
+            with self._lock:
+                self.active -= 1
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def xml_file(data, filename, etag='"v1"',
+             last_modified='Wed, 20 Dec 2006 00:00:00 GMT'):
+    """
+    Returns a route serving `data` as the XML file `filename`, as PLoS does,
+    which answers a conditional request for the same version with a 304.
+    """
+    def respond(handler):
+        if handler.headers.get('If-None-Match') == etag or \
+                handler.headers.get('If-Modified-Since') == last_modified:
+            return 304, {'ETag': etag}, b''
+        return 200, {'Content-Type': 'text/xml',
+                     'Content-Disposition': 'attachment; filename="{0}"'.format(filename),
+                     'ETag': etag,
+                     'Last-Modified': last_modified}, data
+    return respond
+
+
+def status(code):
+    """
+    Returns a route which answers with the status `code` and no content.
+    """
+    return lambda handler: (code, {}, b'')
+
+
+def redirect(location):
+    """
+    Returns a route which redirects to `location`.
+    """
+    return lambda handler: (302, {'Location': location}, b'')
+
+
+def write_png(path):
+    """
+    Writes a one pixel, grayscale PNG image to `path`.
+    """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + \
+            struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+    with open(path, 'wb') as png:
+        png.write(b'\x89PNG\r\n\x1a\n')
+        png.write(chunk(b'IHDR', struct.pack('>2I5B', 1, 1, 8, 0, 0, 0, 0)))
+        png.write(chunk(b'IDAT', zlib.compress(b'\x00\x00')))
+        png.write(chunk(b'IEND', b''))
+
+
+def write_figure_heavy_epub(directory, figures=40, figure_bytes=256 * 1024,
+                            seed=1):
+    """
+    Writes an unzipped EPUB directory, as for a figure-heavy article, to
+    `directory`: `figures` PNG images of about `figure_bytes` bytes each, and a
+    content document with a figure and some text for each. Returns the total
+    number of bytes written.
+
+    The images hold random, and so incompressible, data as real figures
+    effectively do; the same `seed` always writes the same files. For a
+    benchmark of the ZIP writer at a realistic size, run from this directory:
+
+      python -c "import support; support.write_figure_heavy_epub('bench', 400)"
+      oaepub epubzip --benchmark bench
+    """
+    import random
+    randomness = random.Random(seed)
+    files = {'mimetype': b'application/epub+zip',
+             'META-INF/container.xml': b'<?xml version="1.0"?>\n'
+             b'<container version="1.0" xmlns="urn:oasis:names:tc:opendocument'
+             b':xmlns:container"><rootfiles><rootfile full-path="EPUB/package'
+             b'.opf" media-type="application/oebps-package+xml"/></rootfiles>'
+             b'</container>'}
+    body = []
+    for number in range(1, figures + 1):
+        name = 'g{0:03d}.png'.format(number)
+        files['EPUB/images/' + name] = randomness.randbytes(figure_bytes)
+        body.append('<div id="f{0}"><img src="images/{1}" alt="Figure {0}"/>'
+                    '<p>Figure {0}. {2}</p></div>'.format(
+                        number, name, 'A caption of some length. ' * 20))
+        body.append('<p>{0}</p>'.format('Text discussing the figure. ' * 100))
+    files['EPUB/main.xhtml'] = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                                '<html xmlns="http://www.w3.org/1999/xhtml">'
+                                '<head><title>Figures</title></head><body>' +
+                                ''.join(body) +
+                                '</body></html>').encode('utf-8')
+    total = 0
+    for name, data in files.items():
+        path = os.path.join(directory, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as written:
+            written.write(data)
+        total += len(data)
+    return total
+
+
+@contextlib.contextmanager
+def isolated_config(**options):
+    """
+    Runs with a home directory of its own, holding the default config file
+    with `options` added, and a working directory of its own. Yields the
+    working directory.
+    """
+    from openaccess_epub.commands.configure import configure
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        home = os.path.join(temp_dir, 'home')
+        work = os.path.join(temp_dir, 'work')
+        os.makedirs(home)
+        os.makedirs(work)
+        previous_home = os.environ.get('HOME')
+        previous_dir = os.getcwd()
+        os.environ['HOME'] = home
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                configure(default=True)
+            from openaccess_epub.utils import config_location
+            with open(config_location(), 'a') as config:
+                for name, value in options.items():
+                    config.write('\n{0} = {1!r}\n'.format(name, value))
+            os.chdir(work)
+            yield work
+        finally:
+            os.chdir(previous_dir)
+            if previous_home is None:
+                del os.environ['HOME']
+            else:
+                os.environ['HOME'] = previous_home
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the loading of article XML files
+"""
+
+#Standard Library modules
+import os
+import tempfile
+import unittest
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.article import Article, ArticleMetadata, ArticleStream
+from openaccess_epub.exceptions import ArticleParseError
+
+
+class ArticleStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        #The article, cut off part way through its body
+        data = support.article_bytes()
+        self.truncated = os.path.join(temp_dir.name, 'truncated.xml')
+        with open(self.truncated, 'wb') as truncated:
+            truncated.write(data[:data.index(b'<sec id="s2">')])
+
+    def test_front_matter_matches_article(self):
+        stream = ArticleStream(support.ARTICLE)
+        article = Article(support.ARTICLE, validation=False)
+        self.assertEqual(stream.doi, article.doi)
+        self.assertEqual((stream.dtd_name, stream.dtd_version),
+                         (article.dtd_name, article.dtd_version))
+        self.assertEqual(stream.publisher.package_title(),
+                         article.publisher.package_title())
+        self.assertEqual(stream.publisher.package_contributors(),
+                         article.publisher.package_contributors())
+        self.assertIsNone(stream.body)
+
+    def test_body_is_not_read(self):
+        with self.assertRaises(ArticleParseError):
+            Article(self.truncated, validation=False)
+        stream = ArticleStream(self.truncated)
+        self.assertEqual(stream.doi, support.ARTICLE_DOI)
+        self.assertIsNotNone(stream.front)
+        self.assertEqual([child.tag for child in stream.root], ['front'])
+
+    def test_metadata(self):
+        metadata = ArticleMetadata(self.truncated).as_dict()
+        self.assertEqual(metadata['doi'], support.ARTICLE_DOI)
+        self.assertEqual(metadata['title'], 'A Test Article About Things')
+        self.assertEqual(metadata['rights'],
+                         ArticleMetadata(support.ARTICLE).rights)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the batch command, converting in order and in worker processes
+"""
+
+#Standard Library modules
+import json
+import os
+import shutil
+import unittest
+from unittest import mock
+
+import support
+
+#Non-Standard Library modules
+from lxml import etree
+
+#OpenAccess_EPUB modules
+from openaccess_epub.commands import batch
+from openaccess_epub.utils.journal import BatchJournal
+
+IMAGES = ('g001.png', 't001.png', 'e001.png')
+
+
+def malformed_content(*args, **kwargs):
+    """
+    Stands in for make_EPUB, failing as lxml does on malformed content.
+    """
+    etree.fromstring('<p>')
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.isolated = support.isolated_config(use_image_fetching=False)
+        self.work = self.isolated.__enter__()
+        self.addCleanup(self.isolated.__exit__, None, None, None)
+        os.makedirs('inputs')
+
+    def add_input(self, name):
+        shutil.copy(support.ARTICLE, os.path.join('inputs', name + '.xml'))
+        images = os.path.join('images', name)
+        os.makedirs(images)
+        for image in IMAGES:
+            support.write_png(os.path.join(images, image))
+
+    def batch(self, *options):
+        """
+        Runs the batch command on the inputs, returning its exit status.
+        """
+        try:
+            batch.main(['--silent', '--no-log-file', '--no-validate',
+                        '--no-epubcheck', '--images',
+                        os.path.join('images', '*'), '--output', 'out'] +
+                       list(options) + ['inputs'])
+        except SystemExit as err:
+            return err.code
+        return 0
+
+    def test_exit_status(self):
+        for name in ('a1', 'a2', 'a3'):
+            self.add_input(name)
+        self.assertEqual(self.batch(), 0)
+        self.assertEqual(sorted(os.listdir('out')),
+                         ['a1.epub', 'a2.epub', 'a3.epub'])
+        shutil.rmtree('out')
+        self.assertEqual(self.batch('--jobs', '2'), 0)
+        with open(os.path.join('inputs', 'a2.xml'), 'wb') as malformed:
+            malformed.write(b'<article>')
+        shutil.rmtree('out')
+        self.assertEqual(self.batch(), 1)
+        shutil.rmtree('out')
+        self.assertEqual(self.batch('--jobs', '2'), 1)
+        self.assertEqual(sorted(os.listdir('out')), ['a1.epub', 'a3.epub'])
+
+    def test_run_summary(self):
+        for name in ('a1', 'a2', 'a3'):
+            self.add_input(name)
+        summaries = []
+        for jobs in ('1', '2'):
+            shutil.rmtree('out', ignore_errors=True)
+            self.assertEqual(self.batch('--jobs', jobs, '--run-log',
+                                        'run.jsonl'), 0)
+            with open('run.jsonl') as run_log:
+                summaries.append(json.loads(run_log.readlines()[-1]))
+        for summary in summaries:
+            self.assertEqual(summary['stage'], 'run')
+            self.assertEqual((summary['failed'], summary['success']),
+                             (0, True))
+            self.assertGreater(summary['metadata_hits'], 0)
+        #The counts, summed across the workers, are for each run alone
+        sequential, parallel = summaries
+        self.assertEqual(parallel['metadata_extractions'],
+                         sequential['metadata_extractions'])
+        self.assertEqual(parallel['metadata_hits'], sequential['metadata_hits'])
+        self.assertEqual(sequential['metadata_extractions'] % 3, 0)
+
+    def test_worker_errors_reach_the_batch(self):
+        for name in ('a1', 'a2', 'a3'):
+            self.add_input(name)
+        #The workers are forked with make_EPUB replaced
+        with mock.patch.object(batch, 'make_EPUB', malformed_content):
+            with self.assertRaises(RuntimeError) as raised:
+                self.batch('--jobs', '2')
+        self.assertIn('XMLSyntaxError', str(raised.exception))
+
+    def test_worker_errors_are_journaled(self):
+        for name in ('a1', 'a2', 'a3'):
+            self.add_input(name)
+        with mock.patch.object(batch, 'make_EPUB', malformed_content):
+            exit_status = self.batch('--jobs', '2', '--journal',
+                                     'batch.journal')
+        self.assertEqual(exit_status, 1)
+        with BatchJournal('batch.journal', resume=True) as journal:
+            entries = journal.entries
+        self.assertEqual(len(entries), 3)
+        for entry in entries.values():
+            self.assertEqual(entry['status'], 'failed')
+            self.assertTrue(entry['error'].startswith('XMLSyntaxError'))
+
+
+if __name__ == '__main__':
+    unittest.main()
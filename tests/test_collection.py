@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the collection command, and of reading the images of its articles
+straight into the EPUB
+"""
+
+#Standard Library modules
+import os
+import unittest
+from unittest import mock
+import zipfile
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.commands import collection
+from openaccess_epub.utils.epub import epub_zip
+
+IMAGES = ('g001.png', 't001.png', 'e001.png')
+
+ARTICLES = ('journal.pone.0000001', 'journal.pone.0000002')
+
+
+class CollectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.isolated = support.isolated_config(use_image_fetching=False)
+        self.work = self.isolated.__enter__()
+        self.addCleanup(self.isolated.__exit__, None, None, None)
+        for name in ARTICLES:
+            with open(name + '.xml', 'wb') as xml_file:
+                xml_file.write(support.article_bytes().replace(
+                    b'journal.pone.0000001', name.encode('utf-8')))
+            images = os.path.join('images', name)
+            os.makedirs(images)
+            for image in IMAGES:
+                support.write_png(os.path.join(images, image))
+            #Not referenced by the content
+            support.write_png(os.path.join(images, 'g001-large.png'))
+        with open('collection.txt', 'w') as collection_file:
+            collection_file.write('\n'.join(name + '.xml' for name in ARTICLES))
+        self.staged = []
+
+    def zip_checking_staging(self, output_directory, **kwargs):
+        """
+        Stands in for epub_zip, recording the images in the output directory
+        and the sources given, before zipping as usual.
+        """
+        for dirpath, _dirnames, filenames in os.walk(output_directory):
+            self.staged.extend(filename for filename in filenames
+                               if filename.endswith('.png'))
+        self.sources = kwargs['sources']
+        return epub_zip(output_directory, **kwargs)
+
+    def collection(self, *options):
+        with mock.patch.object(collection, 'epub_zip',
+                               self.zip_checking_staging):
+            collection.main(['--silent', '--no-log-file', '--no-validate',
+                             '--no-epubcheck', '--epub3', '--images',
+                             os.path.join('images', '*'), '--output', 'out'] +
+                            list(options) + ['collection.txt'])
+        epub = zipfile.ZipFile(os.path.join('out', 'collection.epub'))
+        self.addCleanup(epub.close)
+        self.assertIsNone(epub.testzip())
+        return epub
+
+    def expected_images(self):
+        return sorted('EPUB/images-{0}/{1}'.format(name, image)
+                      for name in ARTICLES for image in IMAGES)
+
+    def test_images_read_from_their_source(self):
+        epub = self.collection()
+        #Nothing was copied into the output directory
+        self.assertEqual(self.staged, [])
+        self.assertEqual(sorted(self.sources), self.expected_images())
+        for arcname, source in self.sources.items():
+            self.assertTrue(os.path.abspath(source).startswith(
+                os.path.join(self.work, 'images')))
+            with open(source, 'rb') as image:
+                self.assertEqual(epub.read(arcname), image.read())
+        self.assertEqual(sorted(name for name in epub.namelist()
+                                if name.endswith('.png')),
+                         self.expected_images())
+        package = epub.read('EPUB/package.opf').decode('utf-8')
+        for name in ARTICLES:
+            self.assertIn('images-{0}/g001.png'.format(name), package)
+        self.assertNotIn('g001-large', package)
+        self.assertFalse(os.path.exists(os.path.join('out', 'collection')))
+
+    def test_staged_with_no_cleanup(self):
+        epub = self.collection('--no-cleanup')
+        self.assertEqual(len(self.staged), len(ARTICLES) * len(IMAGES))
+        self.assertEqual(self.sources, {})
+        self.assertEqual(sorted(name for name in epub.namelist()
+                                if name.endswith('.png')),
+                         self.expected_images())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the convert command's --from-file and --prefetch options, against a
+local stand-in for the publisher's server which is slow to answer
+"""
+
+#Standard Library modules
+import json
+import os
+import unittest
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.commands import convert
+
+ARTICLES = ['a1', 'a2', 'a3']
+
+#Each response is held back by this many seconds, so that prefetches overlap
+DELAY = 0.3
+
+
+class ConvertPrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stand_in = support.StandIn(delay=DELAY).start()
+        self.addCleanup(self.stand_in.stop)
+        data = support.article_bytes()
+        for name in ARTICLES:
+            self.stand_in.add(self.path(name),
+                              support.xml_file(data, name + '.xml'))
+
+    def path(self, name):
+        #A URL input ending in .xml would be taken for a local file
+        return '/article/{0}?representation=XML'.format(name)
+
+    def url(self, name):
+        return self.stand_in.url(self.path(name))
+
+    def convert(self, inputs, prefetch):
+        """
+        Converts `inputs`, listed in a file, with --prefetch `prefetch`.
+        Returns the exit status and the article records of the run log.
+        """
+        with support.isolated_config(use_image_fetching=False) as work:
+            images = os.path.join(work, 'images')
+            os.makedirs(images)
+            for name in ('g001.png', 't001.png', 'e001.png'):
+                support.write_png(os.path.join(images, name))
+            with open('inputs.txt', 'w') as input_list:
+                input_list.write('# Inputs\n\n')
+                input_list.write('\n'.join(inputs) + '\n')
+
+            exit_status = 0
+            try:
+                convert.main(['--silent', '--no-log-file', '--no-validate',
+                              '--no-epubcheck', '--images', images,
+                              '--output', 'out', '--run-log', 'run.jsonl',
+                              '--prefetch', str(prefetch),
+                              '--from-file', 'inputs.txt'])
+            except SystemExit as err:
+                exit_status = err.code
+            self.epubs = sorted(os.listdir('out'))
+            with open('run.jsonl') as run_log:
+                records = [json.loads(line) for line in run_log]
+        return exit_status, [record for record in records
+                             if record['stage'] == 'article']
+
+    def test_inputs_are_converted_in_order(self):
+        inputs = [self.url(name) for name in ARTICLES]
+        exit_status, articles = self.convert(inputs, 2)
+        self.assertEqual(exit_status, 0)
+        self.assertEqual([record['input'] for record in articles], inputs)
+        self.assertTrue(all(record['success'] for record in articles))
+        self.assertEqual(self.epubs, [name + '.epub' for name in ARTICLES])
+
+    def test_downloads_run_ahead_at_most_prefetch(self):
+        inputs = [self.url(name) for name in ARTICLES]
+        self.convert(inputs, 2)
+        #Downloads overlapped, but never more than the prefetch at once
+        self.assertEqual(self.stand_in.max_active, 2)
+
+        self.stand_in.max_active = 0
+        self.convert(inputs, 1)
+        self.assertEqual(self.stand_in.max_active, 1)
+
+    def test_failed_prefetch_fails_only_its_input(self):
+        inputs = [self.url('a1'), self.url('missing'), self.url('a2'),
+                  self.url('a3')]
+        exit_status, articles = self.convert(inputs, 2)
+        self.assertEqual(exit_status, 1)
+        self.assertEqual([record['input'] for record in articles], inputs)
+        self.assertEqual([record['success'] for record in articles],
+                         [True, False, True, True])
+        self.assertIsNotNone(articles[1]['error'])
+        self.assertEqual(self.epubs, [name + '.epub' for name in ARTICLES])
+
+
+if __name__ == '__main__':
+    unittest.main()
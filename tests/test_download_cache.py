@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the download cache for DOI and URL inputs, against a local stand-in
+for the publisher's server
+"""
+
+#Standard Library modules
+import functools
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import urllib.error
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.exceptions import InputError
+from openaccess_epub.utils.download_cache import DownloadCache
+import openaccess_epub.utils.download_cache as download_cache
+import openaccess_epub.utils.inputs as inputs
+
+XML_PATH = '/article/fetchObjectAttachment.action?uri=info%3Adoi%2F10.1371%2F\
+journal.pone.0000001&representation=XML'
+
+
+class DownloadCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = support.article_bytes()
+        self.stand_in = support.StandIn().start()
+        self.addCleanup(self.stand_in.stop)
+        self.stand_in.add(XML_PATH, support.xml_file(self.data,
+                                                     'journal.pone.0000001.xml'))
+        self.url = self.stand_in.url(XML_PATH)
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.cache = DownloadCache(os.path.join(self.temp_dir, 'cache'), ttl=60)
+
+    def later(self, seconds):
+        """
+        Moves the cache's clock `seconds` ahead.
+        """
+        now = time.time() + seconds
+        patcher = mock.patch.object(download_cache.time, 'time',
+                                    return_value=now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, download):
+        with open(download.path, 'rb') as downloaded:
+            return downloaded.read()
+
+    def test_fresh_entry_makes_no_request(self):
+        first = self.cache.fetch(self.url)
+        self.assertFalse(first.cached)
+        second = self.cache.fetch(self.url)
+        self.assertTrue(second.cached)
+        self.assertEqual(self.read(second), self.data)
+        self.assertEqual(second.headers['Content-Type'], 'text/xml')
+        self.assertEqual(len(self.stand_in.requests_for(XML_PATH)), 1)
+
+    def test_stale_entry_is_revalidated(self):
+        self.cache.fetch(self.url)
+        self.later(120)
+        revalidated = self.cache.fetch(self.url)
+        self.assertTrue(revalidated.cached)
+        self.assertEqual(self.read(revalidated), self.data)
+        requests = self.stand_in.requests_for(XML_PATH)
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[1]['If-None-Match'], '"v1"')
+        self.assertEqual(requests[1]['If-Modified-Since'],
+                         'Wed, 20 Dec 2006 00:00:00 GMT')
+        #The 304 refreshed the entry, so it is fresh again
+        self.assertTrue(self.cache.fetch(self.url).cached)
+        self.assertEqual(len(self.stand_in.requests_for(XML_PATH)), 2)
+
+    def test_server_error_uses_cached_copy(self):
+        self.cache.fetch(self.url)
+        self.stand_in.add(XML_PATH, support.status(503))
+        self.later(120)
+        with self.assertLogs('openaccess_epub.utils.download_cache',
+                             'WARNING'):
+            download = self.cache.fetch(self.url)
+        self.assertTrue(download.cached)
+        self.assertEqual(self.read(download), self.data)
+
+    def test_connection_failure_uses_cached_copy(self):
+        self.cache.fetch(self.url)
+        self.stand_in.stop()
+        self.later(120)
+        with self.assertLogs('openaccess_epub.utils.download_cache',
+                             'WARNING'):
+            download = self.cache.fetch(self.url)
+        self.assertTrue(download.cached)
+        self.assertEqual(self.read(download), self.data)
+
+    def test_failure_without_cached_copy_raises(self):
+        self.stand_in.add(XML_PATH, support.status(503))
+        with self.assertRaises(urllib.error.URLError):
+            self.cache.fetch(self.url)
+
+    def test_offline_without_entry_raises_input_error(self):
+        offline = DownloadCache(self.cache.directory, offline=True)
+        with self.assertRaises(InputError):
+            offline.fetch(self.url)
+        with self.assertRaises(InputError):
+            offline.resolve(support.ARTICLE_DOI, inputs.plos_doi_to_xmlurl)
+        self.assertEqual(self.stand_in.requests, [])
+
+    def test_offline_uses_entries_however_old(self):
+        self.cache.fetch(self.url)
+        offline = DownloadCache(self.cache.directory, ttl=0, offline=True)
+        self.later(3600)
+        self.assertTrue(offline.fetch(self.url).cached)
+        self.assertEqual(len(self.stand_in.requests), 1)
+
+    def test_doi_resolution_goes_through_resolver(self):
+        landing = '/article/info:doi/' + support.ARTICLE_DOI
+        self.stand_in.add('/doi/' + support.ARTICLE_DOI,
+                          support.redirect(landing))
+        self.stand_in.add(landing, lambda handler: (200, {}, b'Landing page'))
+        resolver = functools.partial(inputs.plos_doi_to_xmlurl,
+                                     resolver=self.stand_in.url('/doi/{0}'))
+        self.assertEqual(self.cache.resolve(support.ARTICLE_DOI, resolver),
+                         self.url)
+        #The resolution is cached
+        self.assertEqual(self.cache.resolve(support.ARTICLE_DOI, resolver),
+                         self.url)
+        self.assertEqual(len(self.stand_in.requests_for(landing)), 1)
+
+        previous_dir = os.getcwd()
+        os.chdir(self.temp_dir)
+        try:
+            root_name = inputs.url_input(self.url, cache=self.cache)
+        finally:
+            os.chdir(previous_dir)
+        self.assertEqual(root_name, 'journal.pone.0000001')
+        with open(os.path.join(self.temp_dir, root_name + '.xml'), 'rb') as xml:
+            self.assertEqual(xml.read(), self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the epubzip command, and its benchmark of the ZIP writer, on a
+synthetic figure-heavy EPUB
+"""
+
+#Standard Library modules
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+import zipfile
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.commands import epubzip
+
+
+class EpubzipTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = os.path.join(temp_dir.name, 'figures')
+        self.input_bytes = support.write_figure_heavy_epub(
+            self.directory, figures=8, figure_bytes=64 * 1024)
+
+    def test_fixture(self):
+        other = os.path.join(os.path.dirname(self.directory), 'again')
+        self.assertEqual(support.write_figure_heavy_epub(
+            other, figures=8, figure_bytes=64 * 1024), self.input_bytes)
+        for name in ('mimetype', os.path.join('EPUB', 'images', 'g008.png')):
+            with open(os.path.join(self.directory, name), 'rb') as first, \
+                    open(os.path.join(other, name), 'rb') as second:
+                self.assertEqual(first.read(), second.read())
+
+    def test_zip(self):
+        with mock.patch.dict(os.environ, {'SOURCE_DATE_EPOCH': '1700000000'}):
+            epubzip.main(['--level', '9', '--threads', '2', self.directory])
+        with zipfile.ZipFile(self.directory + '.epub') as epub:
+            self.assertIsNone(epub.testzip())
+            infos = epub.infolist()
+            self.assertEqual(infos[0].filename, 'mimetype')
+            self.assertEqual(len(infos), 11)
+            methods = dict((info.filename, info.compress_type)
+                           for info in infos)
+            self.assertEqual(methods['EPUB/main.xhtml'], zipfile.ZIP_DEFLATED)
+            self.assertEqual(methods['EPUB/images/g001.png'], zipfile.ZIP_STORED)
+            self.assertEqual(infos[0].date_time, (2023, 11, 14, 22, 13, 20))
+
+    def test_benchmark(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            epubzip.main(['--benchmark', '--level', '6', self.directory])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], 'Zipping {0:,} bytes'.format(
+            self.input_bytes))
+        rows = [line.split() for line in lines[2:]]
+        #Every level, then single-threaded at the chosen level
+        self.assertEqual([(row[0], row[1]) for row in rows],
+                         [(str(level), 'auto') for level in range(10)] +
+                         [('6', '1')])
+        sizes = [int(row[2].replace(',', '')) for row in rows]
+        #The images, which are most of the bytes, are stored at every level
+        self.assertGreater(min(sizes), 8 * 64 * 1024)
+        self.assertLess(sizes[6], sizes[0])
+        self.assertEqual(sizes[10], sizes[6])
+        self.assertFalse(os.path.exists(self.directory + '.epub'))
+
+    def test_bad_options(self):
+        with self.assertRaises(SystemExit) as raised:
+            epubzip.main(['--level', '10', self.directory])
+        self.assertEqual(raised.exception.code, '--level must be from 0 to 9')
+
+
+if __name__ == '__main__':
+    unittest.main()
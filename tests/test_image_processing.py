@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the optional optimization of the images placed in an EPUB
+"""
+
+#Standard Library modules
+import os
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+import openaccess_epub.utils.image_processing as image_processing
+from openaccess_epub.utils.image_processing import DEFAULT_JPEG_QUALITY, \
+    DEFAULT_MAX_DIMENSION, Image, cache_key, image_settings, process_image, \
+    process_images, settings_from_config
+
+
+class ImageProcessingTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.img_dir = os.path.join(temp_dir.name, 'images')
+        os.makedirs(self.img_dir)
+        self.cache_dir = os.path.join(temp_dir.name, 'processed')
+        self.config = types.SimpleNamespace(
+            image_cache=temp_dir.name, image_max_dimension=100,
+            image_jpeg_quality=80)
+        self.settings = settings_from_config(self.config)
+
+    def test_settings(self):
+        self.assertEqual(self.settings, image_settings(100, 80))
+        self.assertEqual(settings_from_config(types.SimpleNamespace()),
+                         image_settings(DEFAULT_MAX_DIMENSION,
+                                        DEFAULT_JPEG_QUALITY))
+
+    def test_cache_key(self):
+        key = cache_key(b'image', self.settings)
+        self.assertEqual(cache_key(b'image', image_settings(100, 80)), key)
+        self.assertNotEqual(cache_key(b'other', self.settings), key)
+        self.assertNotEqual(cache_key(b'image', image_settings(200, 80)), key)
+
+    def test_without_pillow(self):
+        path = os.path.join(self.img_dir, 'g001.png')
+        support.write_png(path)
+        with open(path, 'rb') as png:
+            data = png.read()
+        with mock.patch.object(image_processing, 'Image', None):
+            with self.assertLogs('openaccess_epub.utils.image_processing',
+                                 'WARNING'):
+                process_images(self.img_dir, self.config)
+        with open(path, 'rb') as png:
+            self.assertEqual(png.read(), data)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_other_files_ignored(self):
+        path = os.path.join(self.img_dir, 'supplement.pdf')
+        with open(path, 'wb') as other:
+            other.write(b'%PDF')
+        self.assertIsNone(process_image(path, self.settings, self.cache_dir))
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class OptimizeTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.img_dir = os.path.join(temp_dir.name, 'images')
+        os.makedirs(self.img_dir)
+        self.cache_dir = os.path.join(temp_dir.name, 'processed')
+        self.settings = image_settings(100, 80)
+
+    def image(self, name, size, image_format):
+        path = os.path.join(self.img_dir, name)
+        Image.new('RGB', size, 'white').save(path, image_format)
+        return path
+
+    def test_downscaled(self):
+        path = self.image('g001.png', (400, 40), 'PNG')
+        result = process_image(path, self.settings, self.cache_dir)
+        self.assertEqual((result.target, result.cached), (path, False))
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (100, 10))
+
+    def test_tiff_converted(self):
+        path = self.image('g001.tif', (50, 50), 'TIFF')
+        result = process_image(path, self.settings, self.cache_dir)
+        target = os.path.join(self.img_dir, 'g001.png')
+        self.assertEqual(result.target, target)
+        self.assertFalse(os.path.exists(path))
+        with Image.open(target) as image:
+            self.assertEqual((image.format, image.size), ('PNG', (50, 50)))
+
+    def test_cached(self):
+        path = self.image('g001.jpg', (400, 400), 'JPEG')
+        with open(path, 'rb') as jpeg:
+            data = jpeg.read()
+        first = process_image(path, self.settings, self.cache_dir)
+        with open(path, 'rb') as jpeg:
+            processed = jpeg.read()
+        with open(path, 'wb') as jpeg:
+            jpeg.write(data)
+        second = process_image(path, self.settings, self.cache_dir)
+        self.assertEqual((first.cached, second.cached), (False, True))
+        with open(path, 'rb') as jpeg:
+            self.assertEqual(jpeg.read(), processed)
+
+    def test_article_images(self):
+        for number in range(3):
+            self.image('g00{0}.png'.format(number), (300, 300), 'PNG')
+        config = types.SimpleNamespace(image_cache=self.cache_dir,
+                                       image_max_dimension=100,
+                                       image_jpeg_quality=80, image_workers=2)
+        with self.assertLogs('openaccess_epub.utils.image_processing', 'INFO'):
+            process_images(self.img_dir, config)
+        for name in os.listdir(self.img_dir):
+            with Image.open(os.path.join(self.img_dir, name)) as image:
+                self.assertEqual(image.size, (100, 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that an input which cannot be parsed fails on its own, without stopping
+the conversion of the inputs after it
+"""
+
+#Standard Library modules
+import os
+import shutil
+import unittest
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.article import Article, ArticleStream
+from openaccess_epub.commands import batch, convert
+from openaccess_epub.exceptions import ArticleParseError, InputError
+
+#Cut off part way through <front>
+MALFORMED = b'<?xml version="1.0" encoding="UTF-8"?>\n<article><front><journal-meta>'
+
+IMAGES = ('g001.png', 't001.png', 'e001.png')
+
+
+def run(command, argv):
+    """
+    Runs the main() of `command` with `argv`, returning its exit status.
+    """
+    try:
+        command.main(argv)
+    except SystemExit as err:
+        return err.code
+    return 0
+
+
+class ArticleParseErrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.isolated = support.isolated_config(use_image_fetching=False)
+        self.work = self.isolated.__enter__()
+        self.addCleanup(self.isolated.__exit__, None, None, None)
+        with open('bad.xml', 'wb') as bad:
+            bad.write(MALFORMED)
+        shutil.copy(support.ARTICLE, 'journal.pone.0000001.xml')
+
+    def write_images(self, directory):
+        os.makedirs(directory)
+        for name in IMAGES:
+            support.write_png(os.path.join(directory, name))
+
+    def test_parse_errors_are_input_errors(self):
+        for loader in (Article, ArticleStream):
+            with self.assertRaises(ArticleParseError) as raised:
+                loader('bad.xml')
+            self.assertIsInstance(raised.exception, InputError)
+            with self.assertRaises(ArticleParseError):
+                loader('missing.xml')
+
+    def test_convert_continues_past_bad_inputs(self):
+        self.write_images('images')
+        exit_status = run(convert, ['--silent', '--no-log-file',
+                                    '--no-validate', '--no-epubcheck',
+                                    '--images', 'images', '--output', 'out',
+                                    '--run-log', 'run.jsonl', 'bad.xml',
+                                    'missing.xml', 'journal.pone.0000001.xml'])
+        self.assertEqual(exit_status, 1)
+        self.assertEqual(os.listdir('out'), ['journal.pone.0000001.epub'])
+
+    def test_batch_continues_past_bad_inputs(self):
+        os.makedirs('inputs')
+        for name in ('bad.xml', 'journal.pone.0000001.xml'):
+            shutil.move(name, 'inputs')
+        self.write_images(os.path.join('images', 'journal.pone.0000001'))
+        exit_status = run(batch, ['--silent', '--no-log-file',
+                                  '--no-validate', '--no-epubcheck',
+                                  '--images', os.path.join('images', '*'),
+                                  '--output', 'out', 'inputs'])
+        self.assertEqual(exit_status, 1)
+        self.assertEqual(os.listdir('out'), ['journal.pone.0000001.epub'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the batch journal, and of resuming a batch from it
+"""
+
+#Standard Library modules
+import json
+import os
+import shutil
+import unittest
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.commands import batch
+from openaccess_epub.utils.journal import BatchJournal
+
+IMAGES = ('g001.png', 't001.png', 'e001.png')
+
+
+class BatchJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.isolated = support.isolated_config(use_image_fetching=False)
+        self.work = self.isolated.__enter__()
+        self.addCleanup(self.isolated.__exit__, None, None, None)
+        os.makedirs('inputs')
+        self.inputs = {}
+        for name in ('a1', 'a2', 'a3'):
+            self.inputs[name] = os.path.join(self.work, 'inputs',
+                                             name + '.xml')
+            shutil.copy(support.ARTICLE, self.inputs[name])
+            images = os.path.join('images', name)
+            os.makedirs(images)
+            for image in IMAGES:
+                support.write_png(os.path.join(images, image))
+
+    def batch(self, *options):
+        """
+        Runs the batch command on the inputs. Returns its exit status, and the
+        names of the inputs which it converted, or tried to.
+        """
+        if os.path.exists('run.jsonl'):
+            os.remove('run.jsonl')
+        try:
+            batch.main(['--silent', '--no-log-file', '--no-validate',
+                        '--no-epubcheck', '--images',
+                        os.path.join('images', '*'), '--output', 'out',
+                        '--run-log', 'run.jsonl',
+                        '--journal', 'batch.journal'] +
+                       list(options) + ['inputs'])
+        except SystemExit as err:
+            exit_status = err.code
+        else:
+            exit_status = 0
+        converted = []
+        if os.path.exists('run.jsonl'):
+            with open('run.jsonl') as run_log:
+                for line in run_log:
+                    record = json.loads(line)
+                    if record['stage'] == 'article':
+                        name = os.path.basename(record['input'])
+                        converted.append(os.path.splitext(name)[0])
+        return exit_status, sorted(converted)
+
+    def entries(self):
+        with BatchJournal('batch.journal', resume=True) as journal:
+            return dict((os.path.splitext(os.path.basename(path))[0],
+                         entry['status'])
+                        for path, entry in journal.entries.items())
+
+    def modify(self, name, data):
+        with open(self.inputs[name], 'wb') as xml_file:
+            xml_file.write(data)
+
+    def test_resume_skips_done_and_redoes_the_rest(self):
+        self.modify('a2', b'<article>')
+        self.assertEqual(self.batch(), (1, ['a1', 'a2', 'a3']))
+        self.assertEqual(self.entries(),
+                         {'a1': 'done', 'a2': 'failed', 'a3': 'done'})
+
+        #Nothing changed, so only the failed input is tried again
+        self.assertEqual(self.batch('--resume'), (1, ['a2']))
+
+        #Fixed, and a completed input modified since it was converted
+        shutil.copy(support.ARTICLE, self.inputs['a2'])
+        self.modify('a3', support.article_bytes() + b'\n')
+        self.assertEqual(self.batch('--resume'), (0, ['a2', 'a3']))
+        self.assertEqual(self.entries(),
+                         {'a1': 'done', 'a2': 'done', 'a3': 'done'})
+        self.assertEqual(self.batch('--resume'), (0, []))
+        self.assertEqual(sorted(os.listdir('out')),
+                         ['a1.epub', 'a2.epub', 'a3.epub'])
+
+        #Without --resume, the journal is started afresh
+        shutil.rmtree('out')
+        self.assertEqual(self.batch(), (0, ['a1', 'a2', 'a3']))
+
+    def test_resume_in_workers(self):
+        self.assertEqual(self.batch('--jobs', '2'), (0, ['a1', 'a2', 'a3']))
+        self.modify('a1', support.article_bytes() + b'\n')
+        self.assertEqual(self.batch('--jobs', '2', '--resume'), (0, ['a1']))
+
+    def test_interrupted_input_is_redone(self):
+        self.assertEqual(self.batch(), (0, ['a1', 'a2', 'a3']))
+        #As left by a crash part way through converting a2
+        stale = os.path.join(self.work, 'out', 'a2')
+        os.makedirs(os.path.join(stale, 'EPUB'))
+        with BatchJournal('batch.journal', resume=True) as journal:
+            journal.started(self.inputs['a2'], stale)
+        with open('batch.journal', 'a') as journal:
+            journal.write('{"input": "torn')
+        self.assertEqual(self.batch('--resume'), (0, ['a2']))
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(self.entries()['a2'], 'done')
+        #Only the torn line is lost
+        with open('batch.journal') as journal:
+            lines = journal.read().splitlines()
+        self.assertEqual(lines[-3], '{"input": "torn')
+        self.assertEqual(json.loads(lines[-2])['status'], 'started')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the routing of log records to per-article log files
+"""
+
+#Standard Library modules
+import logging
+import os
+import tempfile
+import threading
+import unittest
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+import openaccess_epub.utils.logs as oae_logging
+
+LOGNAME = 'openaccess_epub_tests'
+
+
+class Collect(logging.Handler):
+    """
+    Keeps the messages of the records it handles.
+    """
+
+    def __init__(self):
+        super(Collect, self).__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class QueuedLoggingTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.log = logging.getLogger(LOGNAME)
+        self.log.setLevel(logging.DEBUG)
+        self.log.propagate = False
+        self.shared = Collect()
+        self.log.addHandler(self.shared)
+        self.addCleanup(self.log.removeHandler, self.shared)
+        self.queued = oae_logging.QueuedLogging('INFO', logname=LOGNAME)
+
+    def log_path(self, key):
+        return os.path.join(self.temp_dir, key + '.log')
+
+    def read(self, key):
+        with open(self.log_path(key)) as log_file:
+            return log_file.read()
+
+    def convert(self, key, barrier):
+        """
+        Logs for the article `key` as a conversion would, in step with the
+        other threads.
+        """
+        with oae_logging.article_context(key):
+            self.log.info('Before the log file of {0}'.format(key))
+            oae_logging.open_article_log(key, self.log_path(key),
+                                         logname=LOGNAME)
+            barrier.wait()
+            for number in range(20):
+                self.log.info('{0} step {1}'.format(key, number))
+            self.log.debug('Debugging {0}'.format(key))
+            barrier.wait()
+            oae_logging.close_article_log(key, logname=LOGNAME)
+        self.log.info('After {0}'.format(key))
+
+    def test_records_reach_their_article_log(self):
+        keys = ['a1', 'a2', 'a3']
+        barrier = threading.Barrier(len(keys))
+        handlers = list(self.log.handlers)
+        with self.queued:
+            #The console and --log-to handlers are moved behind the queue
+            self.assertEqual(self.log.handlers, [self.queued.handler])
+            threads = [threading.Thread(target=self.convert,
+                                        args=(key, barrier))
+                       for key in keys]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.log.handlers, handlers)
+
+        for key in keys:
+            lines = self.read(key).splitlines()
+            self.assertEqual(len(lines), 21)
+            self.assertTrue(lines[0].endswith('Before the log file of ' + key))
+            for number, line in enumerate(lines[1:]):
+                self.assertTrue(line.endswith('{0} step {1}'.format(key,
+                                                                   number)))
+        #Every record reaches the shared handlers, at their own level
+        self.assertEqual(len(self.shared.messages), 3 * 23)
+        self.assertIn('Debugging a2', self.shared.messages)
+
+    def test_unopened_log_is_dropped_on_close(self):
+        with self.queued:
+            with oae_logging.article_context('a1'):
+                self.log.warning('Held')
+                oae_logging.close_article_log('a1', logname=LOGNAME)
+            with oae_logging.article_context('a1'):
+                oae_logging.open_article_log('a1', self.log_path('a1'),
+                                             logname=LOGNAME)
+                self.log.warning('Written')
+        self.assertEqual(self.read('a1').count('Held'), 0)
+        self.assertEqual(self.read('a1').count('Written'), 1)
+
+    def test_not_queued(self):
+        self.assertFalse(oae_logging.open_article_log('a1', self.log_path('a1'),
+                                                      logname=LOGNAME))
+        self.assertFalse(os.path.exists(self.log_path('a1')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the memoized publisher metadata shared by the Navigation, the Package,
+and the rendering of the content
+"""
+
+#Standard Library modules
+from collections import Counter
+import unittest
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+from openaccess_epub.article import Article
+from openaccess_epub.navigation import Navigation
+from openaccess_epub.package import Package
+import openaccess_epub.publisher
+
+
+class MemoizedTest(unittest.TestCase):
+
+    def setUp(self):
+        #The publisher only holds a weak reference to its article
+        self.article = Article(support.ARTICLE, validation=False)
+        self.publisher = self.article.publisher
+
+    def test_extracted_once(self):
+        totals = Counter(openaccess_epub.publisher.metadata_stats)
+        authors = self.publisher.contributors('author')
+        self.assertEqual([name for _contrib, name, _file_as in authors],
+                         ['Smith Jane', 'Doe John'])
+        self.assertIs(self.publisher.contributors('author'), authors)
+        #Each set of arguments is cached on its own
+        editors = self.publisher.contributors('editor')
+        self.assertEqual([name for _contrib, name, _file_as in editors],
+                         ['Editor Ed'])
+        self.assertEqual(self.publisher.metadata_stats,
+                         Counter(extractions=2, hits=1))
+        self.assertEqual(openaccess_epub.publisher.metadata_stats - totals,
+                         Counter(extractions=2, hits=1))
+
+    def test_cache_is_per_article(self):
+        title = self.publisher.nav_title()
+        other = Article(support.ARTICLE, validation=False)
+        self.assertEqual(other.publisher.nav_title(), title)
+        self.assertEqual(other.publisher.metadata_stats['hits'], 0)
+
+    def test_shared_by_navigation_and_package(self):
+        navigation = Navigation()
+        navigation.process(self.article)
+        package = Package()
+        package.process(self.article)
+        hits = self.publisher.metadata_stats['hits']
+        #The title, and the contributors, are extracted once between them
+        self.assertGreater(hits, 0)
+        self.assertEqual(self.publisher.package_title(),
+                         'A Test Article About Things')
+        self.assertEqual(self.publisher.metadata_stats['hits'], hits + 1)
+        self.assertEqual(self.publisher.metadata_stats['extractions'],
+                         len(self.publisher._metadata_cache))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the metadata command, which writes JSON lines of article metadata
+from the front matter alone
+"""
+
+#Standard Library modules
+import json
+import logging
+import os
+import shutil
+import unittest
+from unittest import mock
+
+import support
+
+#OpenAccess_EPUB modules
+import openaccess_epub.article
+from openaccess_epub.commands import metadata
+
+
+class MetadataCommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.isolated = support.isolated_config()
+        self.work = self.isolated.__enter__()
+        self.addCleanup(self.isolated.__exit__, None, None, None)
+        #The command sets up console logging of its own
+        log = logging.getLogger('openaccess_epub')
+        self.addCleanup(setattr, log, 'handlers', list(log.handlers))
+        self.addCleanup(log.setLevel, log.level)
+        os.makedirs(os.path.join('articles', 'more'))
+        shutil.copy(support.ARTICLE, os.path.join('articles', 'a1.xml'))
+        shutil.copy(support.ARTICLE, os.path.join('articles', 'more', 'a2.xml'))
+        with open(os.path.join('articles', 'bad.xml'), 'wb') as bad:
+            bad.write(b'<article><front>')
+        #An article of a publisher without support
+        with open(os.path.join('articles', 'other.xml'), 'wb') as other:
+            other.write(support.article_bytes().replace(
+                support.ARTICLE_DOI.encode('utf-8'), b'10.9999/other.1'))
+
+    def records(self, *argv):
+        #No DTD is loaded
+        with mock.patch.object(openaccess_epub.article, 'load_dtd',
+                               side_effect=AssertionError('DTD loaded')):
+            metadata.main(['--silent', '--output', 'metadata.jsonl'] +
+                          list(argv))
+        with open('metadata.jsonl', encoding='utf-8') as lines:
+            return dict((os.path.basename(record['input']), record)
+                        for record in map(json.loads, lines))
+
+    def test_directory(self):
+        with self.assertLogs('openaccess_epub', 'WARNING') as logs:
+            records = self.records('articles')
+        self.assertEqual(sorted(records), ['a1.xml', 'other.xml'])
+        record = records['a1.xml']
+        self.assertEqual(record['doi'], support.ARTICLE_DOI)
+        self.assertEqual(record['title'], 'A Test Article About Things')
+        self.assertEqual([(contributor['name'], contributor['role'])
+                          for contributor in record['contributors']],
+                         [('Smith Jane', 'aut'), ('Doe John', 'aut'),
+                          ('Editor Ed', 'edt')])
+        self.assertIn({'year': '2006', 'month': '12', 'day': '20',
+                       'season': '', 'event': 'copyrighted'},
+                      record['dates'])
+        self.assertEqual(record['rights'], 'This is an open-access article.')
+        #Only the DOI is known without publisher support
+        self.assertEqual(records['other.xml']['doi'], '10.9999/other.1')
+        self.assertIsNone(records['other.xml']['title'])
+        messages = '\n'.join(logs.output)
+        self.assertIn('Skipping articles' + os.sep + 'bad.xml', messages)
+        self.assertIn('No publisher support', messages)
+
+    def test_recursive_and_files(self):
+        with self.assertLogs('openaccess_epub', 'WARNING'):
+            records = self.records('--recursive', 'articles')
+        self.assertEqual(sorted(records), ['a1.xml', 'a2.xml', 'other.xml'])
+        #Further runs append
+        self.records(os.path.join('articles', 'more', 'a2.xml'))
+        with open('metadata.jsonl') as lines:
+            self.assertEqual(len(lines.readlines()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
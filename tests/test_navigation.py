@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the navigation structures and the NCX and EPUB3 navigation documents
+"""
+
+#Standard Library modules
+import os
+import re
+import tempfile
+import unittest
+
+import support
+
+#Non-Standard Library modules
+from lxml import etree
+
+#OpenAccess_EPUB modules
+from openaccess_epub.article import Article
+from openaccess_epub.navigation import Navigation
+
+NCX_NS = '{http://www.daisy.org/z3986/2005/ncx/}'
+
+#Deeper than Python's default recursion limit
+DEEP = 1500
+
+
+def sec(title, *children, **attrib):
+    """
+    Returns a <sec> element with a <title> and `children`.
+    """
+    element = etree.Element('sec', attrib)
+    etree.SubElement(element, 'title').text = title
+    element.extend(children)
+    return element
+
+
+def walk(nav):
+    """
+    Returns the navpoints of a navigation structure in document order.
+    """
+    navpoints = []
+    stack = [iter(nav)]
+    while stack:
+        for nav_pt in stack[-1]:
+            navpoints.append(nav_pt)
+            stack.append(iter(nav_pt.children))
+            break
+        else:
+            stack.pop()
+    return navpoints
+
+
+class NavigationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.article = Article(support.ARTICLE, validation=False)
+        self.body = self.article.body
+        self.body[:] = []
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.location = temp_dir.name
+        os.makedirs(os.path.join(self.location, 'EPUB'))
+
+    def test_play_order_is_document_order(self):
+        fig = etree.Element('fig', id='f1')
+        etree.SubElement(fig, 'title').text = 'A figure'
+        self.body.extend([sec('A', sec('A1', sec('A1a', id='a1a'), id='a1'),
+                              fig, id='a'),
+                          sec('', sec('Hidden', id='hidden'), id='untitled'),
+                          sec('B')])
+        navigation = Navigation()
+        navigation.process(self.article)
+        navpoints = walk(navigation.nav)
+        self.assertEqual([nav_pt.label for nav_pt in navpoints],
+                         [navigation.title, 'A', 'A1', 'A1a', 'B'])
+        self.assertEqual([nav_pt.playOrder for nav_pt in navpoints],
+                         ['1', '2', '3', '4', '5'])
+        self.assertEqual(navigation.nav_depth, 3)
+        #A section without an id is given one
+        self.assertEqual(navpoints[4].id, 'OAE-1')
+        self.assertEqual([nav_pt.id for nav_pt in navigation.figures_list],
+                         ['f1'])
+
+    def test_deep_nesting(self):
+        innermost = deepest = sec('Level {0}'.format(DEEP))
+        for level in range(DEEP - 1, 0, -1):
+            deepest = sec('Level {0}'.format(level), deepest)
+        self.body.append(deepest)
+        navigation = Navigation()
+        navigation.process(self.article)
+        navpoints = walk(navigation.nav)
+        self.assertEqual(len(navpoints), DEEP + 1)
+        self.assertEqual([int(nav_pt.playOrder) for nav_pt in navpoints],
+                         list(range(1, DEEP + 2)))
+        self.assertEqual(navigation.nav_depth, DEEP)
+        self.assertEqual(innermost.get('id'), 'OAE-{0}'.format(DEEP))
+
+        parser = etree.XMLParser(huge_tree=True)
+        navigation.render_EPUB2(self.location)
+        ncx = etree.parse(os.path.join(self.location, 'EPUB', 'toc.ncx'),
+                          parser)
+        play_orders = [int(nav_pt.get('playOrder'))
+                       for nav_pt in ncx.iter(NCX_NS + 'navPoint')]
+        self.assertEqual(play_orders, list(range(1, DEEP + 2)))
+
+        #Nested two elements to a level, this is too deep for libxml2 to parse
+        navigation.render_EPUB3(self.location)
+        with open(os.path.join(self.location, 'EPUB', 'nav.xhtml')) as nav:
+            labels = re.findall(r'<a href="[^"]*">([^<]*)</a>', nav.read())
+        self.assertEqual(labels, [nav_pt.label for nav_pt in navpoints])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of preloading what conversion needs before worker processes are forked
+"""
+
+#Standard Library modules
+import multiprocessing
+import unittest
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+import openaccess_epub
+import openaccess_epub.article as article
+import openaccess_epub.publisher as publisher
+
+PUBLIC_ID = '-//NLM//DTD Journal Publishing DTD v3.0 20080202//EN'
+
+
+def preloaded():
+    """
+    Returns whether the DTD and the PLoS publisher are loaded, without loading
+    them.
+    """
+    return (PUBLIC_ID in getattr(article._parsed_dtds, 'cache', {}),
+            '10.1371' in publisher.publishers._modules)
+
+
+class PreloadTest(unittest.TestCase):
+
+    def test_preload(self):
+        duration = openaccess_epub.preload(dtds=[PUBLIC_ID],
+                                           publishers=['10.1371'])
+        self.assertGreaterEqual(duration, 0)
+        self.assertEqual(preloaded(), (True, True))
+        dtd = article.load_dtd(PUBLIC_ID)
+        module = publisher.publishers.module('10.1371')
+        #Nothing is loaded again
+        openaccess_epub.preload(dtds=[PUBLIC_ID], publishers=['10.1371'])
+        self.assertIs(article.load_dtd(PUBLIC_ID), dtd)
+        self.assertIs(publisher.publishers.module('10.1371'), module)
+
+    def test_unknown_publisher(self):
+        with self.assertLogs('openaccess_epub', 'WARNING'):
+            openaccess_epub.preload(dtds=False, publishers=['10.0000'])
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(),
+                         'Workers are only forked where fork is available')
+    def test_inherited_by_forked_workers(self):
+        openaccess_epub.preload(dtds=[PUBLIC_ID], publishers=['10.1371'])
+        context = multiprocessing.get_context('fork')
+        with context.Pool(1) as pool:
+            self.assertEqual(pool.apply(preloaded), (True, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of finding and loading the publisher module for a DOI prefix, from the
+installed publishers and the publisher_plugins directory
+"""
+
+#Standard Library modules
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+import openaccess_epub.publisher.plos
+from openaccess_epub.publisher import PublisherRegistry
+
+PLUGIN = '''
+name = {0!r}
+'''
+
+
+class PublisherRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.plugin_dir = temp_dir.name
+        #Plugins are loaded into sys.modules under the installed names
+        patcher = mock.patch.dict(sys.modules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, name, data):
+        path = os.path.join(self.plugin_dir, name)
+        with open(path, 'w') as written:
+            written.write(data)
+        return path
+
+    def registry(self):
+        return PublisherRegistry(builtin={'10.1371': 'plos'},
+                                 plugin_dir=self.plugin_dir)
+
+    def test_builtin(self):
+        registry = self.registry()
+        self.assertIs(registry.module('10.1371'), openaccess_epub.publisher.plos)
+        self.assertEqual(registry.index(), {'10.1371': ('plos', None)})
+
+    def test_plugin_overrides_builtin(self):
+        path = self.write('plos.py', PLUGIN.format('plugin plos'))
+        registry = self.registry()
+        with self.assertLogs('openaccess_epub.publisher', 'INFO'):
+            module = registry.module('10.1371')
+        self.assertEqual(module.name, 'plugin plos')
+        self.assertEqual(module.__file__, path)
+        self.assertEqual(module.__name__, 'openaccess_epub.publisher.plos')
+        #Loaded once, and not read again until the registry is reset
+        os.remove(path)
+        self.assertIs(registry.module('10.1371'), module)
+        registry.reset()
+        self.assertIs(registry.module('10.1371'), openaccess_epub.publisher.plos)
+
+    def test_doi_map(self):
+        self.write('doi_map', '10.9999: example\n\nmalformed line\n'
+                              '10.1371:plos\n')
+        self.write('example.py', PLUGIN.format('example'))
+        registry = self.registry()
+        with self.assertLogs('openaccess_epub.publisher', 'WARNING'):
+            index = registry.index()
+        self.assertEqual(index['10.9999'],
+                         ('example', os.path.join(self.plugin_dir,
+                                                  'example.py')))
+        self.assertEqual(registry.module('10.9999').name, 'example')
+        self.assertIs(registry.module('10.1371'), openaccess_epub.publisher.plos)
+
+    def test_unmapped_prefix(self):
+        with self.assertRaises(ImportError):
+            self.registry().module('10.0000')
+
+    def test_broken_plugin(self):
+        self.write('plos.py', 'raise RuntimeError("Broken plugin")\n')
+        registry = self.registry()
+        with self.assertRaises(RuntimeError):
+            registry.module('10.1371')
+        #Nothing half-loaded is left behind
+        self.assertIs(sys.modules['openaccess_epub.publisher.plos'],
+                      openaccess_epub.publisher.plos)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that only the images referenced by the rendered content are placed in
+the EPUB
+"""
+
+#Standard Library modules
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.article import Article
+from openaccess_epub.commands import convert
+from openaccess_epub.utils.images import prune_unreferenced, referenced_only
+
+REFERENCED = {'g001.png', 't001.png', 'e001.png'}
+
+
+class ReferencedImagesTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+
+    def test_recorded_while_rendering(self):
+        article = Article(support.ARTICLE, validation=False)
+        os.makedirs(os.path.join(self.temp_dir, 'EPUB'))
+        self.assertEqual(article.publisher.referenced_images, set())
+        article.publisher.render_content(self.temp_dir, 3)
+        self.assertEqual(article.publisher.referenced_images, REFERENCED)
+
+    def test_referenced_only(self):
+        names = ['g001.png', 'g001.tif', 'g001-large.png', 'thumbs', 'e001.png']
+        os.makedirs(os.path.join(self.temp_dir, 'thumbs'))
+        ignore = referenced_only(REFERENCED)
+        self.assertEqual(ignore(self.temp_dir, names),
+                         ['g001.tif', 'g001-large.png', 'thumbs'])
+        #Images to be converted to a referenced name are kept
+        ignore = referenced_only(REFERENCED, converted=True)
+        self.assertEqual(ignore(self.temp_dir, names),
+                         ['g001-large.png', 'thumbs'])
+
+    def test_prune_unreferenced(self):
+        for name in ('g001.png', 'g001-large.png', 'supplement.pdf'):
+            support.write_png(os.path.join(self.temp_dir, name))
+        os.makedirs(os.path.join(self.temp_dir, 't001.png'))
+        self.assertEqual(prune_unreferenced(self.temp_dir, REFERENCED),
+                         ['e001.png', 't001.png'])
+        self.assertEqual(os.listdir(self.temp_dir), ['g001.png'])
+
+
+class ConvertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.isolated = support.isolated_config(use_image_fetching=False)
+        self.work = self.isolated.__enter__()
+        self.addCleanup(self.isolated.__exit__, None, None, None)
+        shutil.copy(support.ARTICLE, 'journal.pone.0000001.xml')
+        os.makedirs(os.path.join('images', 'thumbnails'))
+        for name in ('g001.png', 't001.png', 'e001.png', 'g001-large.png',
+                     'supplement.pdf', os.path.join('thumbnails', 'g001.png')):
+            support.write_png(os.path.join('images', name))
+
+    def convert(self):
+        """
+        Converts the article, returning the images in the EPUB and its Package
+        Document.
+        """
+        convert.main(['--silent', '--no-log-file', '--no-validate',
+                      '--no-epubcheck', '--images', 'images', '--output',
+                      'out', 'journal.pone.0000001.xml'])
+        with zipfile.ZipFile(os.path.join('out',
+                                          'journal.pone.0000001.epub')) as epub:
+            prefix = 'EPUB/images-journal.pone.0000001/'
+            images = sorted(name[len(prefix):] for name in epub.namelist()
+                            if name.startswith(prefix))
+            return images, epub.read('EPUB/package.opf').decode('utf-8')
+
+    def test_epub_holds_referenced_images(self):
+        images, package = self.convert()
+        self.assertEqual(images, sorted(REFERENCED))
+        for excluded in ('g001-large', 'supplement', 'thumbnails'):
+            self.assertNotIn(excluded, package)
+
+    def test_missing_referenced_image(self):
+        os.remove(os.path.join('images', 'e001.png'))
+        images, package = self.convert()
+        self.assertEqual(images, ['g001.png', 't001.png'])
+        self.assertNotIn('e001', package)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the registry of the files of an EPUB, from which the manifest and
+spine of the Package Document are made
+"""
+
+#Standard Library modules
+import threading
+import unittest
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+from openaccess_epub.package import Package
+from openaccess_epub.utils.registry import BuildRegistry, \
+    FALLBACK_MEDIA_TYPE, media_type
+
+
+class BuildRegistryTest(unittest.TestCase):
+
+    def test_media_types(self):
+        self.assertEqual(media_type('images/g001.png'), 'image/png')
+        self.assertEqual(media_type('images/G001.JPG'), 'image/jpeg')
+        self.assertEqual(media_type('main.x.xhtml'), 'application/xhtml+xml')
+        self.assertEqual(media_type('toc.ncx'), 'application/x-dtbncx+xml')
+        self.assertEqual(media_type('css/default.css'), 'text/css')
+
+    def test_unknown_media_type_falls_back(self):
+        with self.assertLogs('openaccess_epub.utils.registry', 'WARNING'):
+            self.assertEqual(media_type('images/g001.webp'),
+                             FALLBACK_MEDIA_TYPE)
+        self.assertEqual(FALLBACK_MEDIA_TYPE, 'application/octet-stream')
+
+    def test_manifest_and_spine(self):
+        registry = BuildRegistry()
+        registry.register('main.x.xhtml', linear=True)
+        registry.register('images\\g001.png')
+        registry.register('tables.x.xhtml', linear=False)
+        registry.register('nav.xhtml', item_id='htmltoc', properties='nav')
+        with self.assertLogs('openaccess_epub.utils.registry', 'WARNING'):
+            registry.register('supplement.dat')
+        #Registered again, the first registration stands
+        registry.register('main.x.xhtml', item_id='other', linear=True)
+
+        package = Package(registry=registry)
+        items = [dict(item.attrib) for item in package.manifest_items()]
+        self.assertEqual(items, [
+            {'href': 'main.x.xhtml', 'id': 'main-x-xhtml',
+             'media-type': 'application/xhtml+xml'},
+            {'href': 'images/g001.png', 'id': 'g001-png',
+             'media-type': 'image/png'},
+            {'href': 'tables.x.xhtml', 'id': 'tables-x-xhtml',
+             'media-type': 'application/xhtml+xml'},
+            {'href': 'nav.xhtml', 'id': 'htmltoc',
+             'media-type': 'application/xhtml+xml', 'properties': 'nav'},
+            {'href': 'supplement.dat', 'id': 'supplement-dat',
+             'media-type': 'application/octet-stream'}])
+        self.assertEqual([(item.idref, item.linear) for item in registry.spine],
+                         [('main-x-xhtml', True), ('tables-x-xhtml', False)])
+
+    def test_ids_are_unique(self):
+        registry = BuildRegistry()
+        registry.register('images/g001.png')
+        with self.assertLogs('openaccess_epub.utils.registry', 'WARNING'):
+            item = registry.register('other/g001.png')
+        self.assertEqual(item.id, 'g001-png-2')
+
+    def test_concurrent_registration(self):
+        registry = BuildRegistry()
+
+        def register(start):
+            for number in range(start, start + 200):
+                registry.register('images/{0}.png'.format(number))
+
+        threads = [threading.Thread(target=register, args=(start,))
+                   for start in range(0, 800, 200)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(registry), 800)
+        self.assertEqual(len(set(item.id for item in registry)), 800)
+
+    def test_sources_and_moves(self):
+        registry = BuildRegistry()
+        registry.register('images/g001.png', source='/figures/g001.png')
+        self.assertEqual(registry.external_files(),
+                         {'EPUB/images/g001.png': '/figures/g001.png'})
+        registry.move_target('main.x.xhtml#s2', 'main-2.x.xhtml#s2')
+        self.assertEqual(registry.locate('main.x.xhtml#s2'),
+                         'main-2.x.xhtml#s2')
+        self.assertEqual(registry.locate('main.x.xhtml#s1'),
+                         'main.x.xhtml#s1')
+
+
+if __name__ == '__main__':
+    unittest.main()
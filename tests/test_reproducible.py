@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that SOURCE_DATE_EPOCH makes the same input convert to a byte-identical
+EPUB
+"""
+
+#Standard Library modules
+import os
+import shutil
+import time
+import unittest
+from unittest import mock
+import zipfile
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.commands import convert
+
+IMAGES = ('g001.png', 't001.png', 'e001.png')
+
+EPOCH = '1700000000'  # 2023-11-14 22:13:20 UTC
+
+
+class ReproducibleBuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.isolated = support.isolated_config(use_image_fetching=False)
+        self.work = self.isolated.__enter__()
+        self.addCleanup(self.isolated.__exit__, None, None, None)
+        shutil.copy(support.ARTICLE, 'journal.pone.0000001.xml')
+        os.makedirs('images')
+        for name in IMAGES:
+            support.write_png(os.path.join('images', name))
+
+    def convert(self, version, output):
+        """
+        Converts the article, returning the bytes of the EPUB.
+        """
+        convert.main(['--silent', '--no-log-file', '--no-validate',
+                      '--no-epubcheck', '--epub' + version, '--images',
+                      'images', '--output', output,
+                      'journal.pone.0000001.xml'])
+        epub_path = os.path.join(output, 'journal.pone.0000001.epub')
+        with open(epub_path, 'rb') as epub:
+            return epub.read()
+
+    def test_byte_identical(self):
+        with mock.patch.dict(os.environ, {'SOURCE_DATE_EPOCH': EPOCH}):
+            for version in ('2', '3'):
+                first = self.convert(version, 'first' + version)
+                #A later run, with the images touched since
+                time.sleep(1.1)
+                for name in IMAGES:
+                    os.utime(os.path.join('images', name))
+                second = self.convert(version, 'second' + version)
+                self.assertEqual(first, second)
+                with zipfile.ZipFile(os.path.join(
+                        'first' + version, 'journal.pone.0000001.epub')) as epub:
+                    for info in epub.infolist():
+                        self.assertEqual(info.date_time,
+                                         (2023, 11, 14, 22, 13, 20))
+                    if version == '3':  # dcterms:modified
+                        self.assertIn(b'2023-11-14T22:13:20Z',
+                                      epub.read('EPUB/package.opf'))
+
+    def test_clock_without_epoch(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('SOURCE_DATE_EPOCH', None)
+            self.convert('3', 'out')
+        with zipfile.ZipFile(os.path.join('out',
+                                          'journal.pone.0000001.epub')) as epub:
+            self.assertNotIn(b'2023-11-14T22:13:20Z',
+                             epub.read('EPUB/package.opf'))
+            self.assertEqual(epub.getinfo('mimetype').date_time[0],
+                             time.localtime().tm_year)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the JSON lines run log
+"""
+
+#Standard Library modules
+from collections import Counter
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+from openaccess_epub.exceptions import InputError
+import openaccess_epub.utils.runlog as runlog
+
+KEYS = {'time', 'command', 'input', 'doi', 'stage', 'duration', 'input_bytes',
+        'output_bytes', 'warnings', 'success', 'error'}
+
+
+class RunLogTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, 'run.jsonl')
+        self.input = os.path.join(temp_dir.name, 'input.xml')
+        with open(self.input, 'wb') as input_file:
+            input_file.write(b'<article/>')
+        self.output = os.path.join(temp_dir.name, 'output.epub')
+        with open(self.output, 'wb') as output_file:
+            output_file.write(b'PK' * 50)
+        self.log = logging.getLogger('openaccess_epub.tests')
+
+    def records(self):
+        with open(self.path) as run_log:
+            return [json.loads(line) for line in run_log]
+
+    def test_successful_article(self):
+        with runlog.RunLog(self.path, 'batch') as run_log:
+            with runlog.article(run_log, self.input) as run:
+                with runlog.stage('parse'):
+                    self.log.warning('Something odd')
+                run.doi = '10.1371/journal.pone.0000001'
+                with runlog.stage('render'):
+                    self.log.info('Not counted')
+                run.output = self.output
+        parse, render, article = self.records()
+        for record in (parse, render, article):
+            self.assertEqual(set(record), KEYS)
+            self.assertEqual(record['command'], 'batch')
+            self.assertEqual(record['input'], self.input)
+            self.assertEqual(record['input_bytes'], 10)
+            self.assertTrue(record['success'])
+            self.assertIsNone(record['error'])
+        self.assertEqual([parse['stage'], render['stage'], article['stage']],
+                         ['parse', 'render', 'article'])
+        self.assertEqual([parse['warnings'], render['warnings']], [1, 1])
+        self.assertIsNone(parse['doi'])
+        self.assertEqual(article['doi'], '10.1371/journal.pone.0000001')
+        self.assertEqual(article['output_bytes'], 100)
+        self.assertGreaterEqual(article['duration'],
+                                parse['duration'] + render['duration'])
+
+    def test_raised_failure(self):
+        with runlog.RunLog(self.path, 'convert') as run_log:
+            with self.assertRaises(InputError):
+                with runlog.article(run_log, 'doi:10.1371/missing'):
+                    with runlog.stage('input'):
+                        raise InputError('Not found')
+        stage, article = self.records()
+        for record in (stage, article):
+            self.assertFalse(record['success'])
+            self.assertEqual(record['error'], 'InputError: Not found')
+        self.assertIsNone(article['input_bytes'])
+
+    def test_recorded_failure(self):
+        with runlog.RunLog(self.path, 'batch') as run_log:
+            with runlog.article(run_log, self.input) as run:
+                with runlog.stage('render'):
+                    run.fail('EPUB creation failed')
+                with runlog.stage('epubcheck'):
+                    pass
+        render, epubcheck, article = self.records()
+        self.assertEqual((render['success'], render['error']),
+                         (False, 'EPUB creation failed'))
+        self.assertEqual((epubcheck['success'], epubcheck['error']),
+                         (True, None))
+        self.assertEqual((article['success'], article['error']),
+                         (False, 'EPUB creation failed'))
+
+    def test_successful_exit(self):
+        with runlog.RunLog(self.path, 'convert') as run_log:
+            with self.assertRaises(SystemExit):
+                with runlog.article(run_log, self.input):
+                    raise SystemExit(0)
+        self.assertTrue(self.records()[0]['success'])
+
+    def test_summary(self):
+        with runlog.RunLog(self.path, 'batch') as run_log:
+            with runlog.article(run_log, self.input):
+                pass
+            run_log.summary(1.5, 0, Counter(extractions=10, hits=25))
+            run_log.summary(2, 1, Counter(extractions=4))
+        _article, summary, failed = self.records()
+        self.assertEqual(set(summary), {'time', 'command', 'stage', 'duration',
+                                        'failed', 'metadata_extractions',
+                                        'metadata_hits', 'success'})
+        self.assertEqual((summary['stage'], summary['duration']), ('run', 1.5))
+        self.assertEqual((summary['metadata_extractions'],
+                          summary['metadata_hits']), (10, 25))
+        self.assertTrue(summary['success'])
+        self.assertEqual((failed['failed'], failed['metadata_hits'],
+                          failed['success']), (1, 0, False))
+
+    def test_without_run_log(self):
+        with runlog.article(None, self.input) as run:
+            self.assertIsNone(run)
+            self.assertIsNone(runlog.current())
+            with runlog.stage('parse'):
+                pass
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_appends(self):
+        for command in ('batch', 'validate'):
+            with runlog.RunLog(self.path, command) as run_log:
+                with runlog.article(run_log, self.input):
+                    pass
+        self.assertEqual([record['command'] for record in self.records()],
+                         ['batch', 'validate'])
+        #Closing the run log stops it counting warnings
+        self.assertFalse(any(isinstance(handler, runlog.WarningCounter)
+                             for handler in
+                             logging.getLogger('openaccess_epub').handlers))
+
+
+if __name__ == '__main__':
+    unittest.main()
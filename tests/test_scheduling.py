@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the estimated costs of articles, and of the WorkQueue which hands
+them out to the workers of a parallel batch
+"""
+
+#Standard Library modules
+import os
+import tempfile
+import unittest
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+from openaccess_epub.utils.scheduling import ARTICLE_COST, FIGURE_COST, \
+    REFERENCE_COST, TABLE_COST, WorkQueue, estimate_cost
+
+
+class EstimateCostTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+
+    def write(self, name, data):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'wb') as xml_file:
+            xml_file.write(data)
+        return path
+
+    def test_counts(self):
+        data = (b'<article><fig id="f1"/><fig>x</fig><figure/>'
+                b'<table-wrap id="t1"/><table/><ref id="r1"/><ref-list/>'
+                b'</article>')
+        path = self.write('a.xml', data)
+        self.assertEqual(estimate_cost(path),
+                         ARTICLE_COST + len(data) + 2 * FIGURE_COST +
+                         TABLE_COST + REFERENCE_COST)
+
+    def test_counts_scale_past_read_bytes(self):
+        head = b'<fig>' + b' ' * 89 + b'</fig>'
+        path = self.write('a.xml', head * 10)
+        self.assertEqual(estimate_cost(path, read_bytes=200),
+                         ARTICLE_COST + 1000 + 10 * FIGURE_COST)
+
+    def test_unreadable(self):
+        self.assertEqual(estimate_cost(os.path.join(self.temp_dir, 'no.xml')),
+                         ARTICLE_COST)
+        self.assertEqual(estimate_cost(self.write('empty.xml', b'')),
+                         ARTICLE_COST)
+
+    def test_figures_outweigh_size(self):
+        figures = self.write('figures.xml',
+                             b'<fig><graphic/></fig>' * 20)
+        text = self.write('text.xml', b'<p>Text</p>' * 2000)
+        self.assertGreater(estimate_cost(figures), estimate_cost(text))
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def take_all(self, queue):
+        chunks = []
+        while len(queue):
+            chunks.append(queue.take())
+        return chunks
+
+    def test_largest_first(self):
+        queue = WorkQueue(1, chunks_per_worker=1)
+        for item, cost in [('a', 1), ('b', 5), ('c', 3), ('d', 5), ('e', 2)]:
+            queue.add(item, cost)
+        self.assertEqual(queue.remaining, 16)
+        #Of equal cost, in the order added
+        self.assertEqual(queue.take(), ['b', 'd', 'c', 'e', 'a'])
+        self.assertEqual(queue.remaining, 0)
+        self.assertEqual(queue.take(), [])
+
+    def test_chunks_shrink(self):
+        queue = WorkQueue(2, chunks_per_worker=2)
+        for number in range(10):
+            queue.add(number, 10)
+        #A quarter of the remaining cost for each chunk, at least one item
+        self.assertEqual([len(chunk) for chunk in self.take_all(queue)],
+                         [2, 2, 1, 1, 1, 1, 1, 1])
+
+    def test_costly_item_alone(self):
+        queue = WorkQueue(4)
+        queue.add('small', 1)
+        queue.add('large', 1000)
+        queue.add('small too', 1)
+        self.assertEqual(self.take_all(queue),
+                         [['large'], ['small'], ['small too']])
+
+    def test_max_size(self):
+        queue = WorkQueue(1, chunks_per_worker=1, max_size=16)
+        for number in range(40):
+            queue.add(number, 1)
+        self.assertEqual([len(chunk) for chunk in self.take_all(queue)],
+                         [16, 16, 8])
+
+    def test_added_while_taking(self):
+        queue = WorkQueue(1, chunks_per_worker=2)
+        queue.add('a', 10)
+        queue.add('b', 10)
+        self.assertEqual(queue.take(), ['a'])
+        queue.add('c', 30)
+        #Taken before the earlier, smaller item
+        self.assertEqual(queue.take(), ['c'])
+        self.assertEqual(queue.take(), ['b'])
+        self.assertEqual(len(queue), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
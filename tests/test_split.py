@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of splitting the main document of an article into parts at its top-level
+sections, and of the links to the content moved out of it
+"""
+
+#Standard Library modules
+import os
+import re
+import unittest
+
+from lxml import etree
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.article import Article
+from openaccess_epub.commands import convert
+
+IMAGES = ('g001.png', 't001.png', 'e001.png')
+
+#Links between the sections, which end up in different parts
+LINKED = support.article_bytes().replace(
+    b'<p>Methods text.</p>',
+    b'<p>Methods text, see <xref ref-type="sec" rid="s3">Results</xref>.</p>'
+    ).replace(
+    b'<p>Results.</p>',
+    b'<p>Results, as in <xref ref-type="sec" rid="s2a">Sub methods</xref> '
+    b'and <xref ref-type="sec" rid="s1">the introduction</xref>.</p>')
+
+XHTML = '{http://www.w3.org/1999/xhtml}'
+
+
+def main_name(number):
+    if number == 1:
+        return 'main.journal.pone.0000001.xhtml'
+    return 'main-{0}.journal.pone.0000001.xhtml'.format(number)
+
+
+class SplitMainTest(unittest.TestCase):
+
+    def convert(self, split_bytes):
+        """
+        Converts the article to EPUB3 with `split_bytes`, returning the EPUB
+        directory which is left in place.
+        """
+        with support.isolated_config(use_image_fetching=False,
+                                     content_split_bytes=split_bytes) as work:
+            with open('journal.pone.0000001.xml', 'wb') as xml_file:
+                xml_file.write(LINKED)
+            os.makedirs('images')
+            for name in IMAGES:
+                support.write_png(os.path.join('images', name))
+            convert.main(['--silent', '--no-log-file', '--no-validate',
+                          '--no-epubcheck', '--no-cleanup', '--epub3',
+                          '--images', 'images', '--output', 'out',
+                          'journal.pone.0000001.xml'])
+            epub = os.path.join(work, 'out', 'journal.pone.0000001', 'EPUB')
+            return self.read_epub(epub)
+
+    def read_epub(self, epub):
+        """
+        Returns the ids and links of each content document, and the hrefs of
+        the navigation document and the spine.
+        """
+        documents = {}
+        for name in os.listdir(epub):
+            if not name.endswith('.xhtml') or name == 'nav.xhtml':
+                continue
+            body = etree.parse(os.path.join(epub, name)).find(XHTML + 'body')
+            ids = [element.get('id') for element in body.iter()
+                   if element.get('id')]
+            links = dict((anchor.text, anchor.get('href'))
+                         for anchor in body.iter(XHTML + 'a'))
+            documents[name] = (ids, links)
+        with open(os.path.join(epub, 'nav.xhtml'), encoding='utf-8') as nav:
+            nav_hrefs = re.findall(r'<a href="([^"]+)"', nav.read())
+        package = etree.parse(os.path.join(epub, 'package.opf'))
+        spine = [itemref.get('idref') for itemref in
+                 package.iter('{http://www.idpf.org/2007/opf}itemref')]
+        return documents, nav_hrefs, spine
+
+    def test_split_at_sections(self):
+        documents, nav_hrefs, spine = self.convert(100)
+        self.assertEqual(sorted(documents),
+                         sorted(['biblio.journal.pone.0000001.xhtml',
+                                 'tables.journal.pone.0000001.xhtml'] +
+                                [main_name(number) for number in range(1, 5)]))
+        #The content before the first section stays in the main document
+        self.assertIn('title', documents[main_name(1)][0])
+        self.assertEqual(documents[main_name(2)][0][0], 's1')
+        self.assertEqual(documents[main_name(3)][0][:2], ['s2', 's2a'])
+        self.assertEqual(documents[main_name(4)][0][0], 's3')
+        self.assertEqual(spine, ['main-journal-pone-0000001-xhtml',
+                                 'main-2-journal-pone-0000001-xhtml',
+                                 'main-3-journal-pone-0000001-xhtml',
+                                 'main-4-journal-pone-0000001-xhtml',
+                                 'biblio-journal-pone-0000001-xhtml',
+                                 'tables-journal-pone-0000001-xhtml'])
+
+        #Links across parts, forwards and back, and within a part
+        links = documents[main_name(3)][1]
+        self.assertEqual(links['Results'], main_name(4) + '#s3')
+        links = documents[main_name(4)][1]
+        self.assertEqual(links['Sub methods'], main_name(3) + '#s2a')
+        self.assertEqual(links['the introduction'], main_name(2) + '#s1')
+        links = documents[main_name(2)][1]
+        self.assertEqual(links['Figure 1'], main_name(2) + '#pone-0000001-g001')
+        self.assertEqual(links['Table 1'], main_name(3) + '#pone-0000001-t001')
+        #Links to the other documents are left alone
+        self.assertEqual(links['[1]'], 'biblio.journal.pone.0000001.xhtml'
+                                       '#pone.0000001-Smith1')
+
+        #Every link resolves to an id in the document it names
+        for ids, links in documents.values():
+            for href in links.values():
+                name, _hash, target = href.partition('#')
+                if name in documents:
+                    self.assertIn(target, documents[name][0], href)
+        #The navigation follows the moved sections
+        self.assertIn(main_name(1) + '#title', nav_hrefs)
+        for href in (main_name(2) + '#s1', main_name(3) + '#s2',
+                     main_name(3) + '#s2a', main_name(4) + '#s3'):
+            self.assertIn(href, nav_hrefs)
+
+    def test_section_larger_than_split_is_kept_whole(self):
+        documents, nav_hrefs, spine = self.convert(10 ** 6)
+        self.assertNotIn(main_name(2), documents)
+        ids, links = documents[main_name(1)]
+        self.assertTrue({'title', 's1', 's2', 's2a', 's3'} <= set(ids))
+        self.assertEqual(links['Results'], main_name(1) + '#s3')
+        self.assertIn(main_name(1) + '#s3', nav_hrefs)
+        self.assertEqual(len(spine), 3)
+
+    def test_relocate_links(self):
+        publisher = Article(support.ARTICLE, validation=False).publisher
+        document = etree.fromstring(
+            '<html><body><a href="{0}#s2">Moved</a><a href="{0}#s1">Kept</a>'
+            '<a href="biblio.x.xhtml#s2">Elsewhere</a><a>No href</a>'
+            '</body></html>'.format(publisher.main_fragment.format('')[:-1]))
+        moved = {'s2': publisher.split_fragment(3)}
+        publisher.relocate_links([document], moved)
+        self.assertEqual([anchor.get('href') for anchor in document.iter('a')],
+                         [main_name(3) + '#s2', main_name(1) + '#s1',
+                          'biblio.x.xhtml#s2', None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the utilities shared across OpenAccess_EPUB
+"""
+
+#Standard Library modules
+import unittest
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+from openaccess_epub.utils import OrderedSet
+
+
+class OrderedSetTest(unittest.TestCase):
+
+    def test_order(self):
+        members = OrderedSet('abracadabra')
+        self.assertEqual(list(members), ['a', 'b', 'r', 'c', 'd'])
+        members.discard('a')
+        members.add('a')
+        members.add('b')
+        self.assertEqual(list(members), ['b', 'r', 'c', 'd', 'a'])
+        self.assertEqual(list(reversed(members)), ['a', 'd', 'c', 'r', 'b'])
+        self.assertEqual(members.pop(), 'a')
+        self.assertEqual(members.pop(last=False), 'b')
+        self.assertEqual(list(members), ['r', 'c', 'd'])
+
+    def test_equality(self):
+        self.assertEqual(OrderedSet('abc'), OrderedSet('abc'))
+        self.assertNotEqual(OrderedSet('abc'), OrderedSet('cba'))
+        self.assertEqual(OrderedSet('abc'), set('cba'))
+        self.assertEqual(OrderedSet('abc') | OrderedSet('cd'),
+                         OrderedSet('abcd'))
+
+    def test_empty(self):
+        members = OrderedSet()
+        self.assertFalse(members)
+        self.assertEqual(repr(members), 'OrderedSet()')
+        with self.assertRaises(KeyError):
+            members.pop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the detection of new and changed files for the watch command
+"""
+
+#Standard Library modules
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+from openaccess_epub.commands.watch import build_directory_filter
+import openaccess_epub.utils.watch as watch
+
+
+def write(path, data=b'<article/>'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as written:
+        written.write(data)
+
+
+class WatcherTests(object):
+    """
+    Tests run against each kind of watcher, by the test cases below.
+    """
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = temp_dir.name
+        self.existing = os.path.join(self.directory, 'existing.xml')
+        write(self.existing)
+
+    def watcher(self, **kwargs):
+        raise NotImplementedError
+
+    def changes(self, watcher, expected):
+        """
+        Collects changes until `expected` many are reported, or a while has
+        passed.
+        """
+        changed = []
+        deadline = time.monotonic() + 5
+        while len(changed) < expected and time.monotonic() < deadline:
+            changed.extend(watcher.changes(0.1))
+        #Anything more is reported promptly
+        changed.extend(watcher.changes(0.3))
+        return sorted(changed)
+
+    def test_new_and_changed_files(self):
+        with self.watcher() as watcher:
+            self.assertEqual(watcher.prime(), [self.existing])
+            self.assertEqual(watcher.changes(0.1), [])
+            new = os.path.join(self.directory, 'new.xml')
+            write(new)
+            write(self.existing, b'<article>Changed</article>')
+            self.assertEqual(self.changes(watcher, 2), [self.existing, new])
+            #Nothing has changed since
+            self.assertEqual(self.changes(watcher, 0), [])
+
+    def test_subdirectories(self):
+        nested = os.path.join(self.directory, 'deliveries', 'nested.xml')
+        with self.watcher() as watcher:
+            watcher.prime()
+            write(nested)
+            self.assertEqual(self.changes(watcher, 0), [])
+        os.remove(nested)
+        with self.watcher(recursive=True) as watcher:
+            watcher.prime()
+            write(nested)
+            deeper = os.path.join(self.directory, 'deliveries', 'new', 'a.xml')
+            write(deeper)
+            self.assertEqual(self.changes(watcher, 2), [nested, deeper])
+
+    def test_excluded_paths(self):
+        exclude = build_directory_filter(self.directory)
+        build = os.path.join(self.directory, 'output', 'article')
+        write(os.path.join(build, 'mimetype'), b'application/epub+zip')
+        with self.watcher(recursive=True, exclude=exclude) as watcher:
+            watcher.prime()
+            write(os.path.join(build, 'EPUB', 'main.article.xml'))
+            other = os.path.join(self.directory, 'output', 'other.xml')
+            write(other)
+            self.assertEqual(self.changes(watcher, 1), [other])
+
+
+class PollingWatcherTest(WatcherTests, unittest.TestCase):
+
+    def watcher(self, **kwargs):
+        return watch.PollingWatcher(self.directory, interval=0.05, **kwargs)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is for Linux')
+class InotifyWatcherTest(WatcherTests, unittest.TestCase):
+
+    def watcher(self, **kwargs):
+        return watch.InotifyWatcher(self.directory, **kwargs)
+
+    def test_made_by_default(self):
+        with watch.make_watcher(self.directory) as watcher:
+            self.assertIsInstance(watcher, watch.InotifyWatcher)
+        with watch.make_watcher(self.directory, polling=True) as watcher:
+            self.assertIsInstance(watcher, watch.PollingWatcher)
+
+
+class DebouncerTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, 'a1.xml')
+        self.images = os.path.join(temp_dir.name, 'images-a1')
+        write(self.path)
+        self.now = time.time()
+        patcher = mock.patch.object(watch.time, 'time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_released_once_settled(self):
+        debouncer = watch.Debouncer(2)
+        debouncer.touch(self.path)
+        self.now += 1
+        self.assertEqual(debouncer.ready(), [])
+        self.now += 1.5
+        #Held while it is being converted
+        self.assertEqual(debouncer.ready(hold={self.path}), [])
+        self.assertEqual(debouncer.ready(), [self.path])
+        self.assertEqual(len(debouncer), 0)
+
+    def test_changing_file_is_held(self):
+        debouncer = watch.Debouncer(2)
+        debouncer.touch(self.path)
+        self.now += 3
+        write(self.path, b'<article>Still arriving</article>')
+        self.assertEqual(debouncer.ready(), [])
+        self.now += 3
+        self.assertEqual(debouncer.ready(), [self.path])
+
+    def test_removed_file_is_dropped(self):
+        debouncer = watch.Debouncer(2)
+        debouncer.touch(self.path)
+        os.remove(self.path)
+        self.now += 3
+        self.assertEqual(debouncer.ready(), [])
+        self.assertEqual(len(debouncer), 0)
+
+    def test_related_paths_must_settle(self):
+        write(os.path.join(self.images, 'g001.png'), b'')
+        debouncer = watch.Debouncer(2, related=lambda path: [self.images])
+        debouncer.touch(self.path)
+        self.now += 3
+        #An image arrives after the article
+        write(os.path.join(self.images, 'g002.png'), b'')
+        os.utime(os.path.join(self.images, 'g002.png'),
+                 (self.now - 1, self.now - 1))
+        self.assertEqual(debouncer.ready(), [])
+        self.now += 2
+        self.assertEqual(debouncer.ready(), [self.path])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of writing the XML documents of an EPUB, unindented unless pretty
+printing is configured
+"""
+
+#Standard Library modules
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.commands import convert
+from openaccess_epub.utils import write_xml
+
+IMAGES = ('g001.png', 't001.png', 'e001.png')
+
+DOCUMENT = b'''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Caf\xc3\xa9</title></head><body><div><p>Text</p></div></body></html>'''
+
+
+class WriteXMLTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, 'document.xhtml')
+        self.document = etree.ElementTree(etree.fromstring(DOCUMENT))
+
+    def written(self, **kwargs):
+        write_xml(self.document, self.path, **kwargs)
+        with open(self.path, 'rb') as written:
+            return written.read()
+
+    def test_unindented(self):
+        data = self.written()
+        self.assertTrue(data.startswith(b'<!DOCTYPE html PUBLIC '
+                                        b'"-//W3C//DTD XHTML 1.1//EN"'))
+        self.assertIn(b'<body><div><p>Text</p></div></body>', data)
+        self.assertIn('Café'.encode('utf-8'), data)
+        self.assertEqual(etree.tostring(etree.fromstring(data)),
+                         etree.tostring(self.document.getroot()))
+
+    def test_pretty_print(self):
+        data = self.written(pretty_print=True)
+        self.assertIn(b'<body>\n    <div>\n      <p>Text</p>', data)
+        self.assertEqual(etree.parse(self.path).docinfo.public_id,
+                         '-//W3C//DTD XHTML 1.1//EN')
+
+
+class PrettyPrintConfigTest(unittest.TestCase):
+
+    def convert(self, **options):
+        """
+        Converts the article to EPUB3, returning the main content document and
+        the Package Document as written.
+        """
+        with support.isolated_config(use_image_fetching=False,
+                                     **options) as work:
+            shutil.copy(support.ARTICLE, 'journal.pone.0000001.xml')
+            os.makedirs('images')
+            for name in IMAGES:
+                support.write_png(os.path.join('images', name))
+            convert.main(['--silent', '--no-log-file', '--no-validate',
+                          '--no-epubcheck', '--no-cleanup', '--epub3',
+                          '--images', 'images', '--output', 'out',
+                          'journal.pone.0000001.xml'])
+            epub = os.path.join(work, 'out', 'journal.pone.0000001', 'EPUB')
+            documents = []
+            for name in ('main.journal.pone.0000001.xhtml', 'package.opf'):
+                with open(os.path.join(epub, name), 'rb') as document:
+                    documents.append(document.read())
+            return documents
+
+    def test_pretty_print_xml(self):
+        main, package = self.convert()
+        self.assertNotIn(b'\n  <', main)
+        self.assertNotIn(b'\n  <', package)
+        pretty_main, pretty_package = self.convert(pretty_print_xml=True)
+        self.assertIn(b'\n  <', pretty_main)
+        self.assertIn(b'\n  <', pretty_package)
+        self.assertGreater(len(pretty_main), len(main))
+        #Only whitespace differs
+        parser = etree.XMLParser(remove_blank_text=True)
+        for plain, pretty in ((main, pretty_main), (package, pretty_package)):
+            self.assertEqual(etree.tostring(etree.fromstring(plain, parser)),
+                             etree.tostring(etree.fromstring(pretty, parser)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the resolution of cross-references against the documents which hold
+their targets
+"""
+
+#Standard Library modules
+import os
+import tempfile
+import unittest
+
+from lxml import etree
+
+import support
+
+#OpenAccess_EPUB modules
+from openaccess_epub.article import Article
+
+XHTML = '{http://www.w3.org/1999/xhtml}'
+
+#Cross-references of a ref-type not matching their target, of an unknown
+#ref-type, and with no target at all
+XREFS = (b'<p>Results, as in <xref ref-type="bibr" rid="s2a">Sub methods</xref>'
+         b', <xref ref-type="fn" rid="pone.0000001-Smith1">Smith</xref>'
+         b', <xref ref-type="unknown" rid="s1">Introduction</xref>'
+         b', <xref ref-type="fig" rid="pone-0000001-g009">Figure 9</xref>'
+         b' and <xref rid="missing">Missing</xref>.</p>')
+
+
+class XrefIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        path = os.path.join(self.temp_dir, 'journal.pone.0000001.xml')
+        with open(path, 'wb') as xml_file:
+            xml_file.write(support.article_bytes().replace(b'<p>Results.</p>',
+                                                           XREFS))
+        #The publisher only holds a weak reference to its article
+        self.article = Article(path, validation=False)
+        self.publisher = self.article.publisher
+        os.makedirs(os.path.join(self.temp_dir, 'EPUB'))
+
+    def links(self):
+        """
+        Renders the article, returning the links in the main document by their
+        text.
+        """
+        self.publisher.render_content(self.temp_dir, 3)
+        main = etree.parse(os.path.join(self.temp_dir, 'EPUB',
+                                        'main.journal.pone.0000001.xhtml'))
+        return dict((anchor.text, anchor.get('href'))
+                    for anchor in main.iter(XHTML + 'a'))
+
+    def test_links_follow_their_targets(self):
+        with self.assertLogs('openaccess_epub.publisher', 'WARNING') as logs:
+            links = self.links()
+        main = 'main.journal.pone.0000001.xhtml#'
+        biblio = 'biblio.journal.pone.0000001.xhtml#'
+        #Where the ref-type expects them
+        self.assertEqual(links['[1]'], biblio + 'pone.0000001-Smith1')
+        self.assertEqual(links['Figure 1'], main + 'pone-0000001-g001')
+        #The table is in the main and tables documents; main is expected
+        self.assertEqual(links['Table 1'], main + 'pone-0000001-t001')
+        #Elsewhere than the ref-type expects
+        self.assertEqual(links['Sub methods'], main + 's2a')
+        self.assertEqual(links['Smith'], biblio + 'pone.0000001-Smith1')
+        self.assertEqual(links['Introduction'], main + 's1')
+        #Unresolved, linked to the expected document and reported together
+        self.assertEqual(links['Figure 9'], main + 'pone-0000001-g009')
+        self.assertEqual(links['Missing'], main + 'missing')
+        self.assertEqual(self.publisher.unresolved_xrefs,
+                         {'pone-0000001-g009', 'missing'})
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('2 cross-references', logs.output[0])
+        self.assertIn('missing, pone-0000001-g009', logs.output[0])
+
+    def test_index(self):
+        with self.assertLogs('openaccess_epub.publisher', 'WARNING'):
+            self.links()
+        index = self.publisher.id_index
+        self.assertEqual(index['s1'], [self.publisher.main_fragment])
+        self.assertEqual(index['pone.0000001-Smith1'],
+                         [self.publisher.biblio_fragment])
+        self.assertEqual(index['pone-0000001-t001'],
+                         [self.publisher.main_fragment,
+                          self.publisher.tables_fragment])
+        self.assertNotIn('missing', index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the ZIP writer which makes EPUB files
+"""
+
+#Standard Library modules
+import os
+import tempfile
+import unittest
+from unittest import mock
+import zipfile
+
+import support  # Puts the package sources on the path
+
+#OpenAccess_EPUB modules
+import openaccess_epub.utils.zipwriter as zipwriter
+from openaccess_epub.utils.zipwriter import write_epub
+
+XHTML = (b'<?xml version="1.0" encoding="UTF-8"?>\n<html><body>' +
+         b'<p>Some text of the article, repeated.</p>' * 200 +
+         b'</body></html>')
+
+
+class WriteEPUBTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.directory = os.path.join(self.temp_dir, 'article')
+        self.files = {'mimetype': b'application/epub+zip',
+                      'META-INF/container.xml': b'<container/>',
+                      'EPUB/main.x.xhtml': XHTML,
+                      'EPUB/css/default.css': b'p { margin: 0; }\n' * 50,
+                      'EPUB/images/empty.dat': b'',
+                      'EPUB/images/g001.png': None}
+        for name, data in self.files.items():
+            path = os.path.join(self.directory, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if data is None:
+                support.write_png(path)
+            else:
+                with open(path, 'wb') as written:
+                    written.write(data)
+        self.epub = os.path.join(self.temp_dir, 'article.epub')
+
+    def read_file(self, name):
+        with open(os.path.join(self.directory, *name.split('/')), 'rb') as read:
+            return read.read()
+
+    def test_round_trip(self):
+        write_epub(self.directory, self.epub, threads=3)
+        with zipfile.ZipFile(self.epub) as epub:
+            self.assertIsNone(epub.testzip())
+            infos = epub.infolist()
+            #mimetype first and stored, without extra fields, then by name
+            self.assertEqual(infos[0].filename, 'mimetype')
+            self.assertEqual(infos[0].compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(infos[0].extra, b'')
+            self.assertEqual([info.filename for info in infos[1:]],
+                             sorted(name for name in self.files
+                                    if name != 'mimetype'))
+            methods = dict((info.filename, info.compress_type)
+                           for info in infos)
+            self.assertEqual(methods['EPUB/main.x.xhtml'], zipfile.ZIP_DEFLATED)
+            self.assertEqual(methods['EPUB/css/default.css'],
+                             zipfile.ZIP_DEFLATED)
+            self.assertEqual(methods['EPUB/images/g001.png'], zipfile.ZIP_STORED)
+            self.assertEqual(methods['EPUB/images/empty.dat'], zipfile.ZIP_STORED)
+            for info in infos:
+                self.assertEqual(epub.read(info),
+                                 self.read_file(info.filename))
+        with open(self.epub, 'rb') as epub:
+            self.assertEqual(epub.read(58)[30:], b'mimetypeapplication/epub+zip')
+
+    def test_level_zero_stores_everything(self):
+        write_epub(self.directory, self.epub, level=0)
+        with zipfile.ZipFile(self.epub) as epub:
+            self.assertIsNone(epub.testzip())
+            self.assertEqual(set(info.compress_type for info in epub.infolist()),
+                             {zipfile.ZIP_STORED})
+
+    def test_fixed_timestamp(self):
+        timestamp = 1262304000  # 2010-01-01 00:00:00 UTC
+        write_epub(self.directory, self.epub, threads=1, timestamp=timestamp)
+        with open(self.epub, 'rb') as epub:
+            first = epub.read()
+        #Touched files, and more threads, make the same EPUB
+        for dirpath, _dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                os.utime(os.path.join(dirpath, filename), (0, 0))
+        write_epub(self.directory, self.epub, threads=4, timestamp=timestamp)
+        with open(self.epub, 'rb') as epub:
+            self.assertEqual(epub.read(), first)
+        with zipfile.ZipFile(self.epub) as epub:
+            for info in epub.infolist():
+                self.assertEqual(info.date_time, (2010, 1, 1, 0, 0, 0))
+                self.assertEqual(info.external_attr >> 16, 0o100644)
+
+    def test_sources_outside_the_directory(self):
+        source = os.path.join(self.temp_dir, 'g002.png')
+        support.write_png(source)
+        with self.assertLogs('openaccess_epub.utils.zipwriter', 'WARNING'):
+            write_epub(self.directory, self.epub,
+                       sources={'EPUB/images/g002.png': source,
+                                'EPUB/images/g001.png': source})
+        with zipfile.ZipFile(self.epub) as epub:
+            self.assertIsNone(epub.testzip())
+            with open(source, 'rb') as png:
+                self.assertEqual(epub.read('EPUB/images/g002.png'), png.read())
+            self.assertEqual(epub.read('EPUB/images/g001.png'),
+                             self.read_file('EPUB/images/g001.png'))
+
+    def test_failure_leaves_no_file(self):
+        os.remove(os.path.join(self.directory, 'mimetype'))
+        with self.assertRaises(OSError):
+            write_epub(self.directory, self.epub)
+        self.assertFalse(os.path.exists(self.epub))
+
+
+class StoredCopyTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.image = os.path.join(temp_dir.name, 'figure.png')
+        #Larger than the copy buffer, so that it is copied in several parts
+        self.data = os.urandom(zipwriter.COPY_BUFFER * 2 + 12345)
+        with open(self.image, 'wb') as image:
+            image.write(self.data)
+        self.zip = os.path.join(temp_dir.name, 'stored.zip')
+
+    def write(self):
+        with zipwriter.ZipWriter(self.zip) as writer:
+            writer.write_entry(zipwriter.compress_entry(self.image,
+                                                        'figure.png'))
+            writer.write_entry(zipwriter.compress_entry(self.image, 'copy.bin',
+                                                        store=True))
+        with zipfile.ZipFile(self.zip) as stored:
+            self.assertIsNone(stored.testzip())
+            for info in stored.infolist():
+                self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(stored.read(info), self.data)
+
+    def test_stored_entry_is_not_read(self):
+        entry = zipwriter.compress_entry(self.image, 'figure.png')
+        self.assertIsNone(entry.data)
+        self.assertEqual(entry.source, self.image)
+        self.assertEqual(entry.size, len(self.data))
+
+    @unittest.skipUnless(hasattr(os, 'sendfile'), 'os.sendfile() is missing')
+    def test_sendfile(self):
+        with mock.patch.object(zipwriter.os, 'sendfile',
+                               wraps=os.sendfile) as sendfile:
+            self.write()
+        self.assertTrue(sendfile.called)
+
+    def test_buffered_copy(self):
+        with mock.patch.object(zipwriter.os, 'sendfile', create=True,
+                               side_effect=OSError('Not supported')):
+            self.write()
+
+    def test_changed_file(self):
+        entry = zipwriter.compress_entry(self.image, 'figure.png')
+        with open(self.image, 'r+b') as image:
+            image.truncate(100)
+        with self.assertRaises(ValueError):
+            with zipwriter.ZipWriter(self.zip) as writer:
+                writer.write_entry(entry)
+        self.assertFalse(os.path.exists(self.zip))
+
+
+if __name__ == '__main__':
+    unittest.main()